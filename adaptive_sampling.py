@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+AdaptiveSampler: 変化率に応じて記録間隔を伸縮させる適応サンプリング。
+
+cron で SensorCopier を短い間隔 (例: 毎分) で起動し、毎回センサーは読むが、
+月次ファイルへの記録とアップロードを行うかどうかをここで判定する。
+
+- 温度・湿度が急変している (直前サンプルからの変化率が閾値超過、または
+  前回記録値からの変化幅が閾値超過) → 即座に記録し、記録間隔を半分に縮める
+- 安定している → 記録間隔が経過した時だけ記録し、間隔を倍に伸ばす
+- 記録間隔は [min_interval, heartbeat] の範囲に収める (heartbeat で必ず1行残る)
+
+状態 (前回記録値・直前サンプル・現在の記録間隔・当日の統計) は小さな JSON に保存し、
+実効的な記録間隔を後から確認できるようにする。RPi (Python 3.7 / 標準ライブラリのみ) 対応。
+"""
+import json
+import logging
+import os
+import re
+from datetime import datetime
+
+logger = logging.getLogger("SensorCopier.AdaptiveSampler")
+
+STATE_FILENAME = "adaptive_sampling_state.json"
+
+# 既定の境界 (秒)。最小間隔は cron の起動間隔より短くしても効果はない
+DEFAULT_MIN_INTERVAL_SEC = 60
+DEFAULT_HEARTBEAT_SEC = 15 * 60
+
+# 急変判定の閾値
+DEFAULT_TEMP_RATE_PER_MIN = 0.2   # ℃/分 (直前サンプル比)
+DEFAULT_HUM_RATE_PER_MIN = 1.5    # %/分 (直前サンプル比)
+DEFAULT_TEMP_STEP = 0.3           # ℃ (前回記録値比)
+DEFAULT_HUM_STEP = 2.0            # % (前回記録値比)
+
+# cron 起動時刻の揺らぎを吸収する許容幅 (秒)
+SCHEDULE_TOLERANCE_SEC = 5
+
+_READING_RE = re.compile(
+    r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}(?::\d{2})?),tmp=(-?\d+(?:\.\d+)?),hum=(-?\d+(?:\.\d+)?)$"
+)
+
+
+def parse_reading(line):
+    """DataProcessor の出力行から (datetime, 温度, 湿度) を取り出す。解釈できなければ None"""
+    m = _READING_RE.match(line.strip())
+    if not m:
+        return None
+    ts_str = m.group(1)
+    fmt = "%Y-%m-%d %H:%M:%S" if len(ts_str) == 19 else "%Y-%m-%d %H:%M"
+    return datetime.strptime(ts_str, fmt), float(m.group(2)), float(m.group(3))
+
+
+def load_state(state_path):
+    """状態ファイルを読む。無い・壊れている場合は None (初回扱い)"""
+    try:
+        with open(state_path, "r") as f:
+            state = json.load(f)
+        return state if isinstance(state, dict) else None
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"適応サンプリング状態の読み込みに失敗。初期化します: {e}")
+        return None
+
+
+def save_state(state_path, state):
+    """状態ファイルを .tmp 経由でアトミックに書き込む"""
+    temp_path = state_path + ".tmp"
+    try:
+        with open(temp_path, "w") as f:
+            json.dump(state, f, ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(temp_path, state_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _point(ts, temperature, humidity):
+    return {"timestamp": ts.strftime("%Y-%m-%d %H:%M:%S"), "temperature": temperature, "humidity": humidity}
+
+
+def _elapsed_sec(point, ts):
+    return (ts - datetime.strptime(point["timestamp"], "%Y-%m-%d %H:%M:%S")).total_seconds()
+
+
+def decide(state, ts, temperature, humidity,
+           min_interval=DEFAULT_MIN_INTERVAL_SEC, heartbeat=DEFAULT_HEARTBEAT_SEC,
+           temp_rate=DEFAULT_TEMP_RATE_PER_MIN, hum_rate=DEFAULT_HUM_RATE_PER_MIN,
+           temp_step=DEFAULT_TEMP_STEP, hum_step=DEFAULT_HUM_STEP):
+    """
+    今回のサンプルを記録すべきか判定する。
+    戻り値: (record: bool, new_state: dict, reason: str)
+    state は変更せず、新しい状態を返す (保存は呼び出し側)。
+    """
+    new_state = dict(state or {})
+    interval = int(new_state.get("interval_sec", heartbeat))
+    interval = max(min_interval, min(heartbeat, interval))
+    last_sample = new_state.get("last_sample")
+    last_recorded = new_state.get("last_recorded")
+
+    # 前回記録が無い、時刻が巻き戻った、長時間停止していた → 初期状態から再開
+    elapsed_recorded = _elapsed_sec(last_recorded, ts) if last_recorded else None
+    if elapsed_recorded is None or elapsed_recorded < 0 or elapsed_recorded > 2 * heartbeat:
+        record, interval, reason = True, heartbeat, "初回または長時間停止後"
+    else:
+        fast = False
+        if last_sample:
+            elapsed_sample_min = max(_elapsed_sec(last_sample, ts), 1) / 60
+            if (abs(temperature - last_sample["temperature"]) / elapsed_sample_min >= temp_rate or
+                    abs(humidity - last_sample["humidity"]) / elapsed_sample_min >= hum_rate):
+                fast, reason = True, "変化率が閾値超過"
+        if not fast and (abs(temperature - last_recorded["temperature"]) >= temp_step or
+                         abs(humidity - last_recorded["humidity"]) >= hum_step):
+            fast, reason = True, "前回記録からの変化幅が閾値超過"
+
+        if fast:
+            record, interval = True, max(min_interval, interval // 2)
+        elif elapsed_recorded + SCHEDULE_TOLERANCE_SEC >= interval:
+            record, interval, reason = True, min(heartbeat, interval * 2), "安定 (記録間隔経過)"
+        else:
+            record, reason = False, "安定 (記録間隔内)"
+
+    # 当日の統計 (実効サンプリング間隔の記録)
+    day = ts.strftime("%Y-%m-%d")
+    if new_state.get("day") != day:
+        new_state.update({"day": day, "samples_today": 0, "recorded_today": 0})
+    new_state["samples_today"] = new_state.get("samples_today", 0) + 1
+    if record:
+        new_state["recorded_today"] = new_state.get("recorded_today", 0) + 1
+        new_state["last_recorded"] = _point(ts, temperature, humidity)
+    new_state["last_sample"] = _point(ts, temperature, humidity)
+    new_state["interval_sec"] = interval
+    new_state["last_reason"] = reason
+    return record, new_state, reason
+
+
+def should_record(line, state_dir, **bounds):
+    """
+    SensorCopier から呼ぶ入口。状態ファイルを読み、判定し、保存する。
+    行が解釈できない場合は安全側 (記録する) に倒す。
+    """
+    reading = parse_reading(line)
+    if reading is None:
+        logger.warning(f"適応サンプリング: 行を解釈できないため記録します: {line}")
+        return True
+
+    state_path = os.path.join(state_dir, STATE_FILENAME)
+    record, new_state, reason = decide(load_state(state_path), *reading, **bounds)
+    save_state(state_path, new_state)
+    logger.info(
+        f"適応サンプリング: {'記録' if record else 'スキップ'} ({reason})、"
+        f"記録間隔={new_state['interval_sec']}s、本日 {new_state['recorded_today']}/{new_state['samples_today']} 件記録"
+    )
+    return record
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+AHT25Frames: AHT25 の生フレーム (7byte) の記録とデコード。
+
+SensorReader が読んだ 7byte フレーム (ステータス, 湿度20bit, 温度20bit, CRC) を
+変換前のまま1読み取り1レコードのバイナリで記録し、後から再計算・丸めの監査ができるようにする。
+
+レコード形式 (12byte, リトルエンディアン):
+    uint32  取得時刻 (UNIX秒)
+    uint8[7] 生フレーム (data[0]..data[6])
+    uint8   予約 (0)
+
+- decode_frame(): 1フレームの変換。SensorCopier の変換式の唯一の実装
+- decode_frames(): NumPy によるベクトル化変換。decode_frame() と完全に同じ値を返す
+
+記録・スカラー変換は RPi (Python 3.7 / 標準ライブラリのみ) で動き、
+NumPy は一括変換を使う時だけ import する。
+
+使い方:
+    python aht25_frames.py raw_frames_2025-12.bin      # 一括デコードして表示
+    python aht25_frames.py --benchmark 5000000
+"""
+import argparse
+import os
+import struct
+import time
+from datetime import datetime, timezone, timedelta
+
+RECORD_STRUCT = struct.Struct("<I7sx")
+RECORD_SIZE = RECORD_STRUCT.size
+FRAME_LENGTH = 7
+
+AHT25_STATUS_MASK = 0x18
+
+# SensorReader と同じ有効範囲
+HUMIDITY_RANGE = (0, 100)
+TEMPERATURE_RANGE = (-40, 80)
+
+# 丸め境界 (x.x5) 判定の許容幅。これより境界に近い値はスカラー変換で確定させる
+_TIE_EPSILON = 1e-6
+
+
+def raw_values(data):
+    """フレームから (湿度20bit, 温度20bit) の生値を取り出す"""
+    hum_raw = (data[1] << 12 | data[2] << 4 | (data[3] >> 4))
+    tmp_raw = ((data[3] & 0x0F) << 16 | data[4] << 8 | data[5])
+    return hum_raw, tmp_raw
+
+
+def decode_frame(data):
+    """1フレームを (温度℃, 湿度%) に変換する (小数1桁に丸め)"""
+    hum_raw, tmp_raw = raw_values(data)
+    humidity = round((hum_raw / 2**20) * 100, 1)
+    temperature = round((tmp_raw / 2**20) * 200 - 50, 1)
+    return temperature, humidity
+
+
+def _crc8_table_entry(value):
+    crc = value
+    for _ in range(8):
+        crc = ((crc << 1) ^ 0x31) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+_CRC8_TABLE = [_crc8_table_entry(i) for i in range(256)]
+
+
+def crc8(data):
+    """AHT25 の CRC-8 (多項式 0x31, 初期値 0xFF) を先頭6byteに対して計算する"""
+    crc = 0xFF
+    for byte in data[:6]:
+        crc = _CRC8_TABLE[crc ^ byte]
+    return crc
+
+
+# --- 記録 ---
+
+def append_frame(path, timestamp, data):
+    """生フレームを1レコード追記する。timestamp は datetime または UNIX秒"""
+    if hasattr(timestamp, "timestamp"):
+        timestamp = timestamp.timestamp()
+    record = RECORD_STRUCT.pack(int(timestamp), bytes(bytearray(data[:FRAME_LENGTH])))
+    with open(path, "ab") as f:
+        f.write(record)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def iter_frames(path):
+    """記録ファイルから (UNIX秒, フレームbytes) を順に返す (標準ライブラリのみ)。末尾の欠けたレコードは無視"""
+    with open(path, "rb") as f:
+        while True:
+            record = f.read(RECORD_SIZE)
+            if len(record) < RECORD_SIZE:
+                return
+            yield RECORD_STRUCT.unpack(record)
+
+
+# --- 一括デコード (NumPy) ---
+
+def _numpy():
+    import numpy as np
+    return np
+
+
+def read_frames(path):
+    """記録ファイルを NumPy 配列 (timestamp: uint32[N], frames: uint8[N, 7]) として読む"""
+    np = _numpy()
+    size = os.path.getsize(path) // RECORD_SIZE * RECORD_SIZE
+    raw = np.fromfile(path, dtype=np.uint8, count=size).reshape(-1, RECORD_SIZE)
+    timestamps = raw[:, :4].copy().view("<u4").ravel()
+    return timestamps, raw[:, 4:4 + FRAME_LENGTH]
+
+
+def _round1(np, values):
+    """
+    Python の round(x, 1) と同じ結果になる一括丸め。
+    np.round は x*10 の誤差で丸め境界付近だけ結果が変わり得るため、その要素はスカラーで確定させる。
+    """
+    scaled = values * 10
+    rounded = np.round(scaled) / 10
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < _TIE_EPSILON
+    for i in np.flatnonzero(near_tie):
+        rounded[i] = round(float(values[i]), 1)
+    return rounded
+
+
+def decode_frames(frames):
+    """
+    フレーム配列 (uint8[N, 7]) を一括変換する。decode_frame() と完全に同じ値になる。
+    戻り値: {'temperature', 'humidity', 'hum_raw', 'tmp_raw',
+             'status_ok', 'in_range', 'crc_ok'}
+    """
+    np = _numpy()
+    frames = np.asarray(frames, dtype=np.uint8).reshape(-1, FRAME_LENGTH)
+    b = frames.astype(np.uint32)
+    hum_raw = (b[:, 1] << 12) | (b[:, 2] << 4) | (b[:, 3] >> 4)
+    tmp_raw = ((b[:, 3] & 0x0F) << 16) | (b[:, 4] << 8) | b[:, 5]
+
+    humidity = _round1(np, (hum_raw / 2**20) * 100)
+    temperature = _round1(np, (tmp_raw / 2**20) * 200 - 50)
+
+    status_ok = (frames[:, 0] & AHT25_STATUS_MASK) == AHT25_STATUS_MASK
+    in_range = ((humidity >= HUMIDITY_RANGE[0]) & (humidity <= HUMIDITY_RANGE[1]) &
+                (temperature >= TEMPERATURE_RANGE[0]) & (temperature <= TEMPERATURE_RANGE[1]))
+    return {
+        "temperature": temperature,
+        "humidity": humidity,
+        "hum_raw": hum_raw,
+        "tmp_raw": tmp_raw,
+        "status_ok": status_ok,
+        "in_range": in_range,
+        "crc_ok": _crc8_batch(np, frames) == frames[:, 6],
+    }
+
+
+def _crc8_batch(np, frames):
+    """crc8() のベクトル化版 (同じテーブルを列ごとに引く)"""
+    table = np.array(_CRC8_TABLE, dtype=np.uint8)
+    crc = np.full(len(frames), 0xFF, dtype=np.uint8)
+    for col in range(6):
+        crc = table[crc ^ frames[:, col]]
+    return crc
+
+
+# --- ベンチマーク ---
+
+def run_benchmark(count):
+    np = _numpy()
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 256, size=(count, FRAME_LENGTH), dtype=np.uint8)
+    frames[:, 0] = 0x1C
+
+    t0 = time.perf_counter()
+    result = decode_frames(frames)
+    vector_sec = time.perf_counter() - t0
+
+    sample = min(count, 200000)
+    t0 = time.perf_counter()
+    scalar = [decode_frame(frame) for frame in frames[:sample].tolist()]
+    scalar_sec = (time.perf_counter() - t0) * count / sample
+
+    mismatches = sum(1 for i, (t, h) in enumerate(scalar)
+                     if t != result["temperature"][i] or h != result["humidity"][i])
+    print(f"一括デコード: {count:,}フレーム {vector_sec:.3f}秒 ({count / vector_sec / 1e6:.1f}M frames/s)")
+    print(f"スカラー (推定): {scalar_sec:.3f}秒 → {scalar_sec / vector_sec:.0f}倍高速")
+    print(f"先頭{sample:,}件の不一致: {mismatches}件")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AHT25 生フレームの一括デコード')
+    parser.add_argument('path', nargs='?', help='raw_frames_YYYY-MM.bin')
+    parser.add_argument('--benchmark', type=int, metavar='FRAMES', help='合成フレームで一括デコードを測定')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        run_benchmark(args.benchmark)
+        return
+    if not args.path:
+        parser.error('ファイルを指定してください')
+
+    jst = timezone(timedelta(hours=9), 'JST')
+    timestamps, frames = read_frames(args.path)
+    result = decode_frames(frames)
+    for i, ts in enumerate(timestamps):
+        flags = "" if result["status_ok"][i] and result["in_range"][i] else " (invalid)"
+        print(f"{datetime.fromtimestamp(int(ts), jst):%Y-%m-%d %H:%M:%S},"
+              f"tmp={result['temperature'][i]},hum={result['humidity'][i]}{flags}")
+
+
+if __name__ == "__main__":
+    main()
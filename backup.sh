@@ -1,22 +1,28 @@
 #!/bin/bash
-# backup.sh: 手動バックアップ用スクリプト (Grok提案)
-# 再起動前やメンテナンス前に実行してください
+# backup.sh: 再起動前・メンテナンス前のバックアップ
+# 手動実行のほか、シャットダウン時のフックとしても呼べる（例: systemd unit の ExecStop）
+#   ExecStop=/bin/bash /home/hideo_81_g/workspace/backup.sh --no-cloud
+# 実体は snapshot_manager.py（ハードリンク世代スナップショット、通常1秒未満で完了）
 
-echo "--- 手動バックアップ開始 ---"
+SCRIPT_DIR="$(cd "$(dirname "$0")" && pwd)"
+RAM_DIR="/tmp/sensor_data"
+SNAPSHOT_DIR="/home/hideo_81_g/sensor_data_backup/snapshots"
 
-# 1. RAMディスクの内容をバックアップ用ディレクトリに退避
-BACKUP_DIR="/home/hideo_81_g/sensor_data_backup"
-mkdir -p "$BACKUP_DIR"
-if [ -d "/tmp/sensor_data" ]; then
-    rsync -av /tmp/sensor_data/ "$BACKUP_DIR/"
-    echo "ローカルバックアップ完了: $BACKUP_DIR"
+echo "--- バックアップ開始 ---"
+
+# 1. RAMディスクの内容を世代付きスナップショットとして退避
+if [ -d "$RAM_DIR" ]; then
+    python3 "$SCRIPT_DIR/snapshot_manager.py" --source "$RAM_DIR" --dest "$SNAPSHOT_DIR"
+    echo "ローカルスナップショット完了: $SNAPSHOT_DIR/latest"
 else
-    echo "警告: RAMディスク(/tmp/sensor_data)が見つかりません"
+    echo "警告: RAMディスク($RAM_DIR)が見つかりません"
 fi
 
-# 2. 永続領域をクラウド(Googleドライブ)へ同期
-# bwlimitを設定して帯域制限
-echo "クラウド同期を開始します..."
-rclone sync /home/hideo_81_g/sensor_data raspi_data:/sensor_data/ --bwlimit 200k --progress
+# 2. 永続領域をクラウド(Googleドライブ)へ送る（シャットダウン時は --no-cloud で省略可）
+# INC-001の教訓: sync ではなく copy（リモート側の過去データを消さない）
+if [ "$1" != "--no-cloud" ]; then
+    echo "クラウドへのコピーを開始します..."
+    rclone copy /home/hideo_81_g/sensor_data raspi_data:/sensor_data/ --bwlimit 200k --progress
+fi
 
-echo "--- バックアップ終了 ---"
\ No newline at end of file
+echo "--- バックアップ終了 ---"
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+BlockVerifier: サイドカー索引のブロックチェックサムによる月次ファイルの破損検知。
+
+monthly_index が追記ごとに保持している固定長ブロックのSHA-256を使い、
+- verify_tail(): 追記・停電の直後に、最後の完結ブロックと末尾の未完ブロックだけを
+  読み直して照合する (ファイルサイズに関係なく最大2ブロック分のI/O)
+- scrub(): 全ブロックを帯域制限付きで照合する (バックグラウンド実行用)
+
+SensorCopier はアップロード前・RAM復元前に verify_tail() を呼び、
+破損したファイルでクラウド上の正常なコピーを上書きしないようにする。
+
+使い方 (全体スクラブを低優先度で):
+    nice -n 19 python3 block_verify.py /home/hideo_81_g/sensor_data --scrub --rate 1M
+"""
+import argparse
+import glob
+import hashlib
+import logging
+import os
+import sys
+import time
+
+import monthly_index
+import upload_fanout
+
+logger = logging.getLogger("SensorCopier.BlockVerifier")
+
+# 全体スクラブの既定帯域 (bytes/sec)。SDカードのI/Oを占有しない程度
+DEFAULT_SCRUB_RATE = 1024 * 1024
+
+
+def _hash_range(f, start, length):
+    f.seek(start)
+    data = f.read(length)
+    if len(data) != length:
+        return None
+    return hashlib.sha256(data).hexdigest()
+
+
+def _tail_ok(f, index):
+    """末尾の未完ブロック (最後の完結ブロック以降、索引済み範囲まで) を照合する"""
+    if index.get("tail_sha256") is None:
+        return True
+    tail_start = len(index.get("block_sha256", [])) * index["block_size"]
+    return _hash_range(f, tail_start, index["byte_length"] - tail_start) == index["tail_sha256"]
+
+
+def verify_tail(monthly_path, index=None):
+    """
+    末尾側のブロックのみを照合する。
+    戻り値: (ok: bool, message: str)。索引が無い場合は照合できないため ok=True とする。
+    """
+    if index is None:
+        index = monthly_index.load_index(monthly_path, require_fresh=False)
+    if index is None:
+        return True, "索引なし (照合対象外)"
+
+    block_size = index["block_size"]
+    byte_length = index["byte_length"]
+    try:
+        file_size = os.path.getsize(monthly_path)
+    except OSError as e:
+        return False, f"ファイルを参照できません: {e}"
+    if file_size < byte_length:
+        return False, f"ファイルが索引より短い ({file_size} < {byte_length}byte): 切り詰め・上書きの可能性"
+
+    hashes = index.get("block_sha256", [])
+    with open(monthly_path, "rb") as f:
+        if hashes:
+            last_block = len(hashes) - 1
+            if _hash_range(f, last_block * block_size, block_size) != hashes[last_block]:
+                return False, f"ブロック {last_block} のチェックサム不一致"
+        if not _tail_ok(f, index):
+            return False, f"末尾ブロック ({len(hashes) * block_size}-{byte_length}byte) のチェックサム不一致"
+    return True, "末尾ブロック照合OK"
+
+
+def scrub(monthly_path, rate=DEFAULT_SCRUB_RATE, index=None, sleep=time.sleep):
+    """
+    全ブロックを照合する。rate (bytes/sec) を超えないよう読み込みの合間に待機する。
+    戻り値: (ok: bool, bad_blocks: list)。末尾の未完ブロックは番号 len(block_sha256) で表す。
+    """
+    if index is None:
+        index = monthly_index.load_index(monthly_path, require_fresh=False)
+    if index is None:
+        return True, []
+
+    block_size = index["block_size"]
+    hashes = index.get("block_sha256", [])
+    bad_blocks = []
+    started = time.monotonic()
+    bytes_read = 0
+    with open(monthly_path, "rb") as f:
+        for block_no, expected in enumerate(hashes):
+            if _hash_range(f, block_no * block_size, block_size) != expected:
+                bad_blocks.append(block_no)
+            bytes_read += block_size
+            if rate:
+                ahead = bytes_read / rate - (time.monotonic() - started)
+                if ahead > 0:
+                    sleep(ahead)
+        if not _tail_ok(f, index):
+            bad_blocks.append(len(hashes))
+    return not bad_blocks, bad_blocks
+
+
+def main():
+    parser = argparse.ArgumentParser(description='月次ファイルのブロックチェックサム照合')
+    parser.add_argument('paths', nargs='+', help='月次ファイル、またはそれを含むディレクトリ')
+    parser.add_argument('--scrub', action='store_true', help='全ブロックを照合（既定は末尾ブロックのみ）')
+    parser.add_argument('--rate', type=str, default='1M', help='スクラブの帯域上限 (rclone の --bwlimit と同じ形式。例: 512k, 1M)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    rate = upload_fanout.parse_bwlimit(args.rate)
+
+    targets = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            targets.extend(sorted(glob.glob(os.path.join(path, 'temp_humid_*.txt'))))
+        else:
+            targets.append(path)
+
+    failed = 0
+    for path in targets:
+        if args.scrub:
+            ok, bad_blocks = scrub(path, rate=rate)
+            message = "全ブロック照合OK" if ok else f"不一致ブロック: {bad_blocks}"
+        else:
+            ok, message = verify_tail(path)
+        (logger.info if ok else logger.error)(f"{os.path.basename(path)}: {message}")
+        failed += 0 if ok else 1
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+BulkLoader: sensor_data へのバッチ単位の一括 UPSERT。
+
+unified_importer.insert_to_db() は DataFrame 全体を to_dict(orient='records') で
+dict のリストにしてから1トランザクションで送っていたため、数年分の取り込みでは
+メモリと1つの巨大なトランザクションが問題になる。ここでは
+- 行を batch_size 件ずつ取り出し、バッチごとにコミットする (メモリはバッチ分のみ)
+- MySQL で LOAD DATA LOCAL INFILE が使える場合は、バッチを一時CSVに書いて読み込ませる (高速パス)
+  使えない場合 (サーバー/ドライバで無効) は、その実行中は executemany に切り替える
+- 方言ごとの UPSERT (MySQL: ON DUPLICATE KEY UPDATE, SQLite: ON CONFLICT) を使い分け、
+  SQLite (組み込みDB) でもテストできるようにする
+- 件数と行/秒をログに残す
+- 行はデバイスID (devices) つきで書き込む。主キーは (device_id, timestamp)
+
+使い方 (SQLite での測定):
+    python bulk_loader.py --benchmark 500000 --batch-size 5000
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+from collections import namedtuple
+
+from sqlalchemy import text
+
+import devices
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+LoadStats = namedtuple("LoadStats", ["rows", "batches", "seconds", "method"])
+
+UPSERT_SQL = {
+    "mysql": """
+        INSERT INTO sensor_data (device_id, timestamp, temperature, humidity)
+        VALUES (:device_id, :timestamp, :temperature, :humidity)
+        ON DUPLICATE KEY UPDATE
+            temperature = VALUES(temperature),
+            humidity = VALUES(humidity)
+    """,
+    "sqlite": """
+        INSERT INTO sensor_data (device_id, timestamp, temperature, humidity)
+        VALUES (:device_id, :timestamp, :temperature, :humidity)
+        ON CONFLICT(device_id, timestamp) DO UPDATE SET
+            temperature = excluded.temperature,
+            humidity = excluded.humidity
+    """,
+}
+
+LOAD_DATA_SQL = """
+    LOAD DATA LOCAL INFILE '{path}'
+    REPLACE INTO TABLE sensor_data
+    FIELDS TERMINATED BY ',' LINES TERMINATED BY '\\n'
+    (device_id, timestamp, temperature, humidity)
+"""
+
+# LOAD DATA LOCAL INFILE が使えなかったエンジン (同じ実行中は再試行しない)
+_infile_disabled = set()
+
+
+def upsert_sql(dialect_name):
+    try:
+        return UPSERT_SQL[dialect_name]
+    except KeyError:
+        raise ValueError(f"未対応のDB方言です: {dialect_name}")
+
+
+def iter_batches(df, batch_size, device=devices.DEFAULT_DEVICE):
+    """DataFrame を batch_size 行ずつ (デバイスID, timestamp文字列, 温度, 湿度) のタプルのリストにして返す"""
+    for start in range(0, len(df), batch_size):
+        part = df.iloc[start:start + batch_size]
+        yield [(device, ts, t, h) for ts, t, h in zip(part['timestamp'].dt.strftime(TIMESTAMP_FORMAT),
+                                                       part['temperature'].tolist(), part['humidity'].tolist())]
+
+
+def _load_executemany(connection, sql, batch):
+    connection.execute(text(sql), [
+        {"device_id": d, "timestamp": ts, "temperature": t, "humidity": h} for d, ts, t, h in batch
+    ])
+
+
+def _load_infile(connection, batch):
+    """バッチを一時CSVに書き、LOAD DATA LOCAL INFILE で読み込ませる"""
+    fd, path = tempfile.mkstemp(prefix="sensor_bulk_", suffix=".csv")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.writelines(f"{d},{ts},{t},{h}\n" for d, ts, t, h in batch)
+        escaped = path.replace("\\", "\\\\").replace("'", "\\'")
+        connection.exec_driver_sql(LOAD_DATA_SQL.format(path=escaped))
+    finally:
+        os.remove(path)
+
+
+def infile_available(engine, use_infile=True):
+    return use_infile and engine.dialect.name == "mysql" and id(engine) not in _infile_disabled
+
+
+def bulk_load(engine, df, batch_size=DEFAULT_BATCH_SIZE, use_infile=True, device=devices.DEFAULT_DEVICE):
+    """
+    df (timestamp, temperature, humidity) を device の行として sensor_data に UPSERT する。バッチごとにコミット。
+    途中のバッチで失敗した場合は例外を送出する (それまでのバッチはコミット済み)。
+    戻り値: LoadStats(rows, batches, seconds, method)
+    """
+    started = time.perf_counter()
+    devices.ensure_schema(engine)
+    sql = upsert_sql(engine.dialect.name)
+    method = "infile" if infile_available(engine, use_infile) else "executemany"
+    rows = batches = 0
+
+    for batch in iter_batches(df, batch_size, devices.validate(device)):
+        with engine.begin() as connection:
+            if method == "infile":
+                try:
+                    _load_infile(connection, batch)
+                except Exception as e:
+                    # ローカルINFILEがサーバー/ドライバで無効: この実行中は executemany に切り替える
+                    logger.warning(f"LOAD DATA LOCAL INFILE が使えません。executemany に切り替えます: {e}")
+                    _infile_disabled.add(id(engine))
+                    method = "executemany"
+            if method == "executemany":
+                _load_executemany(connection, sql, batch)
+        rows += len(batch)
+        batches += 1
+
+    seconds = time.perf_counter() - started
+    if rows:
+        logger.info(f"一括挿入: {rows:,}行 / {batches}バッチ ({method}), "
+                    f"{seconds:.2f}秒, {rows / max(seconds, 1e-9):,.0f}行/秒")
+    return LoadStats(rows, batches, seconds, method)
+
+
+# --- ベンチマーク ---
+
+def run_benchmark(count, batch_size):
+    """SQLite (一時ファイル, storage の WAL 設定) に合成データを一括挿入して行/秒を測る"""
+    import pandas as pd
+
+    import storage
+
+    df = pd.DataFrame({
+        "timestamp": pd.date_range("2020-01-01", periods=count, freq="min"),
+        "temperature": 20.0, "humidity": 50.0,
+    })
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = storage.create_sqlite_engine(os.path.join(tmp, 'bench.db'))
+        for label in ("新規挿入", "UPSERT (全行重複)"):
+            stats = bulk_load(engine, df, batch_size)
+            print(f"{label}: {stats.rows:,}行 / {stats.batches}バッチ, {stats.seconds:.2f}秒, "
+                  f"{stats.rows / stats.seconds:,.0f}行/秒")
+        engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='sensor_data への一括UPSERT (ベンチマーク)')
+    parser.add_argument('--benchmark', type=int, metavar='ROWS', required=True, help='合成データの行数')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='1バッチ (1コミット) の行数')
+    args = parser.parse_args()
+    run_benchmark(args.benchmark, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
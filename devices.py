@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Devices: 複数のセンサーノード (Raspberry Pi) のデータを区別して取り込むためのデバイス次元。
+
+- デバイスID はファイルの先頭行のヘッダー ("# device: pi-02") があればそれを、
+  無ければダウンロード先ディレクトリ直下のサブフォルダ名 (<root>/pi-02/temp_humid_YYYY-MM.txt) を使う。
+  ルート直下の月次ファイル (従来の1台構成) は DEFAULT_DEVICE とする
+- sensor_data にデバイス列 (device_id) を追加し、主キーを (device_id, timestamp) にする。
+  既存の表 (timestamp が主キー・一意キー、またはキー無し) は ensure_schema() で移行し、既存の行は DEFAULT_DEVICE になる
+
+取り込み位置 (import_state)・集計テーブル (rollups)・取り込み済みフィルタ (row_filter)・
+ウォーターマークはいずれもデバイスごとに持つため、デバイスごとに独立して (並行して) 取り込める。
+"""
+import glob
+import logging
+import os
+import re
+import weakref
+
+from sqlalchemy import inspect, text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DEVICE = "default"
+DEFAULT_PATTERN = "temp_humid_*.txt"
+
+DEVICE_ID_RE = re.compile(r"^[\w.\-]{1,64}$")
+_HEADER_RE = re.compile(rb"^#\s*device\s*[:=]\s*([\w.\-]{1,64})\s*$")
+HEADER_SCAN_BYTES = 256
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS sensor_data (
+    device_id VARCHAR(64) NOT NULL DEFAULT 'default',
+    timestamp DATETIME NOT NULL,
+    temperature FLOAT,
+    humidity FLOAT,
+    PRIMARY KEY (device_id, timestamp)
+)
+"""
+# デバイスをまたいだ時刻範囲の検索 (ビュー・全体の最新時刻) 用
+CREATE_INDEX_SQL = "CREATE INDEX idx_sensor_data_timestamp ON sensor_data (timestamp)"
+
+MIGRATE_SQL = {
+    # MySQL は既存のキーによって文が変わるため mysql_migrate_sql() で組み立てる
+    # SQLite は主キーを変更できないため、作り直してから名前を付け替える
+    "sqlite": [
+        CREATE_TABLE_SQL.replace("IF NOT EXISTS sensor_data", "sensor_data_migrating"),
+        "INSERT INTO sensor_data_migrating (device_id, timestamp, temperature, humidity) "
+        "SELECT 'default', timestamp, temperature, humidity FROM sensor_data",
+        "DROP TABLE sensor_data",
+        # sensor_data を参照するビューがあっても名前の付け替えを止めない (ビューは新しい表を参照する)
+        "PRAGMA legacy_alter_table = ON",
+        "ALTER TABLE sensor_data_migrating RENAME TO sensor_data",
+        "PRAGMA legacy_alter_table = OFF",
+        CREATE_INDEX_SQL,
+    ],
+}
+
+def mysql_migrate_sql(primary_key, unique_keys, index_names):
+    """
+    MySQL の従来の sensor_data を移行する ALTER 文を、実際にあるキーに合わせて組み立てる。
+    従来の取り込みは ON DUPLICATE KEY UPDATE に頼るだけなので、主キーが無く timestamp の一意キーで
+    重複を防いでいる表や、キーの無い表もあり得る。
+    primary_key: 主キーの列名のリスト (無ければ空)
+    unique_keys: timestamp を含む一意キーの名前のリスト (デバイスをまたいで同じ時刻を許すため外す)
+    index_names: 既存のインデックス名
+    """
+    clauses = ["ADD COLUMN device_id VARCHAR(64) NOT NULL DEFAULT 'default' FIRST"]
+    clauses += [f"DROP INDEX `{name}`" for name in unique_keys]
+    if list(primary_key) in ([], ["timestamp"]):
+        if primary_key:
+            clauses.append("DROP PRIMARY KEY")
+        clauses.append("ADD PRIMARY KEY (device_id, timestamp)")
+    else:
+        # timestamp 以外の主キー (AUTO_INCREMENT の id など) は残し、一意キーで UPSERT の単位を決める
+        clauses.append("ADD UNIQUE KEY uq_sensor_data_device_timestamp (device_id, timestamp)")
+    if "idx_sensor_data_timestamp" not in index_names:
+        clauses.append("ADD INDEX idx_sensor_data_timestamp (timestamp)")
+    return ["ALTER TABLE sensor_data " + ", ".join(clauses)]
+
+
+def _migrate_statements(engine, inspector):
+    if engine.dialect.name != "mysql":
+        return MIGRATE_SQL.get(engine.dialect.name)
+    primary_key = inspector.get_pk_constraint("sensor_data").get("constrained_columns") or []
+    unique_keys = [u["name"] for u in inspector.get_unique_constraints("sensor_data")
+                   if "timestamp" in u["column_names"]]
+    index_names = {i["name"] for i in inspector.get_indexes("sensor_data")}
+    if not primary_key and not unique_keys:
+        with engine.connect() as connection:
+            duplicates = connection.execute(text(
+                "SELECT COUNT(*) - COUNT(DISTINCT timestamp) FROM sensor_data")).scalar()
+        if duplicates:
+            raise ValueError(f"sensor_data に同じ timestamp の行が {duplicates} 行あるため、"
+                             f"主キー (device_id, timestamp) を追加できません。重複を削除してから再実行してください。")
+    return mysql_migrate_sql(primary_key, unique_keys, index_names)
+
+
+# スキーマを確認済みのエンジン (同じ実行中は再確認しない)。
+# id(engine) だと破棄されたエンジンの id が再利用されたときに確認が漏れるため弱参照で持つ
+_checked = weakref.WeakSet()
+
+
+def ensure_schema(engine):
+    """sensor_data をデバイス列つきの形にする (無ければ作成、従来の形なら移行する)"""
+    if engine in _checked:
+        return
+    inspector = inspect(engine)
+    if not inspector.has_table("sensor_data"):
+        with engine.begin() as connection:
+            connection.execute(text(CREATE_TABLE_SQL))
+            connection.execute(text(CREATE_INDEX_SQL))
+    elif "device_id" not in {c["name"] for c in inspector.get_columns("sensor_data")}:
+        statements = _migrate_statements(engine, inspector)
+        if statements is None:
+            raise ValueError(f"未対応のDB方言です: {engine.dialect.name}")
+        logger.warning(f"sensor_data にデバイス列を追加し、主キーを (device_id, timestamp) に変更します "
+                       f"(既存の行は '{DEFAULT_DEVICE}')。")
+        with engine.begin() as connection:
+            for sql in statements:
+                connection.execute(text(sql))
+    _checked.add(engine)
+
+
+def validate(device):
+    if not DEVICE_ID_RE.match(device):
+        raise ValueError(f"デバイスIDに使えない文字が含まれています: {device!r}")
+    return device
+
+
+def read_header_device(path):
+    """先頭行が "# device: <id>" ならその ID を返す。無ければ None"""
+    try:
+        with open(path, "rb") as f:
+            first_line = f.read(HEADER_SCAN_BYTES).split(b"\n", 1)[0].rstrip(b"\r")
+    except OSError:
+        return None
+    match = _HEADER_RE.match(first_line)
+    return match.group(1).decode() if match else None
+
+
+def device_for(path, root=None):
+    """ファイルのデバイスID (ヘッダー → root 直下のサブフォルダ名 → DEFAULT_DEVICE の順)"""
+    device = read_header_device(path)
+    if device:
+        return device
+    if root:
+        relative = os.path.relpath(os.path.dirname(os.path.abspath(path)), os.path.abspath(root))
+        if relative != "." and not relative.startswith(".."):
+            return validate(relative.split(os.sep)[0])
+    return DEFAULT_DEVICE
+
+
+def discover(root, pattern=DEFAULT_PATTERN):
+    """root 直下と、デバイスごとのサブフォルダ直下の月次ファイルのパス"""
+    return glob.glob(os.path.join(root, pattern)) + glob.glob(os.path.join(root, "*", pattern))
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+FileWatcher: ディレクトリ内の月次ファイルの追加・追記を検知する (unified_importer --watch 用)。
+
+- Linux では inotify (ctypes 経由、追加パッケージ不要) でディレクトリを監視し、
+  書き込み・rename のイベントで起きてから変化を確認する。イベントの取りこぼしに備え、
+  一定間隔でディレクトリ全体も見直す
+- inotify が使えない環境 (macOS など) では、ファイルのサイズ・更新時刻を一定間隔で比較する (ポーリング)
+
+どちらの場合も「どのファイルが変わったか」は (サイズ, 更新時刻) の比較で決めるため、
+イベントは起きるきっかけとしてだけ使う。追記分だけを読む処理は呼び出し側 (import_state のチェックポイント) が行う。
+監視対象はディレクトリ直下と、その1階層下 (デバイスごとのサブフォルダ、devices 参照) の月次ファイル。
+"""
+import ctypes
+import ctypes.util
+import fnmatch
+import logging
+import os
+import select
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATTERN = "temp_humid_*.txt"
+DEFAULT_POLL_INTERVAL = 2.0
+
+# inotify 使用時も、イベントの取りこぼしに備えてこの間隔でディレクトリ全体を見直す (秒)
+INOTIFY_RESCAN_INTERVAL = 60.0
+
+# イベントを受けてから、続けて届く書き込みをまとめるまでの待ち時間 (秒)
+SETTLE_SECONDS = 0.3
+
+# inotify のイベント種別 (<sys/inotify.h>)
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_WATCH_MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+
+
+def _subdirectories(directory):
+    try:
+        with os.scandir(directory) as it:
+            return sorted(entry.path for entry in it if entry.is_dir())
+    except FileNotFoundError:
+        return []
+
+
+def snapshot(directory, pattern=DEFAULT_PATTERN, subdirs=True):
+    """{パス: (サイズ, 更新時刻ns)} (subdirs なら1階層下のサブフォルダも含める)"""
+    files = {}
+    if subdirs:
+        for subdirectory in _subdirectories(directory):
+            files.update(snapshot(subdirectory, pattern, subdirs=False))
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_file() and fnmatch.fnmatch(entry.name, pattern):
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    files[entry.path] = (st.st_size, st.st_mtime_ns)
+    except FileNotFoundError:
+        pass
+    return files
+
+
+def changed_paths(before, after):
+    """before から after で追加・変化したファイルのパス (ファイル名順)"""
+    return sorted((path for path, key in after.items() if before.get(path) != key), key=os.path.basename)
+
+
+def _libc():
+    return ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+
+
+def open_inotify(directory):
+    """directory (とそのサブフォルダ) を監視する inotify の fd を返す。使えない環境では None"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = _libc()
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        if libc.inotify_add_watch(fd, os.fsencode(directory), _WATCH_MASK) < 0:
+            os.close(fd)
+            return None
+        watch_subdirectories(fd, directory)
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+
+def watch_subdirectories(fd, directory):
+    """directory 直下のサブフォルダを inotify の監視に加える (追加済みのものは同じ監視が返るだけ)"""
+    libc = _libc()
+    for subdirectory in _subdirectories(directory):
+        libc.inotify_add_watch(fd, os.fsencode(subdirectory), _WATCH_MASK)
+
+
+def _drain(fd):
+    """溜まっているイベントを読み捨てる (変化の内容はスナップショットの比較で決める)"""
+    while True:
+        try:
+            if not os.read(fd, 65536):
+                return
+        except BlockingIOError:
+            return
+
+
+def iter_changes(directory, pattern=DEFAULT_PATTERN, poll_interval=DEFAULT_POLL_INTERVAL,
+                 use_inotify=True, stop=None):
+    """
+    directory 内で追加・変化したファイルのパスのリストを、変化を検知するたびに返す。
+    最初に、監視開始時点で存在するファイルを全て返す (前回の実行以降の分を取り込むため)。
+    stop (threading.Event) がセットされると終了する。
+    """
+    stop = stop or threading.Event()
+    fd = open_inotify(directory) if use_inotify else None
+    logger.info(f"監視開始: {directory} ({'inotify' if fd is not None else f'{poll_interval}秒ごとのポーリング'})")
+    try:
+        current = snapshot(directory, pattern)
+        if current:
+            yield changed_paths({}, current)
+        last_scan = time.monotonic()
+        while not stop.is_set():
+            if fd is None:
+                if stop.wait(poll_interval):
+                    return
+            else:
+                readable, _, _ = select.select([fd], [], [], poll_interval)
+                if readable:
+                    # 連続する書き込み (.part の書き込み → rename など) をまとめてから見る
+                    stop.wait(SETTLE_SECONDS)
+                    _drain(fd)
+                    # 新しいデバイスのサブフォルダができていれば監視に加える
+                    watch_subdirectories(fd, directory)
+                elif time.monotonic() - last_scan < INOTIFY_RESCAN_INTERVAL:
+                    continue
+            previous, current = current, snapshot(directory, pattern)
+            last_scan = time.monotonic()
+            paths = changed_paths(previous, current)
+            if paths:
+                yield paths
+    finally:
+        if fd is not None:
+            os.close(fd)
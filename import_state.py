@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+ImportState: unified_importer の取り込み位置 (チェックポイント) 管理。
+
+取り込み元ファイルごとに「取り込み済みの先頭バイト数」と「その範囲の SHA-256」を
+DB の import_state テーブルに記録し、次回の実行で
+- サイズ・更新時刻が記録と同じ → ファイルを開かずにスキップ
+- 取り込み済み範囲のハッシュが一致 → その位置までシークして新しいバイトだけを解析 (resume)
+- ハッシュ不一致・ファイルが短くなった → 先頭から全体を取り込み直す (full)
+を判定する。
+
+チェックポイントは DB への挿入がコミットされた後にのみ進めるため、
+ファイルの途中でクラッシュしても、次回は最後にコミットした位置から安全に再開できる
+(UPSERT のため、重複して読んだ行は上書きされるだけ)。
+チェックポイントはデバイス (devices) ごとに持つため、別のデバイスの同名ファイルとは混ざらない。
+遅れて届いたデータを取り込むモード (late) は、通常モードとは別のチェックポイントを持つ。
+通常モードではウォーターマークより古い行を捨てたままチェックポイントを進めるため、
+late モードでは各ファイルを一度だけ先頭から読み直し、以後は同じように続きのバイトだけを読む。
+"""
+import hashlib
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+
+import devices
+
+HASH_READ_SIZE = 1024 * 1024
+
+# 末尾の改行を探すときに読む範囲 (1行の最大長より十分大きい)
+TAIL_SCAN_BYTES = 4096
+
+# 改行で終わらない最終行を、書き込み途中ではなく完結した行とみなすまでの無更新時間 (秒)
+SETTLED_TAIL_SEC = 10 * 60
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS import_state (
+    source_file VARCHAR(255) NOT NULL PRIMARY KEY,
+    byte_offset BIGINT NOT NULL,
+    prefix_sha256 CHAR(64) NOT NULL,
+    file_size BIGINT NOT NULL,
+    mtime_ns BIGINT NOT NULL,
+    updated_at DATETIME NOT NULL
+)
+"""
+
+
+def state_key(filepath, device=devices.DEFAULT_DEVICE, late=False):
+    """
+    チェックポイントのキー。ダウンロード先ディレクトリが変わっても引き継げるようファイル名のみ
+    (既定のデバイス以外は "デバイスID/ファイル名"。late モードは先頭に "late:" をつける)
+    """
+    name = os.path.basename(filepath)
+    key = name if device == devices.DEFAULT_DEVICE else f"{device}/{name}"
+    return "late:" + key if late else key
+
+
+def ensure_table(engine):
+    with engine.begin() as connection:
+        connection.execute(text(CREATE_TABLE_SQL))
+
+
+def load_state(engine, filepath, device=devices.DEFAULT_DEVICE, late=False):
+    """記録済みのチェックポイントを dict で返す。無ければ None"""
+    with engine.connect() as connection:
+        row = connection.execute(
+            text("SELECT byte_offset, prefix_sha256, file_size, mtime_ns FROM import_state WHERE source_file = :f"),
+            {"f": state_key(filepath, device, late)},
+        ).fetchone()
+    if row is None:
+        return None
+    return {"byte_offset": int(row[0]), "prefix_sha256": row[1], "file_size": int(row[2]), "mtime_ns": int(row[3])}
+
+
+def save_state(engine, filepath, byte_offset, prefix_sha256, file_size, mtime_ns, device=devices.DEFAULT_DEVICE,
+               late=False):
+    """チェックポイントを記録する (DB方言に依存しないよう DELETE + INSERT を1トランザクションで行う)"""
+    params = {
+        "f": state_key(filepath, device, late), "offset": byte_offset, "sha": prefix_sha256,
+        "size": file_size, "mtime": mtime_ns, "now": datetime.now().replace(microsecond=0),
+    }
+    with engine.begin() as connection:
+        connection.execute(text("DELETE FROM import_state WHERE source_file = :f"), params)
+        connection.execute(text(
+            "INSERT INTO import_state (source_file, byte_offset, prefix_sha256, file_size, mtime_ns, updated_at) "
+            "VALUES (:f, :offset, :sha, :size, :mtime, :now)"
+        ), params)
+
+
+def extend_hash(hasher, f, start, end):
+    """ファイル f の [start, end) を hasher に追加する"""
+    f.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        data = f.read(min(HASH_READ_SIZE, remaining))
+        if not data:
+            raise IOError(f"ファイルが途中で短くなりました ({end - remaining}byte 目)")
+        hasher.update(data)
+        remaining -= len(data)
+    return hasher
+
+
+def terminated_length(f, size):
+    """最後の改行までのバイト数 (書き込み途中の最終行を除いた長さ) を返す"""
+    position = size
+    while position > 0:
+        start = max(0, position - TAIL_SCAN_BYTES)
+        f.seek(start)
+        chunk = f.read(position - start)
+        newline = chunk.rfind(b"\n")
+        if newline >= 0:
+            return start + newline + 1
+        position = start
+    return 0
+
+
+def importable_length(f, st, now=None):
+    """
+    取り込んでよい長さを返す。改行で終わらない最終行は書き込み途中の可能性があるため除くが、
+    SETTLED_TAIL_SEC 以上更新されていないファイルでは完結した行 (最終行に改行の無いファイル) とみなして含める
+    """
+    end = terminated_length(f, st.st_size)
+    now = time.time() if now is None else now
+    if end < st.st_size and now - st.st_mtime >= SETTLED_TAIL_SEC:
+        return st.st_size
+    return end
+
+
+def plan(filepath, state):
+    """
+    取り込み方針を決める。
+    戻り値: (action, offset, hasher, stat)
+        action: "skip" (変化なし) / "resume" (offset から続き) / "full" (先頭から取り込み直し) / "new" (記録なし)
+        hasher: offset までの内容を読み込み済みの sha256 (skip の場合は None)
+        stat: 判定時点の os.stat。checkpoint() にそのまま渡す
+              (解析中に追記されても、次回その追記分を取りこぼさないため)
+    """
+    st = os.stat(filepath)
+    if state is None:
+        return "new", 0, hashlib.sha256(), st
+    if st.st_size == state["file_size"] and st.st_mtime_ns == state["mtime_ns"]:
+        return "skip", state["byte_offset"], None, st
+    if st.st_size < state["byte_offset"]:
+        return "full", 0, hashlib.sha256(), st
+    with open(filepath, "rb") as f:
+        hasher = extend_hash(hashlib.sha256(), f, 0, state["byte_offset"])
+    if hasher.hexdigest() != state["prefix_sha256"]:
+        return "full", 0, hashlib.sha256(), st
+    return "resume", state["byte_offset"], hasher, st
+
+
+def checkpoint(engine, filepath, hasher, start, end, st, device=devices.DEFAULT_DEVICE, late=False):
+    """
+    [start, end) の取り込みがコミットされた後に呼ぶ。hasher を end まで進めて記録する。
+    end はファイル内の行境界、st は plan() が返した判定時点の os.stat。
+    サイズは st.st_size ではなく end として記録する。ファイルの途中までのチェックポイントや、
+    まだ取り込んでいない改行の無い最終行があるファイルは、次回 skip と判定されずに続きから読み直される。
+    """
+    with open(filepath, "rb") as f:
+        extend_hash(hasher, f, start, end)
+    save_state(engine, filepath, end, hasher.hexdigest(), end, st.st_mtime_ns, device=device, late=late)
+    return hasher
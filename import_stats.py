@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+ImportStats: unified_importer の段階別スループット計測 (--stats / --stats-json)。
+
+段階 (stage) ごと・ファイルごとに
+    wall (経過秒), cpu (CPU秒), rows_in / rows_out (入出力行数), rejected (除外行数), bytes (読んだバイト数)
+を積算し、実行全体の経過時間・CPU時間・ピークメモリとあわせて表示/JSON出力する。
+
+段階:
+    download    ダウンロード完了待ち (差分ダウンロードのイテレータから次のファイルが届くまで)
+    plan        チェックポイントの判定 (取り込み済み範囲のハッシュ計算を含む)
+    parse       monthly_parser による解析 (並列時は各ワーカープロセス内で計測した値の合計)
+    parse_wait  書き込み役が解析結果を待った時間 (並列時に解析が追いついているかの目安)
+    validate    範囲チェック (温度・湿度の異常値除去)
+    filter      ウォーターマーク / 取り込み済みフィルタ (row_filter) による絞り込み
+    insert      bulk_loader による挿入
+    rollups     集計テーブルの更新
+    checkpoint  チェックポイントの記録
+
+統計は dict で持ち回り、--stats-json には1回の実行を1行の JSON として追記するため、
+実行ごとの推移を `python import_stats.py stats.jsonl` で比較できる。
+
+使い方:
+    python unified_importer.py --no-download --stats --stats-json ~/import_stats.jsonl
+    python import_stats.py ~/import_stats.jsonl --last 5
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+STAGES = ("download", "plan", "parse", "parse_wait", "validate", "filter", "insert", "rollups", "checkpoint")
+COUNTERS = ("wall", "cpu", "rows_in", "rows_out", "rejected", "bytes")
+
+# デバイスごとの書き込みスレッド (unified_importer --device-workers) から同時に加算されるため
+_lock = threading.Lock()
+
+
+def new_stats():
+    return {"started_at": datetime.now().isoformat(timespec="seconds"), "stages": {}, "files": {},
+            "_t0": time.perf_counter(), "_c0": time.process_time()}
+
+
+def _record():
+    return dict.fromkeys(COUNTERS, 0)
+
+
+def add(stats, stage, filepath=None, **values):
+    """stage (とファイル) の積算値に values を足す。stats が None なら何もしない"""
+    if stats is None:
+        return
+    with _lock:
+        targets = [stats["stages"].setdefault(stage, _record())]
+        if filepath is not None:
+            targets.append(stats["files"].setdefault(os.path.basename(filepath), {}).setdefault(stage, _record()))
+        for record in targets:
+            for key, value in values.items():
+                record[key] += value
+
+
+@contextmanager
+def timed(stats, stage, filepath=None):
+    """
+    with ブロックの経過時間と CPU 時間を stage に加算する。
+    ブロック内で返された dict に rows_in などを入れると、それも加算される。
+    """
+    values = {}
+    if stats is None:
+        yield values
+        return
+    t0, c0 = time.perf_counter(), time.process_time()
+    try:
+        yield values
+    finally:
+        add(stats, stage, filepath, wall=time.perf_counter() - t0, cpu=time.process_time() - c0, **values)
+
+
+def timed_iter(stats, stage, iterable):
+    """iterable から次の要素を取り出すのにかかった時間を stage に加算しながら要素を返す"""
+    iterator = iter(iterable)
+    while True:
+        with timed(stats, stage) as values:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            values["rows_out"] = 1
+        yield item
+
+
+def peak_rss_mb():
+    """このプロセスと終了済みの子プロセス (解析ワーカー) それぞれのピークRSS の大きい方 (MB)"""
+    unit = 1 if sys.platform == "darwin" else 1024
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak * unit / 2 ** 20
+
+
+def _rates(record):
+    record["rows_per_sec"] = record["rows_in"] / record["wall"] if record["wall"] > 0 else None
+    return record
+
+
+def finish(stats):
+    """実行全体の値を確定させ、JSON にできる dict を返す"""
+    report = {
+        "started_at": stats["started_at"],
+        "wall": time.perf_counter() - stats["_t0"],
+        "cpu": time.process_time() - stats["_c0"],
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": {stage: _rates(dict(record)) for stage, record in _ordered(stats["stages"])},
+        "files": {name: {stage: _rates(dict(record)) for stage, record in _ordered(stages)}
+                  for name, stages in sorted(stats["files"].items())},
+    }
+    report["rows_inserted"] = report["stages"].get("insert", {}).get("rows_out", 0)
+    return report
+
+
+def _ordered(stages):
+    return sorted(stages.items(), key=lambda item: STAGES.index(item[0]) if item[0] in STAGES else len(STAGES))
+
+
+def _format_row(name, record):
+    rate = f"{record['rows_per_sec']:>12,.0f}" if record.get("rows_per_sec") else f"{'-':>12}"
+    return (f"  {name:<12}{record['wall']:>9.3f}{record['cpu']:>9.3f}{record['rows_in']:>11,}"
+            f"{record['rows_out']:>11,}{record['rejected']:>9,}{rate}")
+
+
+def format_report(report, per_file=True):
+    header = f"  {'stage':<12}{'wall_s':>9}{'cpu_s':>9}{'rows_in':>11}{'rows_out':>11}{'rejected':>9}{'rows/s':>12}"
+    lines = [f"--- 取り込み統計 ({report['started_at']}) ---", header]
+    lines += [_format_row(stage, record) for stage, record in report["stages"].items()]
+    if per_file:
+        for name, stages in report["files"].items():
+            lines.append(f" [{name}]")
+            lines += [_format_row(stage, record) for stage, record in stages.items()]
+    lines.append(f"合計: {report['wall']:.2f}秒 (CPU {report['cpu']:.2f}秒), 挿入 {report['rows_inserted']:,}行, "
+                 f"ピークメモリ {report['peak_rss_mb']:.0f}MB")
+    return "\n".join(lines)
+
+
+def append_json(report, path):
+    """1回の実行を1行の JSON として path に追記する"""
+    with open(path, "a") as f:
+        f.write(json.dumps(report, ensure_ascii=False, sort_keys=True) + "\n")
+
+
+def load_history(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def format_history(reports):
+    """実行ごとの段階別の 行/秒 を並べて表示する"""
+    stages = [s for s in STAGES if any(s in r["stages"] for r in reports)]
+    lines = [f"{'started_at':<20}{'wall_s':>10}{'inserted':>13}{'peak_mb':>11}" + "".join(f"{s:>12}" for s in stages)]
+    for r in reports:
+        rates = []
+        for stage in stages:
+            rate = r["stages"].get(stage, {}).get("rows_per_sec")
+            rates.append(f"{rate:>12,.0f}" if rate else f"{'-':>12}")
+        lines.append(f"{r['started_at']:<20}{r['wall']:>10.2f}{r['rows_inserted']:>13,}{r['peak_rss_mb']:>11.0f}"
+                     + "".join(rates))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='unified_importer --stats-json の記録を実行ごとに比較する')
+    parser.add_argument('path', help='--stats-json で出力したファイル')
+    parser.add_argument('--last', type=int, default=10, help='表示する直近の実行数')
+    parser.add_argument('--detail', action='store_true', help='最後の実行の段階別・ファイル別の詳細も表示する')
+    args = parser.parse_args()
+
+    reports = load_history(args.path)[-args.last:]
+    if not reports:
+        print("記録がありません。")
+        return
+    print("段階別 行/秒:")
+    print(format_history(reports))
+    if args.detail:
+        print()
+        print(format_report(reports[-1]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+IncrementalDownloader: 月次ファイルの差分ダウンロード (rclone sync の置き換え)。
+
+- リモートを1回だけ一覧 (rclone lsjson --hash) し、ローカルのマニフェスト
+  (前回ダウンロードした時点のサイズ・更新時刻・MD5) と比較する
+- 変化のない月はダウンロードしない
+- 前回より伸びただけの月 (当月ファイルへの追記) は、追記された範囲だけを
+  `rclone cat --offset` で取得し、ローカルのコピーの末尾に継ぎ足す。
+  リモートがMD5を持っていれば結合後のファイル全体で照合し、不一致なら全体を取り直す
+- 複数ファイルを並行してダウンロードし、終わったものから順に呼び出し側へ渡す
+  (インポーターは全ファイルの同期完了を待たずに取り込みを始められる)
+- ダウンロードは `.part` に書いてから rename するため、中断してもローカルの月次ファイルは壊れない
+- bwlimit (bytes/秒) で1ファイルあたりの転送速度を絞れる (rclone は --bwlimit、ローカルは読み込みの間に待つ)
+- 月次ファイルのサイドカー索引 (monthly_index の .idx.json) があれば一緒に取得し、
+  月次ファイルを呼び出し側へ渡す前に置いておく (インポーターが索引でスキップ・シークできるように)。
+  索引は小さいため、変わっていれば全体を取り直す。索引の取得に失敗しても月次ファイルは渡す
+
+リモート直下のほか、その1階層下のデバイスごとのフォルダ (pi-02/temp_humid_YYYY-MM.txt) も同期し、
+ローカルにも同じフォルダ構成で置く (デバイスの判定は devices を参照)。
+リモートには rclone のリモート指定 (`raspi_data:sensor_data/`) のほか、
+ローカルディレクトリも指定できる (テスト・NASマウント用)。
+
+使い方:
+    python incremental_download.py raspi_data:sensor_data/ ~/sensor_data_downloads/ --workers 4
+"""
+import argparse
+import fnmatch
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import monthly_index
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = ".download_manifest.json"
+DEFAULT_PATTERN = "temp_humid_*.txt"
+DEFAULT_WORKERS = 4
+COPY_CHUNK_SIZE = 1024 * 1024
+
+_RCLONE_REMOTE_RE = re.compile(r"^[\w.\- ]+:")
+
+
+def is_local_remote(remote):
+    """rclone のリモート指定 (name:path) でなければローカルディレクトリとして扱う"""
+    return os.path.isdir(remote) or not _RCLONE_REMOTE_RE.match(remote)
+
+
+def _remote_path(remote, name):
+    if is_local_remote(remote):
+        return os.path.join(remote, name)
+    return remote.rstrip("/") + "/" + name if not remote.endswith(":") else remote + name
+
+
+def _md5_file(path):
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(COPY_CHUNK_SIZE), b""):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+# --- 一覧 ---
+
+def _list_local(directory, patterns, known=None, prefix=""):
+    """
+    ローカルディレクトリを一覧する。known (前回の一覧・マニフェスト) とサイズ・更新時刻が
+    同じファイルは読まずに前回の MD5 を使い、違うファイルだけ MD5 を計算する
+    """
+    known = known or {}
+    listing = {}
+    for entry in os.scandir(directory):
+        if entry.is_file() and any(fnmatch.fnmatch(entry.name, p) for p in patterns):
+            name = prefix + entry.name
+            st = entry.stat()
+            item = {"size": st.st_size, "mtime": st.st_mtime_ns}
+            previous = known.get(name) or {}
+            unchanged = previous.get("md5") and all(previous.get(k) == v for k, v in item.items())
+            item["md5"] = previous["md5"] if unchanged else _md5_file(entry.path)
+            listing[name] = item
+        elif entry.is_dir() and not prefix:
+            listing.update(_list_local(entry.path, patterns, known, prefix=entry.name + "/"))
+    return listing
+
+
+def list_remote(remote, pattern=DEFAULT_PATTERN, known=None):
+    """
+    リモートの月次ファイルを {相対パス: {"size", "mtime", "md5"}} で返す (md5 は無ければ None)。
+    相対パスは直下のファイルならファイル名、デバイスのフォルダ内なら "フォルダ/ファイル名"。
+    月次ファイルのサイドカー索引 (pattern + .idx.json) も含める。
+    ローカルディレクトリのリモートでは、known とサイズ・更新時刻が同じファイルの MD5 を計算し直さない
+    """
+    patterns = (pattern, pattern + monthly_index.INDEX_SUFFIX)
+    if is_local_remote(remote):
+        return _list_local(remote, patterns, known)
+
+    result = subprocess.run(
+        ["rclone", "lsjson", "--files-only", "-R", "--max-depth", "2", "--hash", "--hash-type", "md5",
+         "--include", patterns[0], "--include", patterns[1], remote],
+        capture_output=True, text=True, check=True,
+    )
+    listing = {}
+    for item in json.loads(result.stdout or "[]"):
+        listing[item["Path"]] = {
+            "size": int(item["Size"]),
+            "mtime": item.get("ModTime"),
+            "md5": (item.get("Hashes") or {}).get("md5"),
+        }
+    return listing
+
+
+# --- マニフェスト ---
+
+def load_manifest(local_dir):
+    try:
+        with open(os.path.join(local_dir, MANIFEST_NAME), "r") as f:
+            manifest = json.load(f)
+        return manifest if isinstance(manifest, dict) else {}
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"ダウンロードマニフェストの読み込みに失敗。全ファイルを確認し直します: {e}")
+        return {}
+
+
+def save_manifest(local_dir, manifest):
+    path = os.path.join(local_dir, MANIFEST_NAME)
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(temp_path, path)
+
+
+# --- 判定 ---
+
+def plan_download(name, remote_entry, manifest_entry, local_dir):
+    """
+    1ファイルの取得方法を決める。
+    戻り値: ("skip" | "append" | "full", 取得開始オフセット)
+    """
+    local_path = os.path.join(local_dir, name)
+    local_size = os.path.getsize(local_path) if os.path.isfile(local_path) else None
+    if manifest_entry is None or local_size is None or local_size != manifest_entry["size"]:
+        return "full", 0
+
+    same_hash = remote_entry.get("md5") and remote_entry.get("md5") == manifest_entry.get("md5")
+    if remote_entry["size"] == manifest_entry["size"] and (
+            same_hash or remote_entry.get("mtime") == manifest_entry.get("mtime")):
+        return "skip", local_size
+    if remote_entry["size"] > local_size:
+        return "append", local_size
+    return "full", 0
+
+
+# --- 取得 ---
+
+def _copy_throttled(src, dst, bwlimit):
+    """src から dst へ、平均 bwlimit (bytes/秒) を超えないようにコピーする"""
+    started = time.monotonic()
+    copied = 0
+    for block in iter(lambda: src.read(min(COPY_CHUNK_SIZE, max(1, int(bwlimit) // 10))), b""):
+        dst.write(block)
+        copied += len(block)
+        delay = copied / bwlimit - (time.monotonic() - started)
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _copy_remote_range(remote, name, offset, dst, bwlimit=None):
+    """リモートファイルの offset 以降を dst (開いたファイル) に書き込む"""
+    if is_local_remote(remote):
+        with open(_remote_path(remote, name), "rb") as src:
+            src.seek(offset)
+            if bwlimit:
+                _copy_throttled(src, dst, bwlimit)
+            else:
+                shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+        return
+    cmd = ["rclone", "cat", _remote_path(remote, name)]
+    if offset:
+        cmd[2:2] = ["--offset", str(offset)]
+    if bwlimit:
+        cmd[2:2] = ["--bwlimit", f"{int(bwlimit)}B"]
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as proc:
+        shutil.copyfileobj(proc.stdout, dst, COPY_CHUNK_SIZE)
+        stderr = proc.stderr.read().decode(errors="replace")
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=stderr)
+
+
+def fetch_file(remote, name, remote_entry, local_dir, action, offset, bwlimit=None):
+    """
+    1ファイルを取得して local_dir に置く。append で結合後のMD5が合わなければ全体を取り直す。
+    戻り値: 実際に行った取得方法 ("append" / "full")
+    """
+    local_path = os.path.join(local_dir, name)
+    part_path = local_path + ".part"
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    try:
+        with open(part_path, "wb") as dst:
+            if action == "append":
+                with open(local_path, "rb") as src:
+                    shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+            _copy_remote_range(remote, name, offset if action == "append" else 0, dst, bwlimit)
+            dst.flush()
+            os.fsync(dst.fileno())
+
+        expected_md5 = remote_entry.get("md5")
+        if expected_md5 and _md5_file(part_path) != expected_md5:
+            if action == "append":
+                logger.warning(f"{name}: 追記分を結合した結果がリモートと一致しません。全体を取り直します。")
+                return fetch_file(remote, name, remote_entry, local_dir, "full", 0, bwlimit)
+            raise IOError(f"{name}: ダウンロード結果のMD5がリモートと一致しません")
+        os.rename(part_path, local_path)
+        return action
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+
+def fetch_sidecar(remote, name, listing, manifest, local_dir, bwlimit=None):
+    """
+    月次ファイル name のサイドカー索引がリモートにあり、前回から変わっていれば取得する。
+    戻り値: 取得した索引の (相対パス, リモートの項目)。取得しなかった・失敗した場合は None
+    """
+    sidecar = monthly_index.index_path_for(name)
+    entry = listing.get(sidecar)
+    if entry is None or plan_download(sidecar, entry, manifest.get(sidecar), local_dir)[0] == "skip":
+        return None
+    try:
+        fetch_file(remote, sidecar, entry, local_dir, "full", 0, bwlimit)
+    except Exception as e:
+        logger.warning(f"{sidecar} のダウンロードに失敗しました (索引なしで取り込みます): {e}")
+        return None
+    return sidecar, entry
+
+
+def _fetch_with_sidecar(remote, name, listing, manifest, local_dir, action, offset, bwlimit=None):
+    done = fetch_file(remote, name, listing[name], local_dir, action, offset, bwlimit)
+    return done, fetch_sidecar(remote, name, listing, manifest, local_dir, bwlimit)
+
+
+def download_iter(remote, local_dir, workers=DEFAULT_WORKERS, pattern=DEFAULT_PATTERN, bwlimit=None):
+    """
+    リモートと local_dir を差分同期し、ファイルごとに準備ができた順で (パス, 取得方法) を返す。
+    変化のないファイルは最初にまとめて ("skip") 返す。失敗したファイルは返さずログに残し、
+    マニフェストも更新しないため次回の実行で再取得される。
+    サイドカー索引は月次ファイルを返す前に取得しておく (索引自体は返さない)。
+    """
+    os.makedirs(local_dir, exist_ok=True)
+    manifest = load_manifest(local_dir)
+    listing = list_remote(remote, pattern, known=manifest)
+    names = sorted(name for name in listing if not name.endswith(monthly_index.INDEX_SUFFIX))
+
+    plans = {}
+    for name in names:
+        action, offset = plan_download(name, listing[name], manifest.get(name), local_dir)
+        if action == "skip":
+            fetched = fetch_sidecar(remote, name, listing, manifest, local_dir, bwlimit)
+            if fetched is not None:
+                manifest[fetched[0]] = fetched[1]
+                save_manifest(local_dir, manifest)
+            yield os.path.join(local_dir, name), "skip"
+        else:
+            plans[name] = (action, offset)
+
+    if not plans:
+        return
+    logger.info(f"差分ダウンロード: {len(plans)}/{len(names)}ファイル "
+                f"(追記のみ {sum(1 for a, _ in plans.values() if a == 'append')}件)")
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(_fetch_with_sidecar, remote, name, listing, dict(manifest), local_dir,
+                               action, offset, bwlimit): name
+                   for name, (action, offset) in plans.items()}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                done, fetched = future.result()
+            except Exception as e:
+                logger.error(f"{name} のダウンロードに失敗しました: {e}")
+                continue
+            manifest[name] = listing[name]
+            if fetched is not None:
+                manifest[fetched[0]] = fetched[1]
+            save_manifest(local_dir, manifest)
+            yield os.path.join(local_dir, name), done
+
+
+def download_all(remote, local_dir, workers=DEFAULT_WORKERS, pattern=DEFAULT_PATTERN, bwlimit=None):
+    """download_iter を最後まで実行し、{取得方法: 件数} を返す"""
+    counts = {"skip": 0, "append": 0, "full": 0}
+    for _, action in download_iter(remote, local_dir, workers, pattern, bwlimit):
+        counts[action] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='月次ファイルの差分ダウンロード')
+    parser.add_argument('remote', help='rcloneのリモート (例: raspi_data:sensor_data/) またはローカルディレクトリ')
+    parser.add_argument('local_dir', help='ダウンロード先ディレクトリ')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='同時ダウンロード数')
+    parser.add_argument('--bwlimit', type=float, default=None, help='1ファイルあたりの転送速度の上限 (bytes/秒)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    started = time.perf_counter()
+    counts = download_all(args.remote, os.path.expanduser(args.local_dir), args.workers, bwlimit=args.bwlimit)
+    print(f"完了: 変化なし {counts['skip']}件, 追記分のみ {counts['append']}件, 全体 {counts['full']}件 "
+          f"({time.perf_counter() - started:.1f}秒)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+MergeMonthly: 複数の月次ファイル (現行ファイル・recover_data の復元ファイル・バックアップ) を
+タイムスタンプで k-way マージし、重複を除いて対象ファイルをアトミックに置き換える。
+
+recover_data の復元ファイルを cp で上書きすると、現行ファイルにしか無い行が失われる。
+ここでは対象ファイル自身も入力に含めてマージするため、どの入力にある行も残る。
+- 入力はそれぞれ時刻順であること (月次ファイル・復元ファイル・スナップショットはいずれも時刻順)。
+  heapq.merge で各入力から1行ずつ読むため、メモリは入力の数に比例するだけで、時間は総行数に比例する
+- 同じタイムスタンプの行が複数ある場合は、優先順位の高い入力の行を残す。
+  優先順位は 対象ファイル → --source に指定した順 (--prefer-sources で対象ファイルを最後にする)。
+  同じ入力の中の重複は先に現れた行を残す
+- タイムスタンプは旧フォーマット (HH:MM) と v6 フォーマット (HH:MM:SS) をそろえて比較する。
+  --by-minute を指定すると分単位で比較し、同じ分に記録された行を1行にまとめる
+- 時刻順でない入力はエラーにする (--dry-run で事前に確認できる)。解釈できない行は読み飛ばして件数を表示する
+- 対象ファイルと同じディレクトリの一時ファイルに書き、fsync してから rename する。
+  サイドカー索引 (monthly_index) があれば作り直す
+
+使い方:
+    python merge_monthly.py /home/hideo_81_g/sensor_data/temp_humid_2025-12.txt \\
+        --source recovered_temp_humid_2025-12.txt snapshots/latest/temp_humid_2025-12.txt
+    python merge_monthly.py temp_humid_2025-07.txt --by-minute --dry-run
+"""
+import argparse
+import gzip
+import heapq
+import logging
+import os
+import sys
+import time
+
+import monthly_index
+import sensor_query
+
+logger = logging.getLogger(__name__)
+
+TEMP_SUFFIX = ".merge.tmp"
+
+
+def _open(path):
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+def iter_source(path, rank, stats, by_minute=False):
+    """
+    1つの入力から (比較キー, 優先順位, 行番号, 行) を時刻順に返す。
+    行は末尾の CR/LF を取り除いて LF をつけ直す。'#' で始まる行 (デバイスのヘッダーなど) は
+    stats["headers"] に集め、解釈できない行は stats["invalid"] に数える
+    """
+    width = 16 if by_minute else sensor_query.KEY_LENGTH
+    previous = b""
+    with _open(path) as f:
+        for number, raw in enumerate(f, 1):
+            line = raw.rstrip(b"\r\n")
+            if not line:
+                continue
+            if line.startswith(b"#"):
+                if stats["rows"] == 0:
+                    stats["headers"].append(line + b"\n")
+                continue
+            key = sensor_query.line_key(line, 0)
+            if key is None:
+                stats["invalid"] += 1
+                continue
+            key = key[:width]
+            if key < previous:
+                raise ValueError(
+                    f"{path}: {number}行目が時刻順ではありません ({previous.decode()} の後に {key.decode()})")
+            previous = key
+            stats["rows"] += 1
+            yield key, rank, number, line + b"\n"
+
+
+def merge_lines(sources, stats, by_minute=False):
+    """
+    優先順位の順に並べた入力をマージし、タイムスタンプごとに1行 (最も優先順位の高い入力の行) を返す。
+    stats は入力ごとの件数 (rows / kept / invalid / headers) を入れる辞書のリスト
+    """
+    streams = [iter_source(path, rank, stats[rank], by_minute) for rank, path in enumerate(sources)]
+    previous = None
+    for key, rank, _, line in heapq.merge(*streams):
+        if key == previous:
+            continue
+        previous = key
+        stats[rank]["kept"] += 1
+        yield line
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _write_atomic(target, lines, headers_from):
+    """lines を対象ファイルと同じディレクトリの一時ファイルに書き、fsync してから置き換える"""
+    temp_path = target + TEMP_SUFFIX
+    try:
+        with open(temp_path, "wb") as f:
+            first = next(lines, None)
+            # ヘッダー行は、最初の行を読んだ時点で集まっている (優先順位の最も高い入力のものを使う)
+            for stats in headers_from:
+                if stats["headers"]:
+                    f.writelines(stats["headers"])
+                    break
+            if first is not None:
+                f.write(first)
+                f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(target):
+            os.chmod(temp_path, os.stat(target).st_mode & 0o7777)
+        os.replace(temp_path, target)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    _fsync_dir(os.path.dirname(os.path.abspath(target)))
+
+
+def merge(target, sources, prefer_sources=False, by_minute=False, dry_run=False):
+    """
+    target と sources をマージして target を置き換える (dry_run なら書かずに件数だけ数える)。
+    戻り値: [(入力のパス, 入力ごとの件数の辞書), ...] (優先順位の順)
+    """
+    inputs = [path for path in sources if os.path.abspath(path) != os.path.abspath(target)]
+    if os.path.exists(target):
+        inputs = inputs + [target] if prefer_sources else [target] + inputs
+    missing = [path for path in inputs if not os.path.exists(path)]
+    if missing:
+        raise FileNotFoundError(f"入力が見つかりません: {', '.join(missing)}")
+    stats = [{"rows": 0, "kept": 0, "invalid": 0, "headers": []} for _ in inputs]
+    lines = merge_lines(inputs, stats, by_minute)
+
+    started = time.perf_counter()
+    if dry_run:
+        for _ in lines:
+            pass
+    else:
+        _write_atomic(target, lines, stats)
+        if os.path.exists(monthly_index.index_path_for(target)):
+            # 途中の行が変わっているので差分更新ではなく作り直す
+            os.remove(monthly_index.index_path_for(target))
+            monthly_index.update_index(target)
+    total = sum(s["kept"] for s in stats)
+    logger.info(f"マージ: {sum(s['rows'] for s in stats):,}行 → {total:,}行 "
+                f"({time.perf_counter() - started:.2f}秒){' (dry-run)' if dry_run else ''}")
+    return list(zip(inputs, stats))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='月次ファイルを重複なしでマージし、対象ファイルを置き換える')
+    parser.add_argument('target', help='置き換える月次ファイル (存在すれば入力にも含める)')
+    parser.add_argument('--source', nargs='+', default=[], help='マージする入力 (優先順位の高い順。.gz も可)')
+    parser.add_argument('--prefer-sources', action='store_true',
+                        help='同じタイムスタンプでは対象ファイルより --source の行を優先する')
+    parser.add_argument('--by-minute', action='store_true', help='分単位で重複を判定する')
+    parser.add_argument('--dry-run', action='store_true', help='置き換えずに件数だけ表示する')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        results = merge(args.target, args.source, args.prefer_sources, args.by_minute, args.dry_run)
+    except (FileNotFoundError, ValueError) as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+    for path, stats in results:
+        print(f"  {path}: {stats['rows']:,}行中 {stats['kept']:,}行を採用"
+              + (f", 解釈できない行 {stats['invalid']:,}" if stats['invalid'] else ""))
+    total = sum(stats['kept'] for _, stats in results)
+    if args.dry_run:
+        print(f"マージ後 {total:,}行 (dry-run のため {args.target} は変更していません)")
+    else:
+        print(f"{args.target} を置き換えました ({total:,}行)")
+
+
+if __name__ == "__main__":
+    main()
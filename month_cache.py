@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+MonthCache: 解析済みの月次ファイルを列形式 (NumPy .npz) で保存する共有キャッシュ。
+
+- キーは月次ファイルの内容の SHA-256 と monthly_parser の解析規則の版。ファイルが追記・書き換えされるとハッシュが変わるため、
+  古いキャッシュは自動的に使われなくなる (同じ場所・同じファイル名の古い版は保存時に削除する。
+  デバイスごとのフォルダにある同名の月次ファイルは、フォルダのハッシュで区別する)
+- 値は monthly_parser.parse_file の結果 (timestamp / temperature / humidity の配列と不正行数) で、
+  範囲チェック前の生の解析結果を持つ。範囲チェックなどは呼び出し側で行う
+- キャッシュディレクトリの合計サイズが上限を超えたら、最後に使われたのが古い順に削除する (LRU)
+- 書き込みは一時ファイルに書いてから rename するため、並列に解析するプロセスから同時に使っても壊れない
+
+load_month / load_dataframe を呼べば、キャッシュがあればそれを、なければ解析して保存した結果を返す。
+
+使い方:
+    python month_cache.py ~/sensor_data_downloads/temp_humid_*.txt   # キャッシュを作る
+    python month_cache.py --benchmark temp_humid_2025-08.txt          # 解析とキャッシュ読み込みの比較
+    python month_cache.py --clear
+"""
+import argparse
+import glob
+import hashlib
+import logging
+import os
+import time
+
+import numpy as np
+
+import monthly_parser
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.environ.get('SENSOR_CACHE_DIR', os.path.expanduser('~/.cache/sensor_months'))
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+CACHE_SUFFIX = ".npz"
+
+
+def file_digest(path):
+    """月次ファイルの内容の SHA-256 (16進)"""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _source_prefix(path):
+    """<元のファイル名>.<フォルダのハッシュ8桁>. (同じ元ファイルの版を見分けるための接頭辞)"""
+    folder = hashlib.sha256(os.fsencode(os.path.dirname(os.path.abspath(path)))).hexdigest()[:8]
+    return f"{os.path.basename(path)}.{folder}."
+
+
+def cache_path(path, digest, cache_dir=None):
+    """キャッシュファイルのパス: <元のファイル名>.<フォルダのハッシュ>.<内容のハッシュ>.r<解析規則の版>.npz
+
+    解析規則の版 (monthly_parser.RULES_VERSION) を含めるため、受け付ける行の規則が変わると
+    古い規則で解析したキャッシュは使われなくなる。
+    """
+    name = f"{_source_prefix(path)}{digest}.r{monthly_parser.RULES_VERSION}{CACHE_SUFFIX}"
+    return os.path.join(cache_dir or DEFAULT_CACHE_DIR, name)
+
+
+def _read_entry(entry_path):
+    with np.load(entry_path) as data:
+        result = monthly_parser.ParseResult(
+            data["timestamp"], data["temperature"], data["humidity"],
+            int(data["rejected"]), int(data["consumed"]),
+        )
+    # 最終利用時刻として更新時刻を進める (LRU の順序に使う)
+    os.utime(entry_path)
+    return result
+
+
+def _write_entry(entry_path, result):
+    temp_path = f"{entry_path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        np.savez(f, timestamp=result.timestamp, temperature=result.temperature, humidity=result.humidity,
+                 rejected=np.int64(result.rejected), consumed=np.int64(result.consumed))
+    os.replace(temp_path, entry_path)
+
+
+def _entries(cache_dir):
+    try:
+        with os.scandir(cache_dir) as it:
+            return [entry for entry in it if entry.is_file() and entry.name.endswith(CACHE_SUFFIX)]
+    except FileNotFoundError:
+        return []
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def evict(cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+    """合計サイズが max_bytes 以下になるまで、最後に使われたのが古いキャッシュから削除する。削除件数を返す"""
+    entries = []
+    for entry in _entries(cache_dir or DEFAULT_CACHE_DIR):
+        try:
+            st = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime_ns, st.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        _remove(path)
+        total -= size
+        removed += 1
+    return removed
+
+
+def load_month(path, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    月次ファイル全体の解析結果 (monthly_parser.ParseResult) を返す。
+    内容が同じファイルのキャッシュがあればそれを読み、なければ解析してキャッシュに保存する。
+    """
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    digest = file_digest(path)
+    entry_path = cache_path(path, digest, cache_dir)
+    try:
+        return _read_entry(entry_path)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"キャッシュ '{entry_path}' を読めません。解析し直します: {e}")
+
+    result = monthly_parser.parse_file(path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # 同じ元ファイルの古い版 (追記前など) はもう使われないため先に削除する
+        prefix = _source_prefix(path)
+        for entry in _entries(cache_dir):
+            if entry.name.startswith(prefix) and entry.path != entry_path:
+                _remove(entry.path)
+        _write_entry(entry_path, result)
+        evict(cache_dir, max_bytes)
+    except OSError as e:
+        logger.warning(f"キャッシュ '{entry_path}' を保存できません: {e}")
+    return result
+
+
+def load_dataframe(path, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+    """load_month の結果を (timestamp, temperature, humidity) の DataFrame で返す"""
+    return monthly_parser.to_dataframe(load_month(path, cache_dir, max_bytes))
+
+
+def clear(cache_dir=None):
+    """キャッシュを全て削除し、削除件数を返す"""
+    entries = _entries(cache_dir or DEFAULT_CACHE_DIR)
+    for entry in entries:
+        _remove(entry.path)
+    return len(entries)
+
+
+def usage(cache_dir=None):
+    """(キャッシュ件数, 合計バイト数)"""
+    entries = _entries(cache_dir or DEFAULT_CACHE_DIR)
+    return len(entries), sum(entry.stat().st_size for entry in entries)
+
+
+# --- ベンチマーク ---
+
+def run_benchmark(path, cache_dir=None):
+    """解析 (monthly_parser) と、キャッシュの作成・読み込みにかかる時間を比較する"""
+    size = os.path.getsize(path)
+    t0 = time.perf_counter()
+    parsed = monthly_parser.parse_file(path)
+    parse_sec = time.perf_counter() - t0
+
+    cache_dir = cache_dir or DEFAULT_CACHE_DIR
+    _remove(cache_path(path, file_digest(path), cache_dir))
+    t0 = time.perf_counter()
+    load_month(path, cache_dir)
+    miss_sec = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    cached = load_month(path, cache_dir)
+    hit_sec = time.perf_counter() - t0
+
+    assert np.array_equal(cached.timestamp, parsed.timestamp)
+    print(f"入力: {path}, {len(parsed.timestamp):,}行, {size / 1e6:.1f}MB")
+    print(f"解析のみ:            {parse_sec * 1000:8.1f}ms")
+    print(f"キャッシュ作成:      {miss_sec * 1000:8.1f}ms (解析 + 保存)")
+    print(f"キャッシュ読み込み:  {hit_sec * 1000:8.1f}ms (ハッシュ計算を含む, {parse_sec / hit_sec:.1f}倍)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='解析済み月次ファイルの列形式キャッシュ')
+    parser.add_argument('paths', nargs='*', help='キャッシュを作るファイルまたはディレクトリ')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='キャッシュの保存先')
+    parser.add_argument('--max-mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024), help='キャッシュ全体の上限 (MB)')
+    parser.add_argument('--clear', action='store_true', help='キャッシュを全て削除する')
+    parser.add_argument('--benchmark', type=str, metavar='FILE', help='FILE で解析とキャッシュ読み込みを比較する')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.clear:
+        print(f"キャッシュを {clear(args.cache_dir)} 件削除しました。")
+    elif args.benchmark:
+        run_benchmark(args.benchmark, args.cache_dir)
+    elif args.paths:
+        for path in args.paths:
+            files = sorted(glob.glob(os.path.join(path, 'temp_humid_*.txt'))) if os.path.isdir(path) else [path]
+            for filepath in files:
+                result = load_month(filepath, args.cache_dir, args.max_mb * 1024 * 1024)
+                print(f"{os.path.basename(filepath)}: {len(result.timestamp):,}行")
+        count, total = usage(args.cache_dir)
+        print(f"キャッシュ: {count}件, {total / 1e6:.1f}MB ({args.cache_dir})")
+    else:
+        parser.error('ファイル、--clear または --benchmark を指定してください')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+MonthlyIndex: 月次データファイル (temp_humid_YYYY-MM.txt) のサイドカー索引。
+
+月次ファイルの横に `temp_humid_YYYY-MM.txt.idx.json` を置き、以下を保持する。
+- 先頭/末尾タイムスタンプ (min/max) と時系列順に並んでいるか
+- 行数・不正行数・索引済みバイト長 (最後の改行まで)
+- 固定長ブロックごとのSHA-256 (完結したブロック) と、末尾の未完ブロックのSHA-256
+- 日ごとの先頭行バイトオフセットと行番号
+
+SensorCopier が追記のたびに `update_index()` を呼び、前回の索引済み位置から
+末尾までだけを読んで差分更新する。下流ツール (unified_importer 等) は
+`load_index()` で索引を読み、ファイル本体を読まずにスキップ/シークできる。
+
+RPi (Python 3.7 / 標準ライブラリのみ) でも動くよう外部依存は持たない。
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+from datetime import datetime
+
+logger = logging.getLogger("SensorCopier.MonthlyIndex")
+
+INDEX_SUFFIX = ".idx.json"
+INDEX_VERSION = 2
+
+# ブロックチェックサムの単位 (64KiB ≒ 秒ありフォーマットで約1,700行)
+BLOCK_SIZE = 64 * 1024
+
+# 差分スキャン時の読み込み単位
+READ_CHUNK_SIZE = 1024 * 1024
+
+# REQ-01.1: 旧フォーマット (HH:MM) と v6 フォーマット (HH:MM:SS) の両対応
+_TIMESTAMP_RE = re.compile(rb"^(\d{4}-\d{2}-\d{2}) (\d{2}:\d{2})(:\d{2})?,")
+
+
+def index_path_for(monthly_path):
+    """月次ファイルに対応するサイドカー索引のパスを返す"""
+    return monthly_path + INDEX_SUFFIX
+
+
+def parse_line_timestamp(line):
+    """
+    1行 (bytes) からタイムスタンプを取り出し "YYYY-MM-DD HH:MM:SS" に正規化する。
+    旧フォーマットの秒なし行は ":00" を補う。解釈できない行は None。
+    """
+    m = _TIMESTAMP_RE.match(line)
+    if not m:
+        return None
+    seconds = m.group(3) or b":00"
+    return (m.group(1) + b" " + m.group(2) + seconds).decode("ascii")
+
+
+def normalize_timestamp(value):
+    """datetime / pandas.Timestamp / 文字列を索引と比較可能な文字列に正規化する"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    ts = parse_line_timestamp(str(value).strip().encode("ascii", "ignore") + b",")
+    if ts is None:
+        raise ValueError(f"タイムスタンプを解釈できません: {value!r}")
+    return ts
+
+
+def _new_index(monthly_path):
+    return {
+        "version": INDEX_VERSION,
+        "file": os.path.basename(monthly_path),
+        "block_size": BLOCK_SIZE,
+        "byte_length": 0,
+        "line_count": 0,
+        "malformed_lines": 0,
+        "first_timestamp": None,
+        "last_timestamp": None,
+        "tail_timestamp": None,
+        "sorted": True,
+        "block_sha256": [],
+        "tail_sha256": None,
+        "day_offsets": {},
+        "updated_at": None,
+    }
+
+
+def _is_compatible(index, monthly_path, file_size):
+    """既存索引が差分更新の起点として使えるか判定する"""
+    if not isinstance(index, dict):
+        return False
+    if index.get("version") != INDEX_VERSION or index.get("block_size") != BLOCK_SIZE:
+        return False
+    if index.get("file") != os.path.basename(monthly_path):
+        return False
+    # ファイルが索引より短い = 復元・上書きされた可能性 → 再構築
+    return index.get("byte_length", 0) <= file_size
+
+
+def _read_index_file(index_path):
+    try:
+        with open(index_path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"索引ファイルの読み込みに失敗。再構築します: {index_path} ({e})")
+        return None
+
+
+def _write_index_file(index_path, index):
+    """update_latest_file と同じく .tmp 経由でアトミックに書き込む"""
+    temp_path = index_path + ".tmp"
+    try:
+        with open(temp_path, "w") as f:
+            json.dump(index, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(temp_path, index_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _account_line(index, line, offset):
+    """完結した1行 (改行を含まない bytes) を索引に反映する"""
+    line_no = index["line_count"]
+    index["line_count"] = line_no + 1
+
+    ts = parse_line_timestamp(line)
+    if ts is None:
+        index["malformed_lines"] += 1
+        return
+
+    if index["first_timestamp"] is None or ts < index["first_timestamp"]:
+        index["first_timestamp"] = ts
+    if index["last_timestamp"] is None or ts > index["last_timestamp"]:
+        index["last_timestamp"] = ts
+    if index["tail_timestamp"] is not None and ts < index["tail_timestamp"]:
+        index["sorted"] = False
+    index["tail_timestamp"] = ts
+
+    day = ts[:10]
+    if day not in index["day_offsets"]:
+        index["day_offsets"][day] = [offset, line_no]
+
+
+def _scan_lines(f, index, file_size):
+    """索引済み位置から末尾の改行までを読み、行統計を更新する"""
+    offset = index["byte_length"]
+    f.seek(offset)
+    pending = b""
+    pending_offset = offset
+    remaining = file_size - offset
+    while remaining > 0:
+        chunk = f.read(min(READ_CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        buf = pending + chunk
+        start = 0
+        while True:
+            nl = buf.find(b"\n", start)
+            if nl < 0:
+                break
+            line = buf[start:nl].rstrip(b"\r")
+            if line:
+                _account_line(index, line, pending_offset + start)
+            start = nl + 1
+        pending = buf[start:]
+        pending_offset += start
+    # 改行で終わっていない末尾 (書き込み途中・停電) は次回に持ち越す
+    index["byte_length"] = pending_offset
+
+
+def _hash_new_blocks(f, index):
+    """索引済み範囲内で新たに完結したブロックのハッシュを追加する"""
+    complete_blocks = index["byte_length"] // BLOCK_SIZE
+    hashes = index["block_sha256"]
+    del hashes[complete_blocks:]
+    for block_no in range(len(hashes), complete_blocks):
+        f.seek(block_no * BLOCK_SIZE)
+        hashes.append(hashlib.sha256(f.read(BLOCK_SIZE)).hexdigest())
+
+    # 末尾の未完ブロック (最大 BLOCK_SIZE 未満) は毎回ハッシュし直す
+    tail_start = complete_blocks * BLOCK_SIZE
+    f.seek(tail_start)
+    index["tail_sha256"] = hashlib.sha256(f.read(index["byte_length"] - tail_start)).hexdigest()
+
+
+def build_index(monthly_path, base=None):
+    """
+    月次ファイルの索引を構築する。
+    base に既存索引を渡すと、その byte_length 以降だけを読んで差分更新する。
+    """
+    file_size = os.path.getsize(monthly_path)
+    if base is not None and _is_compatible(base, monthly_path, file_size):
+        index = base
+        index["day_offsets"] = dict(index.get("day_offsets", {}))
+        index["block_sha256"] = list(index.get("block_sha256", []))
+    else:
+        index = _new_index(monthly_path)
+
+    with open(monthly_path, "rb") as f:
+        _scan_lines(f, index, file_size)
+        _hash_new_blocks(f, index)
+    index["updated_at"] = datetime.now().astimezone().isoformat(timespec="seconds")
+    return index
+
+
+def update_index(monthly_path):
+    """
+    DataWriter から追記後に呼ばれる差分更新。
+    既存索引があれば未索引部分のみ読み、索引を .tmp 経由で書き戻す。
+    月次ファイルが存在しない場合は None を返す。
+    """
+    if not os.path.exists(monthly_path):
+        return None
+    index_path = index_path_for(monthly_path)
+    base = _read_index_file(index_path)
+    index = build_index(monthly_path, base=base)
+    _write_index_file(index_path, index)
+    logger.info(
+        f"索引更新完了: {index['line_count']}行, {index['byte_length']}byte, "
+        f"{index['first_timestamp']} - {index['last_timestamp']} ({os.path.basename(index_path)})"
+    )
+    return index
+
+
+def load_index(monthly_path, require_fresh=True):
+    """
+    下流ツール向け: 索引を読み込む。
+    require_fresh=True の場合、索引がファイル末尾まで追いついていなければ None を返す
+    (索引にない新しい行がある可能性があるため、スキップ判定に使えない)。
+    """
+    index = _read_index_file(index_path_for(monthly_path))
+    if index is None or index.get("version") != INDEX_VERSION:
+        return None
+    if index.get("file") != os.path.basename(monthly_path):
+        return None
+    if require_fresh:
+        try:
+            if os.path.getsize(monthly_path) != index.get("byte_length"):
+                return None
+        except OSError:
+            return None
+    return index
+
+
+def has_data_after(index, timestamp):
+    """索引上、timestamp より新しい行が存在し得るか (False なら読まずにスキップ可能)"""
+    if timestamp is None or index.get("last_timestamp") is None:
+        return index.get("line_count", 0) > 0
+    return index["last_timestamp"] > normalize_timestamp(timestamp)
+
+
+def seek_offset_for(index, timestamp):
+    """
+    timestamp 以降の行を読むための開始バイトオフセットを返す。
+    時系列順のファイルでのみ、timestamp の日の先頭行 (以前で最も近い日) を返す。
+    順序が保証できない場合は 0 (先頭から読む)。
+    """
+    if timestamp is None or not index.get("sorted"):
+        return 0
+    day = normalize_timestamp(timestamp)[:10]
+    offset = 0
+    for key in sorted(index.get("day_offsets", {})):
+        if key > day:
+            break
+        offset = index["day_offsets"][key][0]
+    return offset
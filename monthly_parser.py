@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+MonthlyParser: 月次データ形式 `YYYY-MM-DD HH:MM[:SS],tmp=X,hum=Y` 専用のベクトル化パーサー。
+
+生バイト列を NumPy 配列として1回走査し、
+- 改行位置から行の開始・終了位置を求め
+- 固定位置の数字からタイムスタンプ (秒なし旧形式 / 秒ありv6形式の両方, REQ-01.1) を組み立て
+- カンマ位置から tmp= / hum= の数値部分を切り出して桁演算で float に変換する
+ため、pandas.read_csv + 正規表現 + str.split + 書式推定つき to_datetime の多段処理が不要になる。
+
+不正な行 (形式違い・存在しない日付・数値でない値) は除外し、件数を rejected として返す。
+値は従来の取り込み (正規表現 `tmp=\d+\.\d`) と同じく「数字.数字」の形だけを受け付ける。
+整数 ("tmp=29")・符号つき ("tmp=-3.2")・小数点で始まる/終わる値は不正行とする
+(SensorCopier は常に小数点つきで書くため、これらは壊れた行とみなす)。
+値の範囲チェック (異常値除去) は呼び出し側 (unified_importer) の責務とする。
+
+使い方 (ベンチマーク):
+    python monthly_parser.py --benchmark temp_humid_2025-08.txt --scale 200
+"""
+import argparse
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+
+ParseResult = namedtuple("ParseResult", ["timestamp", "temperature", "humidity", "rejected", "consumed"])
+
+# 数値部分の最大桁数 (小数点を含む)。これを超える値は不正行として扱う
+MAX_NUMBER_WIDTH = 10
+
+# 受け付ける行の規則の版。規則を変えたら上げる (month_cache のキャッシュのキーに含める)
+RULES_VERSION = 2
+
+# 1回に解析するバイト数の既定値 (iter_file_chunks)
+DEFAULT_CHUNK_BYTES = 8 * 1024 * 1024
+
+_ZERO, _NINE = ord("0"), ord("9")
+_COMMA, _DOT, _SPACE, _COLON, _HYPHEN = map(ord, ",. :-")
+_CR = ord("\r")
+_HASH = ord("#")
+
+_TMP_PREFIX = np.frombuffer(b"tmp=", dtype=np.uint8)
+_HUM_PREFIX = np.frombuffer(b"hum=", dtype=np.uint8)
+
+
+def empty_result(rejected=0, consumed=0):
+    return ParseResult(
+        np.empty(0, dtype="datetime64[s]"), np.empty(0, dtype=np.float64),
+        np.empty(0, dtype=np.float64), rejected, consumed,
+    )
+
+
+def _gather(arr, positions):
+    """範囲外を 0 として arr[positions] を取り出す"""
+    valid = (positions >= 0) & (positions < len(arr))
+    return np.where(valid, arr[np.clip(positions, 0, max(len(arr) - 1, 0))], 0)
+
+
+def _digits(arr, starts, offsets):
+    """行頭からの固定オフセット群の数字を読み、(値, 全桁が数字か) を返す"""
+    value = np.zeros(len(starts), dtype=np.int64)
+    ok = np.ones(len(starts), dtype=bool)
+    for offset in offsets:
+        c = _gather(arr, starts + offset).astype(np.int64)
+        ok &= (c >= _ZERO) & (c <= _NINE)
+        value = value * 10 + (c - _ZERO)
+    return value, ok
+
+
+def _parse_numbers(arr, begin, end):
+    """
+    [begin, end) の数値テキスト (例: "29.1", "3.25") を一括で float64 に変換する。
+    桁を整数として積み上げてから 10**小数桁 で割るため、float() と同じ値になる。
+    有効なのは「数字.数字」の形だけ (従来の取り込みと同じ。整数・符号つきは不正)。
+    戻り値: (値, 有効フラグ)
+    """
+    n = len(begin)
+    width = end - begin
+    cols = np.arange(MAX_NUMBER_WIDTH)
+    in_field = cols[None, :] < width[:, None]
+    chars = np.where(in_field, _gather(arr, begin[:, None] + cols[None, :]), 0).astype(np.int64)
+
+    is_digit = (chars >= _ZERO) & (chars <= _NINE) & in_field
+    is_dot = (chars == _DOT) & in_field
+
+    dot_count = is_dot.sum(axis=1)
+    digit_count = is_digit.sum(axis=1)
+    dot_pos = is_dot.argmax(axis=1)
+    # 小数点がちょうど1つで、その前後に数字が1桁以上ある
+    valid = ((width > 0) & (width <= MAX_NUMBER_WIDTH) &
+             ((is_digit | is_dot) == in_field).all(axis=1) &
+             (dot_count == 1) & (dot_pos >= 1) & (dot_pos <= width - 2) & (digit_count <= 15))
+
+    mantissa = np.zeros(n, dtype=np.int64)
+    for j in range(MAX_NUMBER_WIDTH):
+        mantissa = np.where(is_digit[:, j], mantissa * 10 + (chars[:, j] - _ZERO), mantissa)
+    frac_digits = np.clip(width - 1 - dot_pos, 0, MAX_NUMBER_WIDTH)
+    return mantissa / np.power(10.0, frac_digits), valid
+
+
+def _civil_to_datetime64(year, month, day, hour, minute, second):
+    """年月日時分秒の整数配列を datetime64[s] に変換し、(値, 実在する日時か) を返す"""
+    valid = ((month >= 1) & (month <= 12) & (day >= 1) & (day <= 31) &
+             (hour < 24) & (minute < 60) & (second < 60) & (year >= 1970))
+    months = np.where(valid, (year - 1970) * 12 + (month - 1), 0).astype("datetime64[M]")
+    days = months.astype("datetime64[D]") + np.where(valid, day - 1, 0).astype("timedelta64[D]")
+    # 2月30日などは翌月に繰り上がるため、月が変わったものを不正とする
+    valid &= days.astype("datetime64[M]") == months
+    ts = days.astype("datetime64[s]") + (hour * 3600 + minute * 60 + second).astype("timedelta64[s]")
+    return ts, valid
+
+
+def parse_bytes(buf, final=True):
+    """
+    月次形式のバイト列を一括解析する。
+    final=False の場合、最後の改行より後ろ (書き込み途中の行) は解析せず consumed に含めない。
+    戻り値: ParseResult(timestamp: datetime64[s], temperature: float64, humidity: float64,
+                         rejected: 不正行数, consumed: 解析したバイト数)
+    """
+    arr = np.frombuffer(buf, dtype=np.uint8)
+    newlines = np.flatnonzero(arr == ord("\n"))
+    if final and len(arr) and (len(newlines) == 0 or newlines[-1] != len(arr) - 1):
+        newlines = np.append(newlines, len(arr))
+    if len(newlines) == 0:
+        return empty_result(consumed=len(arr) if final else 0)
+    consumed = min(int(newlines[-1]) + 1, len(arr))
+
+    starts = np.concatenate(([0], newlines[:-1] + 1)).astype(np.int64)
+    ends = newlines.astype(np.int64)
+    # CRLF の \r を除く
+    ends = ends - (_gather(arr, ends - 1) == _CR) * (ends > starts)
+    # 空行と "#" で始まるヘッダー行 (例: "# device: pi-02") は解析対象にも不正行にも含めない
+    content = (ends > starts) & (_gather(arr, starts) != _HASH)
+    starts, ends = starts[content], ends[content]
+    if len(starts) == 0:
+        return empty_result(consumed=consumed)
+
+    # --- タイムスタンプ: "YYYY-MM-DD HH:MM" + 任意の ":SS" ---
+    has_seconds = _gather(arr, starts + 16) == _COLON
+    year, ok_y = _digits(arr, starts, (0, 1, 2, 3))
+    month, ok_mo = _digits(arr, starts, (5, 6))
+    day, ok_d = _digits(arr, starts, (8, 9))
+    hour, ok_h = _digits(arr, starts, (11, 12))
+    minute, ok_mi = _digits(arr, starts, (14, 15))
+    second, ok_s = _digits(arr, starts, (17, 18))
+    second = np.where(has_seconds, second, 0)
+    layout_ok = ((_gather(arr, starts + 4) == _HYPHEN) & (_gather(arr, starts + 7) == _HYPHEN) &
+                 (_gather(arr, starts + 10) == _SPACE) & (_gather(arr, starts + 13) == _COLON))
+    ts_ok = ok_y & ok_mo & ok_d & ok_h & ok_mi & (ok_s | ~has_seconds) & layout_ok
+    ts, date_ok = _civil_to_datetime64(year, month, day, hour, minute, second)
+
+    # --- 値: ",tmp=X,hum=Y" ---
+    first_comma = starts + np.where(has_seconds, 19, 16)
+    # 末尾に番兵 (len(arr)) を置き、カンマが1つも無いバッファでも索引が空配列にならないようにする。
+    # 番兵を2つ目のカンマとして指した行は second_comma < ends を満たさず不正行になる
+    commas = np.append(np.flatnonzero(arr == _COMMA), len(arr))
+    # 各行の2つ目のカンマ (最初のカンマより後ろで最初のもの)
+    second_idx = np.searchsorted(commas, first_comma + 1)
+    second_comma = commas[np.minimum(second_idx, len(commas) - 1)]
+    third_comma = commas[np.minimum(second_idx + 1, len(commas) - 1)]
+
+    structure_ok = ((_gather(arr, first_comma) == _COMMA) & (second_comma > first_comma) &
+                    (second_comma < ends) & (third_comma >= ends))
+    for k in range(4):
+        structure_ok &= _gather(arr, first_comma + 1 + k) == _TMP_PREFIX[k]
+        structure_ok &= _gather(arr, second_comma + 1 + k) == _HUM_PREFIX[k]
+
+    temperature, tmp_ok = _parse_numbers(arr, first_comma + 5, second_comma)
+    humidity, hum_ok = _parse_numbers(arr, second_comma + 5, ends)
+
+    valid = ts_ok & date_ok & structure_ok & tmp_ok & hum_ok
+    return ParseResult(ts[valid], temperature[valid], humidity[valid], int((~valid).sum()), consumed)
+
+
+def parse_file(path, offset=0, end=None):
+    """ファイルの [offset, end) を一括解析する。end=None はファイル末尾まで"""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return parse_bytes(f.read() if end is None else f.read(max(0, end - offset)), final=True)
+
+
+def iter_file_chunks(path, offset=0, chunk_bytes=DEFAULT_CHUNK_BYTES, end=None):
+    """
+    ファイルの [offset, end) を chunk_bytes 単位で読み、行境界で区切って順に解析結果を返す。
+    各結果の consumed はファイル先頭からの絶対オフセット (次に読むべき位置)。
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        pending = b""
+        position = offset
+        while True:
+            size = chunk_bytes if end is None else max(0, min(chunk_bytes, end - position - len(pending)))
+            chunk = f.read(size) if size else b""
+            final = not chunk
+            buf = pending + chunk
+            if not buf:
+                return
+            result = parse_bytes(buf, final=final)
+            pending = buf[result.consumed:]
+            position += result.consumed
+            yield result._replace(consumed=position)
+            if final:
+                return
+
+
+def to_dataframe(result):
+    """解析結果を unified_importer の列構成 (timestamp, temperature, humidity) の DataFrame にする"""
+    import pandas as pd
+    return pd.DataFrame({
+        "timestamp": result.timestamp.astype("datetime64[ns]"),
+        "temperature": result.temperature,
+        "humidity": result.humidity,
+    })
+
+
+# --- ベンチマーク ---
+
+def run_benchmark(path, scale):
+    """path の内容を scale 回連結したデータで、旧パス (read_csv + 正規表現) と行/秒を比較する"""
+    import io
+    import pandas as pd
+    import unified_importer
+
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.endswith(b"\n"):
+        data += b"\n"
+    data = data * scale
+    line_count = data.count(b"\n")
+    print(f"入力: {path} x {scale} = {line_count:,}行, {len(data) / 1e6:.1f}MB")
+
+    t0 = time.perf_counter()
+    df_raw = pd.read_csv(io.BytesIO(data), header=None, names=['datetime_str', 'temperature_str', 'humidity_str'],
+                         na_filter=False, skip_blank_lines=True)
+    legacy = unified_importer.preprocess_data(df_raw)
+    legacy_sec = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    result = parse_bytes(data)
+    df = unified_importer.filter_valid_range(to_dataframe(result))
+    new_sec = time.perf_counter() - t0
+
+    print(f"旧パス (read_csv + 正規表現 + to_datetime): {legacy_sec:.3f}秒, {len(legacy) / legacy_sec:,.0f}行/秒, {len(legacy):,}行")
+    print(f"新パーサー (ベクトル化1パス):              {new_sec:.3f}秒, {len(df) / new_sec:,.0f}行/秒, {len(df):,}行 (不正 {result.rejected}行)")
+    print(f"高速化: {legacy_sec / new_sec:.1f}倍")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='月次データ形式のベクトル化パーサー')
+    parser.add_argument('--benchmark', type=str, metavar='FILE', help='FILE を連結して旧パスと比較する')
+    parser.add_argument('--scale', type=int, default=100, help='ベンチマーク時の連結回数')
+    parser.add_argument('path', nargs='?', help='解析して件数を表示するファイル')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        run_benchmark(args.benchmark, args.scale)
+    elif args.path:
+        result = parse_file(args.path)
+        print(f"{os.path.basename(args.path)}: 有効 {len(result.timestamp):,}行, 不正 {result.rejected:,}行")
+    else:
+        parser.error('ファイルまたは --benchmark を指定してください')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,61 +1,320 @@
-import re
+#!/usr/bin/env python3
+"""
+RecoverData: コピア/同期スクリプトのログから月次ファイルの行を復元する。
+
+ログの "月次ファイルに追記: <行>" (v1) / "RAMバッファの月次ファイルに追記: <行>" (v2 以降) から
+データ行を取り出し、時刻順・重複なしの月次ファイル (recovered_temp_humid_YYYY-MM.txt) を作る。
+
+- ログディレクトリからローテーション済みのログ (*.log, *.log.1 …, gzip 圧縮の *.gz) をすべて探す
+- ログごとにプロセスを分けて並列に走査する。非圧縮のログは mmap し、bytes のまま正規表現で探す
+  (gzip はチャンクごとに展開して同じ正規表現をかける)
+- 任意の月 (--month) や期間 (--start / --end、sensor_query と同じ解釈) を復元できる
+- 見つけた行は RUN_LINES 行ごとにソート・重複除去して一時ファイル (ラン) に書き出し、
+  最後にすべてのランをマージする (外部マージ)。メモリはログの量によらず RUN_LINES 行 × プロセス数
+
+使い方:
+    python recover_data.py --month 2025-12
+    python recover_data.py --log-dir ~/logs --start 2025-12-13 --end 2025-12-20 --output-dir ~/recovered
+    python recover_data.py --logs sensor_copier_v2.log sensor_copier_v3.log.1.gz
+"""
+import argparse
+import calendar
+import gzip
+import heapq
+import mmap
 import os
+import re
+import sys
+import tempfile
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import sensor_query
+
+# ログの置き場所 (コピア/同期スクリプトの LOG_DIR)
+DEFAULT_LOG_DIR = "/home/hideo_81_g/logs"
+
+# 復元したファイルの適用先 (月次ファイルの置き場所)
+DATA_DIR = "/home/hideo_81_g/sensor_data"
+
+# 復元データの出力ファイル名
+OUTPUT_FILE_TEMPLATE = "recovered_" + sensor_query.MONTHLY_FILE_TEMPLATE
+
+# sensor_sync.log, sensor_copier_v6.log.2, sensor_copier_v3.log.gz など
+LOG_NAME_RE = re.compile(r"^sensor_\w+\.log(?:\.(?P<rotation>\d+))?(?:\.gz)?$")
+
+# "月次ファイルに追記:" の後ろのデータ (v1 と "RAMバッファの…" の両方に一致する)
+MARKER = "月次ファイルに追記:".encode("utf-8")
+
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+# 1ランに溜める行数 (約 50 バイト/行なので 20 万行で 10MB 程度)
+RUN_LINES = 200000
+# 1回のマージで同時に開くランの数の上限
+MERGE_FAN_IN = 64
+# 1回に正規表現をかける範囲 (ラン1個の行数は最大で RUN_LINES + この範囲の行数)
+SCAN_BYTES = 8 * 1024 * 1024
+
+
+def discover_logs(log_dir):
+    """
+    log_dir にあるログ (ローテーション済み・gzip を含む) のパスを返す。
+    同じログは古い順 (.3 → .2 → .1 → 現行) に並べる
+    """
+    found = []
+    for name in os.listdir(log_dir):
+        match = LOG_NAME_RE.match(name)
+        if match and os.path.isfile(os.path.join(log_dir, name)):
+            base = name[:name.index(".log")]
+            found.append((base, -int(match.group("rotation") or 0), name))
+    return [os.path.join(log_dir, name) for _, _, name in sorted(found)]
+
+
+def range_keys(month=None, start=None, end=None):
+    """復元する期間の正規化キー (bytes) の組。月を指定した場合はその月全体。未指定の端は None"""
+    if month:
+        year, month_number = int(month[:4]), int(month[5:7])
+        start, end = f"{month}-01", f"{month}-{calendar.monthrange(year, month_number)[1]:02d}"
+    start_key = sensor_query.to_key(start) if start else None
+    end_key = sensor_query.to_key(end, end_of_range=True) if end else None
+    return start_key, end_key
+
+
+def compile_pattern(start_key=None, end_key=None):
+    """
+    データ行 ("YYYY-MM-DD HH:MM[:SS],tmp=…,hum=…"、前後の空白・CR を除く) を取り出す bytes 正規表現。
+    期間の両端に共通する接頭辞 (月指定なら "YYYY-MM-") を先読みで課し、期間外の行は正規表現の段階で読み飛ばす。
+    旧フォーマット (秒なし) の行にも一致するよう、接頭辞は "YYYY-MM-DD HH:MM" までにとどめる
+    """
+    prefix = os.path.commonprefix([start_key, end_key])[:16] if start_key and end_key else b""
+    return re.compile(re.escape(MARKER) + rb"[ \t]*((?=" + re.escape(prefix) + rb")"
+                      rb"\d{4}-\d\d-\d\d \d\d:\d\d(?::\d\d)?,tmp=[^,\r\n]*,hum=[^\r\n]*?)[ \t\r]*$",
+                      re.MULTILINE)
+
+
+def _line_key(line):
+    # 旧フォーマット "YYYY-MM-DD HH:MM," は秒 ":00" を補う (sensor_query.line_key と同じ正規化)
+    return line[:19] if line[16:17] == b":" else line[:16] + b":00"
 
-# 読み込むログファイルのリスト
-LOG_FILES = [
-    "/home/hideo_81_g/logs/sensor_copier.log",       # v1系 (12/13以前)
-    "/home/hideo_81_g/logs/sensor_copier_v2.log",    # v2系 (12/13〜12/20)
-    "/home/hideo_81_g/logs/sensor_copier_v3.log"     # v3系 (念のため最新も)
-]
 
-# 復元データの出力先
-OUTPUT_FILE = "recovered_temp_humid_2025-12.txt"
+def _in_range(found, start_key, end_key):
+    """取り出した行のうち期間内のもの"""
+    if start_key is None and end_key is None:
+        return found
+    low = start_key or b""
+    high = end_key or b"\xff"
+    return [line for line in found if low <= _line_key(line) <= high]
+
+
+def _iter_found(path, pattern):
+    """
+    ログから SCAN_BYTES ごとに、一致したデータ行 (bytes) のリストを返す。
+    非圧縮は mmap して行単位で区切った範囲に正規表現をかけ、走査済みのページは手放す。
+    gzip はチャンクごとに展開して同じ正規表現をかける
+    """
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as f:
+            carry = b""
+            while True:
+                chunk = f.read(SCAN_BYTES)
+                if not chunk:
+                    break
+                buf = carry + chunk
+                cut = buf.rfind(b"\n") + 1
+                yield pattern.findall(buf, 0, cut)
+                carry = buf[cut:]
+            yield pattern.findall(carry)
+        return
+    size = os.path.getsize(path)
+    if size == 0:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        pos = 0
+        while pos < size:
+            end = mm.find(b"\n", min(pos + SCAN_BYTES, size) - 1) + 1 or size
+            yield pattern.findall(mm, pos, end)
+            # 読み終えた範囲をRSSから外す (ファイルのページなので書き戻しは不要)
+            done = end - end % mmap.PAGESIZE
+            if hasattr(mm, "madvise") and done > 0:
+                mm.madvise(mmap.MADV_DONTNEED, 0, done)
+            pos = end
+
+
+def _write_run(lines, tmp_dir):
+    """行の集合をソートしてランファイルに書き、そのパスを返す"""
+    fd, path = tempfile.mkstemp(prefix="run_", suffix=".txt", dir=tmp_dir)
+    with os.fdopen(fd, "wb") as f:
+        f.writelines(line + b"\n" for line in sorted(lines))
+    return path
+
+
+def scan_log(path, start_key, end_key, tmp_dir, run_lines=RUN_LINES):
+    """
+    1つのログを走査し、期間内のデータ行をソート済みのランファイルに書く (プロセスプールで実行)。
+    戻り値: (ログのパス, 一致した行数, ランファイルのリスト, エラーメッセージ or None)
+    """
+    pattern = compile_pattern(start_key, end_key)
+    runs, lines, matched, error = [], set(), 0, None
+    try:
+        for found in _iter_found(path, pattern):
+            found = _in_range(found, start_key, end_key)
+            matched += len(found)
+            lines.update(found)
+            if len(lines) >= run_lines:
+                runs.append(_write_run(lines, tmp_dir))
+                lines = set()
+    except (OSError, EOFError, zlib.error) as e:
+        # 書きかけの gzip などは、読めたところまでを使う
+        error = str(e)
+    if lines:
+        runs.append(_write_run(lines, tmp_dir))
+    return path, matched, runs, error
+
+
+def _merge_unique(paths):
+    """ソート済みのランファイルをマージし、重複を除いた行 (改行つき bytes) を順に返す"""
+    files = [open(path, "rb") for path in paths]
+    try:
+        previous = None
+        for line in heapq.merge(*files):
+            if line != previous:
+                yield line
+                previous = line
+    finally:
+        for f in files:
+            f.close()
+
+
+def merge_runs(runs, tmp_dir, fan_in=MERGE_FAN_IN):
+    """
+    ランが fan_in を超える場合は、fan_in 個ずつ中間ランにまとめて減らしてから、
+    最終的なマージのイテレータ (重複なし・ソート済み) を返す
+    """
+    runs = list(runs)
+    while len(runs) > fan_in:
+        merged = []
+        for i in range(0, len(runs), fan_in):
+            group = runs[i:i + fan_in]
+            fd, path = tempfile.mkstemp(prefix="merge_", suffix=".txt", dir=tmp_dir)
+            with os.fdopen(fd, "wb") as f:
+                f.writelines(_merge_unique(group))
+            for run in group:
+                os.remove(run)
+            merged.append(path)
+        runs = merged
+    return _merge_unique(runs)
+
+
+def write_monthly(lines, output_dir):
+    """
+    ソート済みの行を月ごとの recovered_temp_humid_YYYY-MM.txt に書き分ける。
+    戻り値: {月: (出力パス, 行数)}
+    """
+    written = {}
+    month, f, part_path = None, None, None
+    try:
+        for line in lines:
+            line_month = line[:7].decode("ascii")
+            if line_month != month:
+                if f is not None:
+                    f.close()
+                    os.replace(part_path, written[month][0])
+                month = line_month
+                path = os.path.join(output_dir, OUTPUT_FILE_TEMPLATE.format(month=month))
+                part_path = path + ".part"
+                f = open(part_path, "wb")
+                written[month] = (path, 0)
+            f.write(line)
+            written[month] = (written[month][0], written[month][1] + 1)
+        if f is not None:
+            f.close()
+            f = None
+            os.replace(part_path, written[month][0])
+    finally:
+        if f is not None:
+            f.close()
+            os.remove(part_path)
+    return written
+
+
+def recover(log_paths, output_dir=".", month=None, start=None, end=None,
+            workers=DEFAULT_WORKERS, run_lines=RUN_LINES, tmp_dir=None):
+    """
+    ログから期間内のデータ行を復元し、月ごとのファイルに書き出す。
+    戻り値: {月: (出力パス, 行数)}
+    """
+    start_key, end_key = range_keys(month, start, end)
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="recover_", dir=tmp_dir) as tmp:
+        runs, matched = [], 0
+        workers = max(1, min(workers, len(log_paths)))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(scan_log, path, start_key, end_key, tmp, run_lines) for path in log_paths]
+            for future in futures:
+                path, count, log_runs, error = future.result()
+                if error:
+                    print(f"エラー ({path}): {error} (読めた {count:,} 行までを使います)")
+                else:
+                    print(f"読み込み: {path} ({count:,} 行)")
+                matched += count
+                runs.extend(log_runs)
+        scanned = time.perf_counter()
+        written = write_monthly(merge_runs(runs, tmp, MERGE_FAN_IN), output_dir)
+    total = sum(count for _, count in written.values())
+    print(f"抽出データ件数: {total:,} 件 (一致 {matched:,} 行, ラン {len(runs)} 個, "
+          f"走査 {scanned - started:.2f}秒 / マージ {time.perf_counter() - scanned:.2f}秒)")
+    return written
 
-# 抽出対象の年月 (2025-12 のデータのみを抽出)
-TARGET_MONTH_PREFIX = "2025-12"
 
 def main():
-    data_set = set()
-    
-    # 正規表現: "月次ファイルに追記: " の後ろのデータを取得
-    # v1ログ: "... - INFO - 月次ファイルに追記: 2025-..."
-    # v2/v3ログ: "... - INFO - RAMバッファの月次ファイルに追記: 2025-..."
-    pattern = re.compile(r"月次ファイルに追記:\s*(.*)")
+    parser = argparse.ArgumentParser(description='ログから月次ファイルの行を復元する')
+    parser.add_argument('--log-dir', default=DEFAULT_LOG_DIR, help=f'ログディレクトリ (デフォルト: {DEFAULT_LOG_DIR})')
+    parser.add_argument('--logs', nargs='+', help='読み込むログを直接指定する (--log-dir の探索の代わり)')
+    parser.add_argument('--month', help='復元する月 (YYYY-MM)')
+    parser.add_argument('--start', help='開始 (YYYY-MM-DD[ HH:MM[:SS]])')
+    parser.add_argument('--end', help='終了 (この時刻を含む。日付のみならその日の終わりまで)')
+    parser.add_argument('--output-dir', default='.', help='復元ファイルの出力先 (デフォルト: カレント)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='ログを並列に走査するプロセス数')
+    parser.add_argument('--run-lines', type=int, default=RUN_LINES, help='1ランに溜める行数 (メモリ使用量の上限)')
+    parser.add_argument('--tmp-dir', help='ランファイルの置き場所 (デフォルト: システムの一時ディレクトリ)')
+    args = parser.parse_args()
 
-    print("ログ解析とデータ抽出を開始します...")
+    if args.month and (args.start or args.end):
+        parser.error("--month と --start/--end は同時に指定できません")
+    if args.month and not re.fullmatch(r"\d{4}-\d{2}", args.month):
+        parser.error("--month は YYYY-MM 形式で指定してください")
 
-    for log_path in LOG_FILES:
-        if not os.path.exists(log_path):
-            print(f"スキップ (ファイルなし): {log_path}")
-            continue
-        
-        print(f"読み込み中: {log_path}")
-        try:
-            with open(log_path, "r", encoding="utf-8", errors="ignore") as f:
-                for line in f:
-                    match = pattern.search(line)
-                    if match:
-                        data_part = match.group(1).strip()
-                        
-                        # データの簡易検証 (2025-12のデータで、CSV形式か)
-                        if data_part.startswith(TARGET_MONTH_PREFIX) and ",tmp=" in data_part and ",hum=" in data_part:
-                            data_set.add(data_part)
-        except Exception as e:
-            print(f"エラー ({log_path}): {e}")
-
-    # タイムスタンプ順にソート
-    sorted_data = sorted(list(data_set))
-
-    print(f"抽出データ件数: {len(sorted_data)} 件")
-
-    if sorted_data:
-        with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-            f.write("\n".join(sorted_data) + "\n")
-        print(f"復旧完了！ファイルを作成しました: {OUTPUT_FILE}")
-        print(f"内容を確認後、以下のコマンドで適用してください:\n"
-              f"cp {OUTPUT_FILE} /home/hideo_81_g/sensor_data/temp_humid_2025-12.txt")
+    print("ログ解析とデータ抽出を開始します...")
+    if args.logs:
+        log_paths = []
+        for path in args.logs:
+            if os.path.exists(path):
+                log_paths.append(path)
+            else:
+                print(f"スキップ (ファイルなし): {path}")
+    elif os.path.isdir(args.log_dir):
+        log_paths = discover_logs(args.log_dir)
     else:
+        log_paths = []
+    if not log_paths:
+        print("読み込むログが見つかりませんでした。")
+        sys.exit(1)
+
+    try:
+        written = recover(log_paths, args.output_dir, args.month, args.start, args.end,
+                          args.workers, args.run_lines, args.tmp_dir)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if not written:
         print("復旧対象のデータが見つかりませんでした。")
+        return
+    print("復旧完了！ファイルを作成しました。内容を確認後、以下のコマンドで現行ファイルにマージしてください:")
+    for month, (path, count) in sorted(written.items()):
+        target = os.path.join(DATA_DIR, sensor_query.MONTHLY_FILE_TEMPLATE.format(month=month))
+        print(f"  {count:,} 行: python merge_monthly.py {target} --source {path}")
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Rollups: sensor_data の集計テーブル (時間別・日別・月×時刻別) をインポートのたびに差分更新する。
+
+- sensor_rollup_hourly      : 1時間ごと (基礎となる集計)
+- sensor_rollup_daily       : 1日ごと
+- sensor_rollup_month_hour  : 月 × 時刻 (0〜23時) ごと。時刻別プロファイルのグラフ用
+
+各行は 件数・合計・二乗和・最小・最大 を温度/湿度それぞれについて持つため、
+平均・標準偏差・範囲を数百行から求められる (全件スキャン不要)。
+
+UPSERT で既存行の値が上書きされ得るため、差分の加算ではなく
+「今回の取り込みで触れた時間帯だけを生データから再集計して置き換える」方式にしている。
+日別・月×時刻別は時間別の集計から組み立てるので、生データを読むのは触れた時間帯のみ。
+SQL は方言に依存しない範囲 (範囲条件の SELECT と DELETE + INSERT) に留め、集計は pandas で行う。
+
+既に行のある sensor_data に対して集計テーブルを新たに作ったときは、その場で生データから再構築する。
+
+集計はデバイス (devices) ごとに持ち、読み出し時に device を省略すると全デバイスを合算する。
+デバイス列の無い旧形式の集計テーブルは作り直し、同じく生データから再構築する。
+"""
+import logging
+
+import pandas as pd
+from sqlalchemy import inspect, text
+
+import devices
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+METRICS = ("temperature", "humidity")
+STAT_COLUMNS = ["samples"] + [f"{m}_{s}" for m in METRICS for s in ("sum", "sumsq", "min", "max")]
+
+# 生データを読み直すときに、連続する時間帯を1回の SELECT にまとめる上限 (時間)
+MAX_SPAN_HOURS = 24 * 31
+
+_STAT_DDL = """
+    samples INTEGER NOT NULL,
+    temperature_sum DOUBLE NOT NULL, temperature_sumsq DOUBLE NOT NULL,
+    temperature_min DOUBLE NOT NULL, temperature_max DOUBLE NOT NULL,
+    humidity_sum DOUBLE NOT NULL, humidity_sumsq DOUBLE NOT NULL,
+    humidity_min DOUBLE NOT NULL, humidity_max DOUBLE NOT NULL
+"""
+
+TABLES = ("sensor_rollup_hourly", "sensor_rollup_daily", "sensor_rollup_month_hour")
+
+CREATE_TABLES_SQL = [
+    f"CREATE TABLE IF NOT EXISTS sensor_rollup_hourly (device_id VARCHAR(64) NOT NULL, "
+    f"hour_start DATETIME NOT NULL, {_STAT_DDL}, PRIMARY KEY (device_id, hour_start))",
+    f"CREATE TABLE IF NOT EXISTS sensor_rollup_daily (device_id VARCHAR(64) NOT NULL, "
+    f"day DATE NOT NULL, {_STAT_DDL}, PRIMARY KEY (device_id, day))",
+    f"CREATE TABLE IF NOT EXISTS sensor_rollup_month_hour (device_id VARCHAR(64) NOT NULL, month CHAR(7) NOT NULL, "
+    f"hour_of_day INTEGER NOT NULL, {_STAT_DDL}, PRIMARY KEY (device_id, month, hour_of_day))",
+]
+
+
+def _create_tables(engine):
+    """集計テーブルを作成し、今回新たに作った (旧形式から作り直した) テーブルの名前を返す"""
+    inspector = inspect(engine)
+    legacy = [t for t in TABLES if inspector.has_table(t)
+              and "device_id" not in {c["name"] for c in inspector.get_columns(t)}]
+    created = [t for t in TABLES if not inspector.has_table(t) or t in legacy]
+    with engine.begin() as connection:
+        for table in legacy:
+            logger.warning(f"{table} はデバイス列の無い旧形式のため作り直します。")
+            connection.execute(text(f"DROP TABLE {table}"))
+        for sql in CREATE_TABLES_SQL:
+            connection.execute(text(sql))
+    return created
+
+
+def _has_raw_rows(engine):
+    if not inspect(engine).has_table("sensor_data"):
+        return False
+    with engine.connect() as connection:
+        return connection.execute(text("SELECT 1 FROM sensor_data LIMIT 1")).fetchone() is not None
+
+
+def ensure_tables(engine):
+    """
+    集計テーブルを用意する。既に行のある sensor_data に対して新たに作った場合は、
+    差分更新だけでは取り込み済みの行が集計に入らないため、その場で生データから再構築する
+    """
+    created = _create_tables(engine)
+    if created and _has_raw_rows(engine):
+        logger.info(f"{', '.join(created)} を作成したため、既存の sensor_data から集計を再構築します。")
+        devices.ensure_schema(engine)
+        rebuild(engine)
+
+
+# --- 集計の計算 ---
+
+def _aggregate_raw(df, key):
+    """生データ (timestamp, temperature, humidity) を key ごとに集計する"""
+    squares = df[list(METRICS)] ** 2
+    grouped = df.groupby(key)
+    sq_grouped = squares.groupby(key)
+    result = pd.DataFrame({"samples": grouped.size()})
+    for metric in METRICS:
+        result[f"{metric}_sum"] = grouped[metric].sum()
+        result[f"{metric}_sumsq"] = sq_grouped[metric].sum()
+        result[f"{metric}_min"] = grouped[metric].min()
+        result[f"{metric}_max"] = grouped[metric].max()
+    return result
+
+
+def _combine(stats, key):
+    """集計行 (STAT_COLUMNS) を key ごとにさらにまとめる"""
+    grouped = stats.groupby(key)
+    result = pd.DataFrame({"samples": grouped["samples"].sum()})
+    for metric in METRICS:
+        result[f"{metric}_sum"] = grouped[f"{metric}_sum"].sum()
+        result[f"{metric}_sumsq"] = grouped[f"{metric}_sumsq"].sum()
+        result[f"{metric}_min"] = grouped[f"{metric}_min"].min()
+        result[f"{metric}_max"] = grouped[f"{metric}_max"].max()
+    return result
+
+
+def add_derived(stats):
+    """合計・二乗和から平均と標準偏差 (母標準偏差) の列を追加する"""
+    stats = stats.copy()
+    for metric in METRICS:
+        mean = stats[f"{metric}_sum"] / stats["samples"]
+        variance = (stats[f"{metric}_sumsq"] / stats["samples"] - mean ** 2).clip(lower=0)
+        stats[f"{metric}_mean"] = mean
+        stats[f"{metric}_std"] = variance ** 0.5
+    return stats
+
+
+# --- DB とのやり取り ---
+
+def _select(connection, sql, params):
+    result = connection.execute(text(sql), params)
+    return pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+
+
+def _replace_rows(connection, table, key_columns, keys, rows):
+    """keys の行を削除し、rows (DataFrame, key_columns + STAT_COLUMNS) を挿入する"""
+    where = " AND ".join(f"{c} = :{c}" for c in key_columns)
+    if keys:
+        connection.execute(text(f"DELETE FROM {table} WHERE {where}"),
+                           [dict(zip(key_columns, k)) for k in keys])
+    if not rows.empty:
+        columns = key_columns + STAT_COLUMNS
+        connection.execute(
+            text(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(':' + c for c in columns)})"),
+            [{c: (v.item() if hasattr(v, "item") else v) for c, v in zip(columns, row)}
+             for row in rows[columns].itertuples(index=False, name=None)],
+        )
+
+
+def _spans(hours):
+    """ソート済みの時刻 (1時間単位) を連続区間 [start, end) にまとめる"""
+    spans = []
+    for hour in hours:
+        if spans and hour == spans[-1][1] and (spans[-1][1] - spans[-1][0]) < pd.Timedelta(hours=MAX_SPAN_HOURS):
+            spans[-1][1] = hour + pd.Timedelta(hours=1)
+        else:
+            spans.append([hour, hour + pd.Timedelta(hours=1)])
+    return spans
+
+
+def touched_hours(timestamps):
+    """取り込んだ行の時刻から、再集計が必要な時間帯 (1時間単位, 昇順) を返す"""
+    return sorted(pd.DatetimeIndex(pd.to_datetime(pd.Series(timestamps))).floor("h").unique())
+
+
+def refresh_hours(engine, hours, device=devices.DEFAULT_DEVICE):
+    """
+    device の指定した時間帯を生データから再集計し、その時間帯を含む日・月×時刻の集計も更新する。
+    戻り値: 更新した (時間, 日, 月×時刻) の行数
+    """
+    hours = sorted(set(hours))
+    if not hours:
+        return 0, 0, 0
+    days = sorted({h.normalize() for h in hours})
+    month_hours = sorted({(h.strftime("%Y-%m"), h.hour) for h in hours})
+
+    with engine.begin() as connection:
+        # 1) 時間別: 触れた時間帯の生データだけを読む
+        raw = []
+        for start, end in _spans(hours):
+            raw.append(_select(connection,
+                               "SELECT timestamp, temperature, humidity FROM sensor_data "
+                               "WHERE device_id = :device AND timestamp >= :start AND timestamp < :end",
+                               {"device": device, "start": start.strftime(TIMESTAMP_FORMAT),
+                                "end": end.strftime(TIMESTAMP_FORMAT)}))
+        raw = pd.concat(raw, ignore_index=True)
+        raw["timestamp"] = pd.to_datetime(raw["timestamp"])
+        hourly = _aggregate_raw(raw, raw["timestamp"].dt.floor("h").rename("hour_start")).reset_index()
+        hourly["hour_start"] = hourly["hour_start"].dt.strftime(TIMESTAMP_FORMAT)
+        hourly["device_id"] = device
+        _replace_rows(connection, "sensor_rollup_hourly", ["device_id", "hour_start"],
+                      [(device, h.strftime(TIMESTAMP_FORMAT)) for h in hours], hourly)
+
+        # 2) 日別・月×時刻別: 時間別の集計から組み立てる
+        first = min(days[0], pd.Timestamp(month_hours[0][0] + "-01"))
+        last = max(days[-1] + pd.Timedelta(days=1), pd.Timestamp(month_hours[-1][0] + "-01") + pd.offsets.MonthBegin(1))
+        base = _select(connection,
+                       "SELECT * FROM sensor_rollup_hourly "
+                       "WHERE device_id = :device AND hour_start >= :start AND hour_start < :end",
+                       {"device": device, "start": first.strftime(TIMESTAMP_FORMAT),
+                        "end": last.strftime(TIMESTAMP_FORMAT)})
+        base["hour_start"] = pd.to_datetime(base["hour_start"])
+
+        day_keys = {d.strftime("%Y-%m-%d") for d in days}
+        daily = _combine(base, base["hour_start"].dt.strftime("%Y-%m-%d").rename("day")).reset_index()
+        daily = daily[daily["day"].isin(day_keys)].assign(device_id=device)
+        _replace_rows(connection, "sensor_rollup_daily", ["device_id", "day"],
+                      [(device, d) for d in sorted(day_keys)], daily)
+
+        month_hour = _combine(base, [base["hour_start"].dt.strftime("%Y-%m").rename("month"),
+                                     base["hour_start"].dt.hour.rename("hour_of_day")]).reset_index()
+        touched = pd.MultiIndex.from_tuples(month_hours)
+        month_hour = month_hour[pd.MultiIndex.from_frame(month_hour[["month", "hour_of_day"]]).isin(touched)]
+        _replace_rows(connection, "sensor_rollup_month_hour", ["device_id", "month", "hour_of_day"],
+                      [(device, m, h) for m, h in month_hours], month_hour.assign(device_id=device))
+
+    return len(hourly), len(daily), len(month_hour)
+
+
+def update_for_timestamps(engine, timestamps, device=devices.DEFAULT_DEVICE):
+    """device について取り込んだ行の時刻を渡し、触れた時間帯の集計を更新する"""
+    hours = touched_hours(timestamps)
+    counts = refresh_hours(engine, hours, device)
+    logger.debug(f"集計テーブル更新: 時間別 {counts[0]}行, 日別 {counts[1]}行, 月×時刻 {counts[2]}行")
+    return counts
+
+
+def rebuild(engine, window_days=31):
+    """既存の sensor_data 全体から集計テーブルを作り直す (window_days ずつ処理してメモリを抑える)"""
+    _create_tables(engine)
+    with engine.connect() as connection:
+        ranges = connection.execute(text(
+            "SELECT device_id, MIN(timestamp), MAX(timestamp) FROM sensor_data GROUP BY device_id")).fetchall()
+    refreshed = 0
+    for device, first, last in ranges:
+        start = pd.Timestamp(first).floor("h")
+        end = pd.Timestamp(last).floor("h") + pd.Timedelta(hours=1)
+        while start < end:
+            stop = min(end, start + pd.Timedelta(days=window_days))
+            with engine.connect() as connection:
+                present = _select(connection,
+                                  "SELECT timestamp FROM sensor_data "
+                                  "WHERE device_id = :device AND timestamp >= :start AND timestamp < :end",
+                                  {"device": device, "start": start.strftime(TIMESTAMP_FORMAT),
+                                   "end": stop.strftime(TIMESTAMP_FORMAT)})
+            if not present.empty:
+                refreshed += refresh_hours(engine, touched_hours(present["timestamp"]), device)[0]
+            start = stop
+    logger.info(f"集計テーブルを再構築しました: 時間別 {refreshed}行")
+    return refreshed
+
+
+# --- 読み出し ---
+
+def summary(engine):
+    """全体 (全デバイス) の件数・平均を日別集計から求める。集計が無ければ None"""
+    with engine.connect() as connection:
+        row = connection.execute(text(
+            "SELECT SUM(samples), SUM(temperature_sum), SUM(humidity_sum) FROM sensor_rollup_daily")).fetchone()
+    if row is None or not row[0]:
+        return None
+    total = int(row[0])
+    return {"total_rows": total, "avg_temp": row[1] / total, "avg_humid": row[2] / total}
+
+
+def _by_device(df, key_columns, device):
+    """device が None なら全デバイスの集計を key_columns ごとに合算する"""
+    if df.empty:
+        return df
+    if device is None:
+        df = _combine(df, key_columns).reset_index()
+    return add_derived(df.drop(columns="device_id", errors="ignore"))
+
+
+def load_hourly_profile(engine, months=None, device=None):
+    """
+    月×時刻の集計を読み、平均・標準偏差の列を付けて返す。
+    months: 対象の月 ("YYYY-MM") のリスト。None なら全期間
+    device: 対象のデバイスID。None なら全デバイスの合算
+    """
+    sql = "SELECT * FROM sensor_rollup_month_hour WHERE 1 = 1"
+    params = {}
+    if months:
+        sql += " AND month IN (" + ", ".join(f":m{i}" for i in range(len(months))) + ")"
+        params = {f"m{i}": m for i, m in enumerate(months)}
+    if device is not None:
+        sql += " AND device_id = :device"
+        params["device"] = device
+    with engine.connect() as connection:
+        df = _select(connection, sql + " ORDER BY month, hour_of_day", params)
+    return _by_device(df, ["month", "hour_of_day"], device)
+
+
+def load_daily(engine, start=None, end=None, device=None):
+    """
+    日別集計を読み、平均・標準偏差の列を付けて返す (start/end は "YYYY-MM-DD"、end は含まない)。
+    device が None なら全デバイスの合算
+    """
+    sql = "SELECT * FROM sensor_rollup_daily WHERE 1 = 1"
+    params = {}
+    if device is not None:
+        sql += " AND device_id = :device"
+        params["device"] = device
+    if start:
+        sql += " AND day >= :start"
+        params["start"] = start
+    if end:
+        sql += " AND day < :end"
+        params["end"] = end
+    with engine.connect() as connection:
+        df = _select(connection, sql + " ORDER BY day", params)
+    return _by_device(df, ["day"], device)
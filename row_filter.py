@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+RowFilter: 取り込み済みの行を月ごとに記録し、遅れて届いたデータのうち本当に新しい/変わった行だけを選ぶ。
+
+unified_importer は通常、DB の最新時刻 (ウォーターマーク) 以前の行を捨てるため、
+recover_data.py で後から復旧したデータや、遅れて届いたデバイスのデータが取り込まれない。
+ウォーターマークを外して全件を UPSERT し直すと、既存の行も全て書き直すことになる。
+
+このモジュールはデバイス・月 ("YYYY-MM") ごとに
+    - 取り込み済みのタイムスタンプ (エポック秒, 昇順の int64 配列)
+    - 各行の値の署名 (温度・湿度を 0.01 単位の整数にして1つの整数にまとめたもの)
+を import_row_filter テーブルに圧縮して保存する。取り込み時は searchsorted で照合し、
+「タイムスタンプが無い」か「値が変わった」行だけを挿入対象にするため、
+時刻の順序に関係なく差分だけを書き込み、既存の行は DB に問い合わせずに読み飛ばせる。
+
+Bloom フィルタは偽陽性で新しい行を黙って捨て得るため使わず、正確な集合を持つ
+(1行あたり 16byte、圧縮後はさらに小さい。1か月 26万行で数MB以下)。
+フィルタが無い月は、その月の sensor_data を1回だけ範囲 SELECT して作る。
+フィルタの更新は挿入のコミット後に行うため、途中で失敗しても次回は同じ行を挿入し直すだけで済む。
+フィルタは sensor_data から作り直せるキャッシュなので、デバイス列の無い旧形式の表は作り直す。
+"""
+import io
+import logging
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import inspect, text
+
+import devices
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# 署名の計算に使う値の刻み (filter_valid_range と同じ小数2桁)
+VALUE_SCALE = 100
+# 湿度 (0〜100.00) を 0.01 単位にした値の上限 + 1。温度と湿度を1つの整数にまとめるときの基数
+HUMIDITY_RADIX = 100 * VALUE_SCALE + 1
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS import_row_filter (
+    device_id VARCHAR(64) NOT NULL,
+    month CHAR(7) NOT NULL,
+    row_count BIGINT NOT NULL,
+    payload LONGBLOB NOT NULL,
+    updated_at DATETIME NOT NULL,
+    PRIMARY KEY (device_id, month)
+)
+"""
+
+
+def ensure_table(engine):
+    inspector = inspect(engine)
+    legacy = (inspector.has_table("import_row_filter")
+              and "device_id" not in {c["name"] for c in inspector.get_columns("import_row_filter")})
+    with engine.begin() as connection:
+        if legacy:
+            logger.info("import_row_filter を旧形式からデバイス別の形式に作り直します。")
+            connection.execute(text("DROP TABLE import_row_filter"))
+        connection.execute(text(CREATE_TABLE_SQL))
+
+
+def _epoch_seconds(timestamps):
+    return np.asarray(timestamps, dtype="datetime64[ns]").astype("datetime64[s]").astype(np.int64)
+
+
+def signatures(temperature, humidity):
+    """温度・湿度を 0.01 単位の整数に丸めて1つの int64 にまとめる (FLOAT 列の誤差は丸めで吸収する)"""
+    t = np.rint(np.asarray(temperature, dtype=np.float64) * VALUE_SCALE).astype(np.int64)
+    h = np.rint(np.asarray(humidity, dtype=np.float64) * VALUE_SCALE).astype(np.int64)
+    return t * HUMIDITY_RADIX + h
+
+
+def _months(seconds):
+    """エポック秒の配列に対応する月キー ("YYYY-MM") の配列"""
+    return seconds.astype("datetime64[s]").astype("datetime64[M]").astype(str)
+
+
+def encode(seconds, sigs):
+    buf = io.BytesIO()
+    np.savez_compressed(buf, seconds=seconds, sigs=sigs)
+    return buf.getvalue()
+
+
+def decode(payload):
+    with np.load(io.BytesIO(payload)) as data:
+        return data["seconds"], data["sigs"]
+
+
+def _month_range(month):
+    start = pd.Timestamp(f"{month}-01")
+    return start.strftime(TIMESTAMP_FORMAT), (start + pd.offsets.MonthBegin(1)).strftime(TIMESTAMP_FORMAT)
+
+
+def _build_from_db(connection, month, device):
+    """sensor_data から device の1か月分のフィルタを作る"""
+    start, end = _month_range(month)
+    rows = connection.execute(text(
+        "SELECT timestamp, temperature, humidity FROM sensor_data "
+        "WHERE device_id = :device AND timestamp >= :start AND timestamp < :end"
+    ), {"device": device, "start": start, "end": end}).fetchall()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    df = pd.DataFrame(rows, columns=["timestamp", "temperature", "humidity"])
+    seconds = _epoch_seconds(pd.to_datetime(df["timestamp"]))
+    order = np.argsort(seconds, kind="stable")
+    return seconds[order], signatures(df["temperature"], df["humidity"])[order]
+
+
+def load(engine, filters, month, device=devices.DEFAULT_DEVICE):
+    """
+    月のフィルタを filters (dict, (デバイス, 月) -> (秒, 署名)) に読み込んで返す。
+    記録が無ければ sensor_data から作る
+    """
+    key = (device, month)
+    if key in filters:
+        return filters[key]
+    with engine.connect() as connection:
+        row = connection.execute(text("SELECT payload FROM import_row_filter WHERE device_id = :d AND month = :m"),
+                                 {"d": device, "m": month}).fetchone()
+        if row is not None:
+            filters[key] = decode(row[0])
+        else:
+            filters[key] = _build_from_db(connection, month, device)
+            logger.info(f"{device} {month} の取り込み済みフィルタを sensor_data から作成しました "
+                        f"({len(filters[key][0])}行)")
+    return filters[key]
+
+
+def select_new(engine, filters, df, device=devices.DEFAULT_DEVICE):
+    """device の df (timestamp, temperature, humidity) のうち、未登録または値が変わった行だけを返す"""
+    if df.empty:
+        return df
+    seconds = _epoch_seconds(df["timestamp"])
+    sigs = signatures(df["temperature"], df["humidity"])
+    months = _months(seconds)
+    keep = np.ones(len(df), dtype=bool)
+    for month in np.unique(months):
+        in_month = months == month
+        stored_seconds, stored_sigs = load(engine, filters, month, device)
+        if not len(stored_seconds):
+            continue
+        target = seconds[in_month]
+        pos = np.clip(np.searchsorted(stored_seconds, target), 0, len(stored_seconds) - 1)
+        unchanged = (stored_seconds[pos] == target) & (stored_sigs[pos] == sigs[in_month])
+        keep[np.flatnonzero(in_month)[unchanged]] = False
+    return df[keep]
+
+
+def record(engine, filters, df, device=devices.DEFAULT_DEVICE):
+    """挿入がコミットされた device の行 df をフィルタに追加して保存する (同じ時刻は df の値で置き換える)"""
+    if df.empty:
+        return
+    seconds = _epoch_seconds(df["timestamp"])
+    sigs = signatures(df["temperature"], df["humidity"])
+    months = _months(seconds)
+    updated = {}
+    for month in np.unique(months):
+        in_month = months == month
+        stored_seconds, stored_sigs = load(engine, filters, month, device)
+        # 後から書いた値が残るよう、新しい行 (後ろから) → 既存の行 の順に並べて最初の出現を採る
+        merged_seconds = np.concatenate([seconds[in_month][::-1], stored_seconds])
+        merged_sigs = np.concatenate([sigs[in_month][::-1], stored_sigs])
+        unique_seconds, first = np.unique(merged_seconds, return_index=True)
+        updated[(device, str(month))] = (unique_seconds, merged_sigs[first])
+
+    now = datetime.now().replace(microsecond=0)
+    with engine.begin() as connection:
+        for (_, month), (month_seconds, month_sigs) in updated.items():
+            params = {"d": device, "m": month, "n": len(month_seconds), "p": encode(month_seconds, month_sigs),
+                      "now": now}
+            connection.execute(text("DELETE FROM import_row_filter WHERE device_id = :d AND month = :m"), params)
+            connection.execute(text(
+                "INSERT INTO import_row_filter (device_id, month, row_count, payload, updated_at) "
+                "VALUES (:d, :m, :n, :p, :now)"
+            ), params)
+    filters.update(updated)
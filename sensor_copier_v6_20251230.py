@@ -11,8 +11,15 @@ from logging.handlers import RotatingFileHandler
 import shutil
 import subprocess
 
+import monthly_index
+import adaptive_sampling
+import block_verify
+import upload_fanout
+import snapshot_manager
+import aht25_frames
+
 # --- 設定 ---
-__version__ = "6.0.0"  # v6.0.0: Family-Friendly版 (latest複数行化)
+__version__ = "6.6.0"  # v6.6.0: 生フレーム記録 (v6.5.0: スナップショット, v6.4.0: 並行アップロード)
 
 # ログ設定
 LOG_DIR = "/home/hideo_81_g/logs"
@@ -49,6 +56,11 @@ RAM_DATA_DIR = "/tmp/sensor_data"
 # 永続ディレクトリ (停電耐性用)
 PERSISTENT_DATA_DIR = "/home/hideo_81_g/sensor_data"
 
+# 世代付きスナップショット (v6.5.0: backup.sh の置き換え)
+SNAPSHOT_DIR = "/home/hideo_81_g/sensor_data_backup/snapshots"
+SNAPSHOT_KEEP_LAST = 12   # 直近12世代 (全体同期4時間ごと → 約2日分)
+SNAPSHOT_KEEP_DAILY = 30  # 過去30日分は各日の最終世代を保持
+
 LATEST_FILENAME = "latest_temp_humid.txt"
 
 I2C_BUS = 1
@@ -58,14 +70,47 @@ MAX_I2C_ERRORS = 3
 
 AHT25_STATUS_MASK = 0x18
 
+# 生フレーム記録 (v6.6.0): 変換前の7byteフレームを月次バイナリに残す (任意)
+RAW_FRAME_CAPTURE = os.getenv("SENSOR_RAW_FRAMES") == "1"
+
 SENSOR_INIT_SLEEP = 0.1
 CONVERSION_SLEEP = 0.08
 
 # 全体同期の間隔（時間）
 FULL_SYNC_INTERVAL_HOURS = 4
 
+# 適応サンプリング (v6.2.0): 有効時は cron を毎分起動にし、記録要否を変化率で判定する
+# crontab例: * * * * * SENSOR_ADAPTIVE=1 /usr/bin/python3 .../SensorCopier_current.py
+ADAPTIVE_SAMPLING = os.getenv("SENSOR_ADAPTIVE") == "1"
+ADAPTIVE_MIN_INTERVAL_SEC = 60        # 急変時の最短記録間隔（cron間隔が下限）
+ADAPTIVE_HEARTBEAT_SEC = 15 * 60      # 安定時の最長記録間隔（従来の15分間隔）
+ADAPTIVE_TEMP_RATE_PER_MIN = 0.2      # ℃/分
+ADAPTIVE_HUM_RATE_PER_MIN = 1.5       # %/分
+ADAPTIVE_TEMP_STEP = 0.3              # ℃
+ADAPTIVE_HUM_STEP = 2.0               # %
+
+# cronの起動間隔（分）。全体同期の判定枠をこの幅にして、1枠1回の同期に保つ
+CRON_INTERVAL_MINUTES = 1 if ADAPTIVE_SAMPLING else 15
+
 BW_LIMIT = "200k"
 
+# アップロード先 (v6.4.0): 宛先ごとにキュー・再送状態・帯域制限を持ち、並行に送信する
+# type: "rclone" (リモート名:パス) / "local" (NASのマウント先ディレクトリ)
+UPLOAD_DESTINATIONS = [
+    {"name": "gdrive", "type": "rclone", "target": "raspi_data:/sensor_data/", "bwlimit": BW_LIMIT},
+]
+if os.getenv("SENSOR_NAS_DIR"):
+    UPLOAD_DESTINATIONS.append(
+        {"name": "nas", "type": "local", "target": os.getenv("SENSOR_NAS_DIR"), "bwlimit": "1M"}
+    )
+
+# 宛先ごとの送信キュー (RAM上。再起動で消えても次回の全体同期で追いつく)
+UPLOAD_QUEUE_DIR = "/tmp/sensor_upload_queue"
+
+# 1回の起動でアップロードに使う時間の上限（秒）。センサー読み取りなどの時間も見込み、
+# cron間隔の半分以内に収める (重なった起動は upload_fanout のロックで送信を見送る)
+UPLOAD_TIME_BUDGET_SEC = min(40, CRON_INTERVAL_MINUTES * 60 // 2)
+
 # JSTタイムゾーン定義 (INC-002対策: 環境依存排除)
 JST = timezone(timedelta(hours=9), 'JST')
 
@@ -96,6 +141,18 @@ def initialize_sensor(i2c_bus):
         logger.error(f"センサー初期化エラー: {e}")
         return False
 
+def get_raw_frame_filepath(base_dir, read_at):
+    """生フレーム記録ファイルのパス (読み取り時刻の月, JST)"""
+    month_str = read_at.strftime("%Y-%m")
+    return os.path.join(base_dir, f"raw_frames_{month_str}.bin")
+
+def capture_raw_frame(data, read_at):
+    """SensorReader: 生フレームを記録する。記録の失敗は読み取り処理に影響させない"""
+    try:
+        aht25_frames.append_frame(get_raw_frame_filepath(RAM_DATA_DIR, read_at), read_at, data)
+    except Exception as e:
+        logger.error(f"生フレームの記録に失敗: {e}")
+
 def read_sensor_data(i2c_bus):
     """SensorReader: センサーからデータを読み取り、CSV形式の文字列を返す (JST)"""
     global i2c_error_count
@@ -103,15 +160,17 @@ def read_sensor_data(i2c_bus):
         i2c_bus.write_i2c_block_data(SENSOR_ADDRESS, 0x00, TRIGGER_COMMAND)
         time.sleep(CONVERSION_SLEEP)
         data = i2c_bus.read_i2c_block_data(SENSOR_ADDRESS, 0x00, 7)
+        read_at = get_jst_now()
+
+        # v6.6.0: 無効フレームも含め、変換前の生フレームを記録 (監査・再計算用)
+        if RAW_FRAME_CAPTURE:
+            capture_raw_frame(data, read_at)
 
         if (data[0] & AHT25_STATUS_MASK) != AHT25_STATUS_MASK:
             raise ValueError(f"無効なセンサーステータス: {hex(data[0])}")
 
-        hum_raw = (data[1] << 12 | data[2] << 4 | (data[3] >> 4))
-        tmp_raw = ((data[3] & 0x0F) << 16 | data[4] << 8 | data[5])
-
-        humidity = round((hum_raw / 2**20) * 100, 1)
-        temperature = round((tmp_raw / 2**20) * 200 - 50, 1)
+        # 変換式は aht25_frames に一本化 (一括デコーダと同じ値を保証するため)
+        temperature, humidity = aht25_frames.decode_frame(data)
 
         if not (0 <= humidity <= 100 and -40 <= temperature <= 80):
             logger.warning(f"異常値検出: tmp={temperature}°C, hum={humidity}%")
@@ -119,7 +178,7 @@ def read_sensor_data(i2c_bus):
 
         i2c_error_count = 0
         # INC-005対策: 秒ありフォーマット固定
-        return f"{get_jst_now().strftime('%Y-%m-%d %H:%M:%S')},tmp={temperature},hum={humidity}"
+        return f"{read_at.strftime('%Y-%m-%d %H:%M:%S')},tmp={temperature},hum={humidity}"
     except (OSError, ValueError) as e:
         i2c_error_count += 1
         logger.error(f"I2Cエラー ({i2c_error_count}/{MAX_I2C_ERRORS}): {e}")
@@ -155,18 +214,26 @@ def needs_full_sync():
     current_hour = now.hour
     current_minute = now.minute
 
-    # INC-006対策: 4時間ごとの枠、かつその枠の最初の15分間だけTrue
-    if current_hour % FULL_SYNC_INTERVAL_HOURS == 0 and 0 <= current_minute < 15:
+    # INC-006対策: 4時間ごとの枠、かつその枠の最初のcron間隔（通常15分）だけTrue
+    if current_hour % FULL_SYNC_INTERVAL_HOURS == 0 and 0 <= current_minute < CRON_INTERVAL_MINUTES:
         return True, f"定時同期（{FULL_SYNC_INTERVAL_HOURS}時間ごと）の時刻のため"
     return False, ""
 
-def build_rclone_cmd(source, dest, is_file=True):
-    """Uploader: rcloneコマンドを生成"""
-    cmd = ["rclone", "copy", source, dest]
-    if is_file:
-        cmd.extend(["--checksum", "--no-traverse"])
-    cmd.extend(["--bwlimit", BW_LIMIT])
-    return cmd
+def build_rclone_cmd(source, dest, is_file=True, bwlimit=BW_LIMIT):
+    """Uploader: rcloneコマンドを生成 (upload_fanout と共通。既定の帯域制限だけをここで与える)"""
+    return upload_fanout.build_rclone_copy_cmd(source, dest, is_file=is_file, bwlimit=bwlimit)
+
+def run_uploads():
+    """Uploader: 全宛先のキューを並行に送信し、結果をログに残す"""
+    results = upload_fanout.drain_all(
+        UPLOAD_QUEUE_DIR, UPLOAD_DESTINATIONS,
+        time_budget=UPLOAD_TIME_BUDGET_SEC, build_cmd=build_rclone_cmd,
+    )
+    for name, (sent, pending) in results.items():
+        if pending is None:
+            logger.warning(f"[{name}] アップロード打ち切り（時間予算超過）。")
+        else:
+            logger.info(f"[{name}] アップロード {sent}件成功、未送信 {pending}件。")
 
 def flush_ram_to_persistent():
     """DataFlusher: RAMバッファから永続ディレクトリへrsyncで安全にフラッシュ"""
@@ -175,6 +242,18 @@ def flush_ram_to_persistent():
     cmd = ["rsync", "-a", RAM_DATA_DIR + "/", PERSISTENT_DATA_DIR + "/"]
     return execute_command(cmd, "RAMから永続領域へのフラッシュ")
 
+def verify_persistent_monthly():
+    """BlockVerifier: フラッシュ後の永続領域の月次ファイルを末尾ブロックのみ照合する"""
+    monthly_path_persistent = get_monthly_filepath(PERSISTENT_DATA_DIR)
+    if not os.path.exists(monthly_path_persistent):
+        return True
+    is_intact, detail = block_verify.verify_tail(monthly_path_persistent)
+    if is_intact:
+        logger.info(f"永続領域の月次ファイル照合: {detail}")
+    else:
+        logger.error(f"永続領域の月次ファイル照合失敗: {detail}")
+    return is_intact
+
 def restore_ram_from_persistent():
     """DataRestorer: 起動時に永続領域からRAMへデータを復元する"""
     # 1. 月次ファイルの復元
@@ -191,6 +270,10 @@ def restore_ram_from_persistent():
 
     if should_restore_monthly and os.path.exists(monthly_path_persistent):
         logger.info(f"DataRestorer: RAMバッファ(月次)が空です。永続領域から復元します: {monthly_path_persistent} -> {monthly_path_ram}")
+        # v6.3.0: 復元元(SDカード)の末尾ブロックを照合。破損していても他に復元元がないため復元は行う
+        is_intact, detail = block_verify.verify_tail(monthly_path_persistent)
+        if not is_intact:
+            logger.critical(f"復元元の月次ファイルに破損の疑いがあります: {detail}")
         try:
             shutil.copy2(monthly_path_persistent, monthly_path_ram)
             logger.info("月次ファイル復元成功。")
@@ -261,8 +344,22 @@ def main():
 
         # 1. SensorReader & DataProcessor
         latest_line = read_sensor_data(i2c)
+
+        # 1.5 AdaptiveSampler (v6.2.0): 安定時は記録・アップロードを間引く
+        should_record = True
+        if latest_line and ADAPTIVE_SAMPLING:
+            try:
+                should_record = adaptive_sampling.should_record(
+                    latest_line, RAM_DATA_DIR,
+                    min_interval=ADAPTIVE_MIN_INTERVAL_SEC, heartbeat=ADAPTIVE_HEARTBEAT_SEC,
+                    temp_rate=ADAPTIVE_TEMP_RATE_PER_MIN, hum_rate=ADAPTIVE_HUM_RATE_PER_MIN,
+                    temp_step=ADAPTIVE_TEMP_STEP, hum_step=ADAPTIVE_HUM_STEP,
+                )
+            except Exception as e:
+                # 判定に失敗した場合はデータ欠損を避けるため記録する
+                logger.error(f"適応サンプリングの判定に失敗。記録を続行します: {e}")
         
-        if latest_line:
+        if latest_line and should_record:
             # 2. DataWriter: RAMバッファに書き込み (月次ファイル)
             monthly_path_ram = get_monthly_filepath(RAM_DATA_DIR)
             with open(monthly_path_ram, "a") as f:
@@ -271,13 +368,22 @@ def main():
                 os.fsync(f.fileno())
             logger.info(f"RAMバッファの月次ファイルに追記: {latest_line}")
 
+            # v6.1.0: サイドカー索引を差分更新 (下流ツールが本体を読まずにスキップ/シークするため)
+            # 索引は補助情報のため、失敗してもデータ収集は継続する
+            try:
+                monthly_index.update_index(monthly_path_ram)
+            except Exception as e:
+                logger.error(f"月次索引の更新に失敗: {e}")
+
             # v6.0.0変更点: latestファイルは月次ファイルから生成する (REQ-05)
             latest_filepath_ram = os.path.join(RAM_DATA_DIR, LATEST_FILENAME)
             update_latest_file(monthly_path_ram, latest_filepath_ram, max_lines=32)
             
-            # 3. Uploader: 最新ファイルのみ即時アップロード
-            cmd = build_rclone_cmd(latest_filepath_ram, "raspi_data:/sensor_data/", is_file=True)
-            execute_command(cmd, "最新データのアップロード")
+            # 3. Uploader: 最新ファイルを全宛先のキューへ (送信は最後にまとめて並行実行)
+            upload_fanout.enqueue(UPLOAD_QUEUE_DIR, UPLOAD_DESTINATIONS, latest_filepath_ram,
+                                  is_file=True, description="最新データ")
+        elif latest_line:
+            logger.info("適応サンプリング: 変化が小さいため、今回の書き込み・アップロードはスキップします。")
         else:
             logger.warning("センサーデータの読み取りに失敗。書き込み・アップロードはスキップします。")
 
@@ -287,13 +393,27 @@ def main():
             logger.info(f"{reason}、全体同期プロセスを開始します。")
             
             # 5. DataFlusher: RAM -> 永続領域
-            if flush_ram_to_persistent():
-                # 6. Uploader: 永続ディレクトリ全体をアップロード
-                logger.info("永続ディレクトリ全体のコピー同期を開始します。")
-                cmd = build_rclone_cmd(PERSISTENT_DATA_DIR, "raspi_data:/sensor_data/", is_file=False)
-                execute_command(cmd, "永続ディレクトリ全体のコピー同期")
-            else:
+            if not flush_ram_to_persistent():
                 logger.error("RAMから永続領域へのフラッシュに失敗したため、全体同期は中止します。")
+            elif not verify_persistent_monthly():
+                logger.critical("永続領域の月次ファイルに破損の疑いがあります。クラウド上の正常データを上書きしないよう全体同期は中止します。")
+            else:
+                # 5.5 SnapshotManager: RAMバッファの世代付きスナップショット（失敗しても同期は続行）
+                try:
+                    snapshot_manager.snapshot_and_prune(
+                        RAM_DATA_DIR, SNAPSHOT_DIR,
+                        keep_last=SNAPSHOT_KEEP_LAST, keep_daily=SNAPSHOT_KEEP_DAILY, now=get_jst_now(),
+                    )
+                except Exception as e:
+                    logger.error(f"スナップショット作成に失敗: {e}")
+
+                # 6. Uploader: 永続ディレクトリ全体を全宛先のキューへ
+                logger.info("永続ディレクトリ全体のコピー同期をキューに追加します。")
+                upload_fanout.enqueue(UPLOAD_QUEUE_DIR, UPLOAD_DESTINATIONS, PERSISTENT_DATA_DIR,
+                                      is_file=False, description="永続ディレクトリ全体のコピー同期")
+
+        # 7. Uploader: 今回追加分と過去の未送信分を、宛先ごとに並行して送信
+        run_uploads()
 
         duration = time.perf_counter() - start_ts
         logger.info(f"全処理完了。処理時間: {duration:.2f}秒")
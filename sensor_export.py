@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+SensorExport: sensor_data の任意の期間 (とデバイス) をストリーミングで書き出す。
+
+pd.read_sql でテーブル全体を DataFrame に読み込むと、期間に比例してメモリを使う。ここでは
+- サーバー側カーソル (stream_results) と yield_per で batch_size 行ずつ受け取り、
+  受け取ったバッチを書き出してから次のバッチを読む (メモリは期間によらず batch_size 行分)
+- 主キー (device_id, timestamp) の順に読むため、月次ファイルは1つずつ開いて閉じればよい
+
+出力形式:
+    monthly  元の月次ファイルと同じ形式 (`YYYY-MM-DD HH:MM:SS,tmp=X,hum=Y`) で
+             <出力先>/temp_humid_YYYY-MM.txt に書く。既定以外のデバイスは <出力先>/<デバイスID>/ の下
+             (devices のフォルダ構成と同じなので、そのまま unified_importer --source で取り込み直せる)
+    csv      ヘッダーつきの CSV 1ファイル (device_id,timestamp,temperature,humidity)。出力先 '-' なら標準出力
+    npz      列形式 (NumPy .npz): timestamp (datetime64[s]) / temperature / humidity / device (デバイスの番号) と
+             devices (番号 → デバイスID)。列ごとに一時ファイルへ追記し、最後に .npz にまとめる
+
+いずれも一時ファイル (.part) に書いてから rename するため、途中で失敗しても既存のファイルは壊れない。
+
+使い方:
+    python sensor_export.py --start 2025-08-01 --end 2025-08-31 --format monthly --output ~/export/
+    python sensor_export.py --device pi-02 --start "2025-08-14 02:00" --format csv --output -
+    python sensor_export.py --format npz --output ~/sensor_2025.npz --start 2025-01-01 --end 2025-12-31
+"""
+import argparse
+import csv
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+import numpy as np
+from sqlalchemy import text
+
+import devices
+import sensor_query
+import storage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_ROWS = 10000
+FORMATS = ("monthly", "csv", "npz")
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+MONTHLY_FILE_TEMPLATE = sensor_query.MONTHLY_FILE_TEMPLATE
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# npz の数値列: (列名, dtype)
+_NUMERIC_COLUMNS = (("timestamp", "datetime64[s]"), ("temperature", "float64"),
+                    ("humidity", "float64"), ("device", "int32"))
+
+
+def _range_query(start=None, end=None, device=None):
+    """期間 [start, end] (sensor_query.to_key と同じ解釈: 日付のみの end はその日の終わり) の SELECT"""
+    conditions, params = [], {}
+    if device is not None:
+        conditions.append("device_id = :device")
+        params["device"] = devices.validate(device)
+    if start is not None:
+        conditions.append("timestamp >= :start")
+        params["start"] = sensor_query.to_key(start).decode()
+    if end is not None:
+        conditions.append("timestamp <= :end")
+        params["end"] = sensor_query.to_key(end, end_of_range=True).decode()
+    sql = "SELECT device_id, timestamp, temperature, humidity FROM sensor_data"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    return sql + " ORDER BY device_id, timestamp", params
+
+
+def iter_batches(engine, start=None, end=None, device=None, batch_size=DEFAULT_BATCH_ROWS):
+    """
+    期間内の行を (device_id, timestamp文字列, 温度, 湿度) のタプルのリストとして batch_size 行ずつ返す。
+    サーバー側カーソルで受け取るため、DB ドライバも一度に batch_size 行分しか保持しない
+    """
+    sql, params = _range_query(start, end, device)
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=batch_size).execute(text(sql), params)
+        for rows in result.partitions(batch_size):
+            yield [(d, _timestamp_text(ts), t, h) for d, ts, t, h in rows]
+
+
+def _timestamp_text(value):
+    # MySQL は datetime、SQLite は保存した文字列のまま返す
+    return value if isinstance(value, str) else value.strftime(TIMESTAMP_FORMAT)
+
+
+def _value_text(value):
+    """FLOAT 列の誤差 (25.299999237...) を取り込み時と同じ小数2桁で丸め、元のファイルと同じ表記にする"""
+    return repr(round(float(value), 2))
+
+
+def _replace(part_path, path):
+    os.replace(part_path, path)
+    return path
+
+
+# --- 月次ファイル形式 ---
+
+def monthly_path(output_dir, device, month):
+    directory = output_dir if device == devices.DEFAULT_DEVICE else os.path.join(output_dir, device)
+    return os.path.join(directory, MONTHLY_FILE_TEMPLATE.format(month=month))
+
+
+def write_monthly(batches, output_dir):
+    """月次ファイル形式で書き出す。戻り値: (行数, 書いたファイルのパスのリスト)"""
+    rows = 0
+    written = []
+    current, f, part_path = None, None, None
+    try:
+        for batch in batches:
+            for device, ts, t, h in batch:
+                key = (device, ts[:7])
+                if key != current:
+                    if f is not None:
+                        f.close()
+                        written.append(_replace(part_path, monthly_path(output_dir, *current)))
+                    current = key
+                    path = monthly_path(output_dir, device, ts[:7])
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    part_path = path + ".part"
+                    f = open(part_path, "w")
+                f.write(f"{ts},tmp={_value_text(t)},hum={_value_text(h)}\n")
+            rows += len(batch)
+        if f is not None:
+            f.close()
+            f = None
+            written.append(_replace(part_path, monthly_path(output_dir, *current)))
+    finally:
+        if f is not None:
+            f.close()
+            os.remove(part_path)
+    return rows, written
+
+
+# --- CSV ---
+
+def write_csv(batches, output):
+    """ヘッダーつき CSV で書き出す (output が '-' なら標準出力)。戻り値: (行数, [出力先])"""
+    rows = 0
+    if output == "-":
+        writer = csv.writer(sys.stdout, lineterminator="\n")
+        writer.writerow(["device_id", "timestamp", "temperature", "humidity"])
+        for batch in batches:
+            writer.writerows((d, ts, _value_text(t), _value_text(h)) for d, ts, t, h in batch)
+            rows += len(batch)
+        return rows, ["-"]
+    part_path = output + ".part"
+    try:
+        with open(part_path, "w", newline="") as f:
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(["device_id", "timestamp", "temperature", "humidity"])
+            for batch in batches:
+                writer.writerows((d, ts, _value_text(t), _value_text(h)) for d, ts, t, h in batch)
+                rows += len(batch)
+        return rows, [_replace(part_path, output)]
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+
+# --- 列形式 (npz) ---
+
+def _write_npy_entry(archive, name, dtype, count, source):
+    """一時ファイル source (dtype の生バイト列) を、.npy ヘッダーをつけて archive の name.npy として書く"""
+    with archive.open(f"{name}.npy", "w", force_zip64=True) as entry:
+        np.lib.format.write_array_header_1_0(
+            entry, {"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)), "fortran_order": False, "shape": (count,)})
+        if source is not None:
+            with open(source, "rb") as f:
+                shutil.copyfileobj(f, entry, COPY_CHUNK_SIZE)
+
+
+def write_npz(batches, output):
+    """
+    列形式 (.npz) で書き出す。列ごとに一時ファイルへ追記してから .npz にまとめるため、
+    メモリは1バッチ分、ディスクは出力の約2倍を一時的に使う。戻り値: (行数, [出力先])
+    """
+    rows = 0
+    device_ids = {}
+    part_path = output + ".part"
+    with tempfile.TemporaryDirectory(prefix="sensor_export_", dir=os.path.dirname(os.path.abspath(output))) as tmp:
+        paths = {name: os.path.join(tmp, name) for name, _ in _NUMERIC_COLUMNS}
+        files = {name: open(path, "wb") for name, path in paths.items()}
+        try:
+            for batch in batches:
+                d, ts, t, h = zip(*batch)
+                columns = {
+                    "timestamp": np.array(ts, dtype="datetime64[s]"),
+                    "temperature": np.round(np.array(t, dtype=np.float64), 2),
+                    "humidity": np.round(np.array(h, dtype=np.float64), 2),
+                    "device": np.array([device_ids.setdefault(x, len(device_ids)) for x in d], dtype=np.int32),
+                }
+                for name, dtype in _NUMERIC_COLUMNS:
+                    files[name].write(columns[name].astype(dtype, copy=False).tobytes())
+                rows += len(batch)
+        finally:
+            for f in files.values():
+                f.close()
+        try:
+            with zipfile.ZipFile(part_path, "w", zipfile.ZIP_STORED, allowZip64=True) as archive:
+                for name, dtype in _NUMERIC_COLUMNS:
+                    _write_npy_entry(archive, name, dtype, rows, paths[name])
+                names = np.array(sorted(device_ids, key=device_ids.get) or [], dtype="U64")
+                with archive.open("devices.npy", "w") as entry:
+                    np.lib.format.write_array(entry, names)
+            return rows, [_replace(part_path, output)]
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+
+WRITERS = {"monthly": write_monthly, "csv": write_csv, "npz": write_npz}
+
+
+def export(engine, output, fmt="monthly", start=None, end=None, device=None, batch_size=DEFAULT_BATCH_ROWS):
+    """期間内の行を fmt 形式で output に書き出す。戻り値: (行数, 書いたファイルのパスのリスト)"""
+    if fmt not in WRITERS:
+        raise ValueError(f"未対応の出力形式です: {fmt} ({' / '.join(FORMATS)})")
+    started = time.perf_counter()
+    rows, written = WRITERS[fmt](iter_batches(engine, start, end, device, batch_size), output)
+    seconds = time.perf_counter() - started
+    logger.info(f"書き出し: {rows:,}行 ({fmt}, {len(written)}ファイル), {seconds:.2f}秒, "
+                f"{rows / max(seconds, 1e-9):,.0f}行/秒")
+    return rows, written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='sensor_data の期間・デバイスを指定してストリーミングで書き出す')
+    parser.add_argument('--output', required=True, help='出力先 (monthly: ディレクトリ, csv: ファイル or -, npz: ファイル)')
+    parser.add_argument('--format', choices=FORMATS, default='monthly', help='出力形式 (デフォルト: monthly)')
+    parser.add_argument('--start', help='開始 (YYYY-MM-DD[ HH:MM[:SS]])。省略時は最初から')
+    parser.add_argument('--end', help='終了 (この時刻を含む。日付のみならその日の終わりまで)。省略時は最後まで')
+    parser.add_argument('--device', help='デバイスID。省略時は全デバイス')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_ROWS, help='1回に受け取る行数')
+    parser.add_argument('--sqlite', metavar='PATH', help='MySQL の代わりに SQLite ファイルから読む')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+    try:
+        engine = storage.create_engine_for('sqlite' if args.sqlite else None, sqlite_path=args.sqlite,
+                                           driver='pymysql')
+        rows, written = export(engine, os.path.expanduser(args.output) if args.output != '-' else '-',
+                               args.format, args.start, args.end, args.device, args.batch_size)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.output != '-':
+        print(f"{rows:,}行を {len(written)}ファイルに書き出しました。", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
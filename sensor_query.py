@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+SensorQuery: 月次生データファイルに対する時間範囲クエリ。
+
+`temp_humid_YYYY-MM.txt` を mmap し、行頭タイムスタンプで二分探索して
+指定範囲の行だけを読み出す。月をまたぐ範囲は該当月のファイルを順に処理する。
+旧フォーマット (HH:MM) と v6 フォーマット (HH:MM:SS) の混在に対応 (REQ-01.1)。
+
+サイドカー索引 (monthly_index) が最新なら、日ごとのオフセットで探索範囲を
+先に絞り込む。索引上で時系列順でないファイルは線形走査にフォールバックする。
+
+使い方:
+    python sensor_query.py --dir ~/sensor_data_downloads --start "2025-08-14 02:00" --end "2025-08-14 05:00"
+    python sensor_query.py --benchmark 3000000
+"""
+import argparse
+import mmap
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import monthly_index
+
+MONTHLY_FILE_TEMPLATE = "temp_humid_{month}.txt"
+
+# 正規化済みキー "YYYY-MM-DD HH:MM:SS" の長さ
+KEY_LENGTH = 19
+
+
+def to_key(value, end_of_range=False):
+    """
+    クエリ境界 (datetime または文字列) を正規化キー (bytes) に変換する。
+    日付のみ指定時は、開始側は 00:00:00、終了側は 23:59:59 とみなす。
+    """
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S").encode("ascii")
+    text = str(value).strip()
+    if len(text) == 10:
+        text += " 23:59:59" if end_of_range else " 00:00:00"
+    elif len(text) == 16:
+        text += ":59" if end_of_range else ":00"
+    datetime.strptime(text, "%Y-%m-%d %H:%M:%S")  # 形式チェック
+    return text.encode("ascii")
+
+
+def line_key(buf, start):
+    """
+    buf[start:] から始まる行の正規化キーを返す。タイムスタンプとして解釈できない行は None。
+    "YYYY-MM-DD HH:MM," (旧) は秒 ":00" を補って比較する。
+    """
+    head = buf[start:start + KEY_LENGTH + 1]
+    if len(head) < 17 or head[4:5] != b"-" or head[10:11] != b" ":
+        return None
+    if head[16:17] == b",":
+        return head[:16] + b":00"
+    if head[16:17] == b":" and head[19:20] == b",":
+        return head[:KEY_LENGTH]
+    return None
+
+
+def _next_valid_line(mm, pos, limit):
+    """pos 以降で最初にキーを持つ行の (key, 行頭, 次行頭) を返す。無ければ None"""
+    while pos < limit:
+        end = mm.find(b"\n", pos, limit)
+        end = limit if end < 0 else end + 1
+        key = line_key(mm, pos)
+        if key is not None:
+            return key, pos, end
+        pos = end
+    return None
+
+
+def lower_bound(mm, target, lo=0, hi=None, inclusive=False):
+    """
+    時系列順のバッファで、キーが target 以上 (inclusive=True なら target 超) となる
+    最初の行頭オフセットを二分探索で求める。lo は行頭である必要がある。
+    """
+    if hi is None:
+        hi = len(mm)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        start = mm.rfind(b"\n", lo, mid) + 1
+        if start == 0:
+            start = lo
+        found = _next_valid_line(mm, start, hi)
+        if found is None:
+            hi = start
+            continue
+        key, _, next_start = found
+        if key < target or (inclusive and key == target):
+            lo = next_start
+        else:
+            hi = start
+    return lo
+
+
+def _iter_months(start_key, end_key):
+    """範囲に含まれる "YYYY-MM" を順に列挙する"""
+    year, month = int(start_key[:4]), int(start_key[5:7])
+    last = (int(end_key[:4]), int(end_key[5:7]))
+    while (year, month) <= last:
+        yield f"{year:04d}-{month:02d}"
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+
+
+def _narrow_by_index(filepath, start_key, end_key, size):
+    """
+    サイドカー索引で探索範囲を日単位に絞る。
+    戻り値: (lo, hi, sorted)。索引が無い/古い場合はファイル全体を対象にする。
+    """
+    index = monthly_index.load_index(filepath)
+    if index is None:
+        return 0, size, True
+    if not index.get("sorted"):
+        return 0, size, False
+    start_day = start_key[:10].decode("ascii")
+    end_day = end_key[:10].decode("ascii")
+    lo, hi = 0, size
+    for day in sorted(index.get("day_offsets", {})):
+        offset = index["day_offsets"][day][0]
+        if day <= start_day:
+            lo = offset
+        elif day > end_day:
+            hi = offset
+            break
+    return lo, hi, True
+
+
+def _scan_file(filepath, start_key, end_key):
+    """1ファイル分の範囲内の行 (bytes, 改行なし) を順に返す"""
+    size = os.path.getsize(filepath)
+    if size == 0:
+        return
+    with open(filepath, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        lo, hi, is_sorted = _narrow_by_index(filepath, start_key, end_key, size)
+        if is_sorted:
+            begin = lower_bound(mm, start_key, lo, hi)
+            stop = lower_bound(mm, end_key, begin, hi, inclusive=True)
+        else:
+            begin, stop = 0, size
+
+        pos = begin
+        while pos < stop:
+            end = mm.find(b"\n", pos, stop)
+            end = stop if end < 0 else end
+            key = line_key(mm, pos)
+            if key is not None and start_key <= key <= end_key:
+                yield mm[pos:end].rstrip(b"\r")
+            pos = end + 1
+
+
+def iter_range(data_dir, start, end):
+    """
+    [start, end] (両端含む) の行を、月をまたいで時系列順にストリーミングで返す。
+    不正行は読み飛ばす。存在しない月は無視する。
+    """
+    start_key = to_key(start)
+    end_key = to_key(end, end_of_range=True)
+    if start_key > end_key:
+        return
+    for month in _iter_months(start_key.decode("ascii"), end_key.decode("ascii")):
+        filepath = os.path.join(data_dir, MONTHLY_FILE_TEMPLATE.format(month=month))
+        if os.path.exists(filepath):
+            yield from _scan_file(filepath, start_key, end_key)
+
+
+def query_lines(data_dir, start, end):
+    """範囲内の行を文字列のリストで返す"""
+    return [line.decode("utf-8", "replace") for line in iter_range(data_dir, start, end)]
+
+
+def query_arrays(data_dir, start, end):
+    """
+    範囲内のデータを NumPy 配列で返す。
+    戻り値: {'timestamp': datetime64[s], 'temperature': float64, 'humidity': float64}
+    値が解釈できない行は除外する。
+    """
+    import numpy as np
+
+    timestamps, temps, hums = [], [], []
+    for line in iter_range(data_dir, start, end):
+        try:
+            ts, tmp, hum = line.split(b",")
+            temperature = float(tmp.split(b"=", 1)[1])
+            humidity = float(hum.split(b"=", 1)[1])
+        except (ValueError, IndexError):
+            continue
+        key = line_key(line, 0)
+        timestamps.append(key.decode("ascii").replace(" ", "T"))
+        temps.append(temperature)
+        hums.append(humidity)
+    return {
+        "timestamp": np.array(timestamps, dtype="datetime64[s]"),
+        "temperature": np.array(temps, dtype=np.float64),
+        "humidity": np.array(hums, dtype=np.float64),
+    }
+
+
+# --- ベンチマーク ---
+
+def _write_synthetic_month(path, lines, month_start):
+    """1ヶ月に lines 行を均等に並べた合成ファイルを書き出す (秒ありフォーマット)"""
+    step = timedelta(days=28) / lines
+    ts = month_start
+    with open(path, "w") as f:
+        buf = []
+        for i in range(lines):
+            buf.append(f"{ts:%Y-%m-%d %H:%M:%S},tmp={20 + (i % 100) / 10:.1f},hum={50 + (i % 50) / 10:.1f}\n")
+            ts += step
+            if len(buf) >= 100000:
+                f.writelines(buf)
+                buf = []
+        f.writelines(buf)
+
+
+def run_benchmark(lines, queries=200, window_hours=3):
+    """lines 行の月次ファイルに対し、ランダムな window_hours 幅の範囲クエリの遅延を測定する"""
+    month_start = datetime(2025, 8, 1)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, MONTHLY_FILE_TEMPLATE.format(month="2025-08"))
+        t0 = time.perf_counter()
+        _write_synthetic_month(path, lines, month_start)
+        print(f"合成ファイル作成: {lines:,}行, {os.path.getsize(path) / 1e6:.1f}MB ({time.perf_counter() - t0:.1f}s)")
+
+        rng = random.Random(0)
+        latencies, total_rows = [], 0
+        for _ in range(queries):
+            start = month_start + timedelta(seconds=rng.randrange(27 * 86400))
+            end = start + timedelta(hours=window_hours)
+            t0 = time.perf_counter()
+            total_rows += sum(1 for _ in iter_range(tmpdir, start, end))
+            latencies.append(time.perf_counter() - t0)
+
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000
+        p95 = latencies[int(len(latencies) * 0.95)] * 1000
+        print(f"二分探索クエリ ({window_hours}時間幅 x {queries}回): p50={p50:.2f}ms, p95={p95:.2f}ms, "
+              f"平均 {total_rows / queries:,.0f}行/クエリ")
+
+        # 比較: ファイル全体を線形走査した場合
+        t0 = time.perf_counter()
+        start_key, end_key = to_key(month_start + timedelta(days=13)), to_key(month_start + timedelta(days=13, hours=window_hours))
+        with open(path, "rb") as f:
+            hits = sum(1 for line in f if start_key <= (line_key(line, 0) or b"") <= end_key)
+        print(f"比較: 全行線形走査 1回 = {(time.perf_counter() - t0) * 1000:.1f}ms ({hits:,}行ヒット)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='月次生データファイルの時間範囲クエリ（mmap + 二分探索）')
+    parser.add_argument('--dir', type=str, default=os.path.expanduser('~/sensor_data_downloads/'),
+                        help='月次ファイルのディレクトリ')
+    parser.add_argument('--start', type=str, help='開始時刻 (YYYY-MM-DD[ HH:MM[:SS]])')
+    parser.add_argument('--end', type=str, help='終了時刻 (両端含む)')
+    parser.add_argument('--benchmark', type=int, metavar='LINES', help='LINES行の合成ファイルで遅延を測定')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        run_benchmark(args.benchmark)
+        return
+    if not args.start or not args.end:
+        parser.error('--start と --end を指定してください')
+
+    count = 0
+    for line in iter_range(args.dir, args.start, args.end):
+        print(line.decode("utf-8", "replace"))
+        count += 1
+    print(f"{count}行", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
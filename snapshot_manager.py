@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+SnapshotManager: ハードリンクによる世代付きスナップショット (backup.sh の置き換え)。
+
+スナップショット先 (SDカード) に `YYYYmmdd-HHMMSS/` を1世代として作成する。
+- 前世代から変化していないファイル (締まった過去月・索引など) はハードリンクで共有
+  → ディスク消費・I/Oともにほぼゼロ
+- 追記されたファイル (当月の月次ファイル) は、前世代のコピーがソースの先頭部分と一致し、
+  かつスナップショット先が reflink (FICLONE。btrfs / XFS など) に対応していれば、
+  前世代とデータブロックを共有する複製に「新しく追記されたバイトのみ」を書き足す。
+  それ以外 (SDカードの ext4 など) はソース (RAM) から全体をコピーする
+  (前世代を SD カード上で複製してから追記すると、全体コピーより読み書きが増えるため)
+- 作業用の `.tmp` ディレクトリに作ってから rename するため、途中で電源が落ちても
+  中途半端な世代は残らない
+- 保持ポリシー: 直近 keep_last 世代 + 過去 keep_daily 日分の各日の最終世代
+
+SensorCopier の全体同期時と、シャットダウン時 (systemd の ExecStop など) から呼ぶ:
+    python3 snapshot_manager.py --source /tmp/sensor_data --dest /home/hideo_81_g/sensor_data_backup/snapshots
+
+RPi (Python 3.7 / 標準ライブラリのみ) 対応。
+"""
+import argparse
+import logging
+import os
+import re
+import shutil
+import sys
+import time
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:  # Linux 以外 (開発機) では reflink を使わない
+    fcntl = None
+
+logger = logging.getLogger("SensorCopier.SnapshotManager")
+
+SNAPSHOT_NAME_FORMAT = "%Y%m%d-%H%M%S"
+_SNAPSHOT_NAME_RE = re.compile(r"^\d{8}-\d{6}$")
+
+LATEST_LINK_NAME = "latest"
+
+DEFAULT_KEEP_LAST = 12
+DEFAULT_KEEP_DAILY = 30
+
+# 前世代のコピーがソースの先頭部分と一致するかを確認する末尾範囲 (bytes)
+PREFIX_CHECK_BYTES = 64 * 1024
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# linux/fs.h の FICLONE: 同じファイルシステム上でデータブロックを共有する複製を作る ioctl
+_FICLONE = 0x40049409
+
+
+def list_snapshots(snapshot_root):
+    """確定済みのスナップショット名を古い順に返す"""
+    if not os.path.isdir(snapshot_root):
+        return []
+    return sorted(name for name in os.listdir(snapshot_root)
+                  if _SNAPSHOT_NAME_RE.match(name) and os.path.isdir(os.path.join(snapshot_root, name)))
+
+
+def _same_content_hint(src_stat, prev_stat):
+    """サイズと更新時刻 (ns) が一致すれば未変更とみなす (rsync と同じ判定)"""
+    return src_stat.st_size == prev_stat.st_size and src_stat.st_mtime_ns == prev_stat.st_mtime_ns
+
+
+def _is_prefix(prev_path, prev_size, src_path):
+    """前世代のコピーが、ソースの先頭 prev_size バイトと一致するか (末尾側のみ比較)"""
+    check_from = max(0, prev_size - PREFIX_CHECK_BYTES)
+    with open(prev_path, "rb") as prev, open(src_path, "rb") as src:
+        prev.seek(check_from)
+        src.seek(check_from)
+        return prev.read() == src.read(prev_size - check_from)
+
+
+def _reflink(src_path, dst_path):
+    """
+    src_path とデータブロックを共有する dst_path を作る (データは書かない)。
+    ファイルシステムが対応していなければ False を返し、dst_path は残さない
+    """
+    if fcntl is None:
+        return False
+    with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+            return True
+        except OSError:
+            pass
+    os.remove(dst_path)
+    return False
+
+
+def _copy_from(src_path, dst, offset=0):
+    """src_path の offset 以降を開いたファイル dst に書き、書いたバイト数を返す"""
+    written = 0
+    with open(src_path, "rb") as src:
+        src.seek(offset)
+        for block in iter(lambda: src.read(COPY_CHUNK_SIZE), b""):
+            dst.write(block)
+            written += len(block)
+    return written
+
+
+def _snapshot_file(src_path, prev_path, dst_path):
+    """
+    1ファイルをスナップショットに入れる。
+    戻り値: (方法, スナップショット先に書いたバイト数)。方法は "link" / "append" / "copy"
+    """
+    src_stat = os.stat(src_path)
+    prev_stat = os.stat(prev_path) if prev_path and os.path.isfile(prev_path) else None
+
+    if prev_stat is not None and _same_content_hint(src_stat, prev_stat):
+        os.link(prev_path, dst_path)
+        return "link", 0
+
+    if prev_stat is not None and 0 < prev_stat.st_size <= src_stat.st_size and \
+            _is_prefix(prev_path, prev_stat.st_size, src_path) and _reflink(prev_path, dst_path):
+        # 前世代とブロックを共有する複製に、追記分だけをソースから書き足す
+        method = "append"
+        with open(dst_path, "ab") as dst:
+            written = _copy_from(src_path, dst, prev_stat.st_size)
+    else:
+        method = "copy"
+        with open(dst_path, "wb") as dst:
+            written = _copy_from(src_path, dst)
+
+    with open(dst_path, "rb+") as f:
+        os.fsync(f.fileno())
+    shutil.copystat(src_path, dst_path)
+    return method, written
+
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def take_snapshot(source_dir, snapshot_root, now=None):
+    """
+    source_dir の通常ファイルを1世代としてスナップショットする。
+    戻り値: (スナップショットのパス, {"link": n, "append": n, "copy": n, "bytes": 書いたバイト数})
+    同じ秒に既に世代がある場合はそれを返す (シャットダウン時の二重実行対策)。
+    """
+    now = now or datetime.now()
+    name = now.strftime(SNAPSHOT_NAME_FORMAT)
+    os.makedirs(snapshot_root, exist_ok=True)
+    final_path = os.path.join(snapshot_root, name)
+    if os.path.isdir(final_path):
+        return final_path, {}
+
+    existing = list_snapshots(snapshot_root)
+    prev_dir = os.path.join(snapshot_root, existing[-1]) if existing else None
+
+    work_path = final_path + ".tmp"
+    if os.path.exists(work_path):
+        shutil.rmtree(work_path)
+    os.makedirs(work_path)
+
+    counts = {"link": 0, "append": 0, "copy": 0, "bytes": 0}
+    try:
+        for filename in sorted(os.listdir(source_dir)):
+            src_path = os.path.join(source_dir, filename)
+            if not os.path.isfile(src_path) or filename.endswith(".tmp"):
+                continue
+            prev_path = os.path.join(prev_dir, filename) if prev_dir else None
+            method, written = _snapshot_file(src_path, prev_path, os.path.join(work_path, filename))
+            counts[method] += 1
+            counts["bytes"] += written
+        _fsync_dir(work_path)
+        os.rename(work_path, final_path)
+        _fsync_dir(snapshot_root)
+    except Exception:
+        shutil.rmtree(work_path, ignore_errors=True)
+        raise
+
+    _update_latest_link(snapshot_root, name)
+    return final_path, counts
+
+
+def _update_latest_link(snapshot_root, name):
+    link_path = os.path.join(snapshot_root, LATEST_LINK_NAME)
+    temp_link = link_path + ".tmp"
+    try:
+        if os.path.lexists(temp_link):
+            os.remove(temp_link)
+        os.symlink(name, temp_link)
+        os.replace(temp_link, link_path)
+    except OSError as e:
+        logger.warning(f"latestリンクの更新に失敗: {e}")
+
+
+def select_for_deletion(names, keep_last=DEFAULT_KEEP_LAST, keep_daily=DEFAULT_KEEP_DAILY, now=None):
+    """保持ポリシーに従い、削除対象の世代名を返す"""
+    names = sorted(names)
+    keep = set(names[-keep_last:]) if keep_last > 0 else set()
+
+    now = now or datetime.now()
+    oldest_day = (now - timedelta(days=keep_daily - 1)).strftime("%Y%m%d") if keep_daily > 0 else None
+    last_of_day = {}
+    for name in names:
+        last_of_day[name[:8]] = name
+    if oldest_day is not None:
+        keep.update(name for day, name in last_of_day.items() if day >= oldest_day)
+    return [name for name in names if name not in keep]
+
+
+def prune_snapshots(snapshot_root, keep_last=DEFAULT_KEEP_LAST, keep_daily=DEFAULT_KEEP_DAILY, now=None):
+    """保持ポリシー外の世代を削除する。削除した世代名のリストを返す"""
+    removed = select_for_deletion(list_snapshots(snapshot_root), keep_last, keep_daily, now)
+    for name in removed:
+        shutil.rmtree(os.path.join(snapshot_root, name))
+    # 中断された作業ディレクトリの掃除
+    for name in os.listdir(snapshot_root):
+        if name.endswith(".tmp") and _SNAPSHOT_NAME_RE.match(name[:-4]):
+            shutil.rmtree(os.path.join(snapshot_root, name), ignore_errors=True)
+    return removed
+
+
+def snapshot_and_prune(source_dir, snapshot_root, keep_last=DEFAULT_KEEP_LAST,
+                       keep_daily=DEFAULT_KEEP_DAILY, now=None):
+    """スナップショット取得 + 古い世代の削除をまとめて行い、ログに残す"""
+    started = time.perf_counter()
+    path, counts = take_snapshot(source_dir, snapshot_root, now=now)
+    removed = prune_snapshots(snapshot_root, keep_last, keep_daily, now=now)
+    logger.info(
+        f"スナップショット作成: {os.path.basename(path)} "
+        f"(リンク {counts.get('link', 0)}, 追記 {counts.get('append', 0)}, コピー {counts.get('copy', 0)}, "
+        f"書き込み {counts.get('bytes', 0):,}bytes, "
+        f"削除世代 {len(removed)}, {time.perf_counter() - started:.3f}秒)"
+    )
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='センサーデータのハードリンク・スナップショット')
+    parser.add_argument('--source', default='/tmp/sensor_data', help='スナップショット元 (RAMバッファ)')
+    parser.add_argument('--dest', default='/home/hideo_81_g/sensor_data_backup/snapshots', help='スナップショット先')
+    parser.add_argument('--keep-last', type=int, default=DEFAULT_KEEP_LAST, help='直近で保持する世代数')
+    parser.add_argument('--keep-daily', type=int, default=DEFAULT_KEEP_DAILY, help='日次で保持する日数')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if not os.path.isdir(args.source):
+        logger.warning(f"スナップショット元が見つかりません: {args.source}")
+        sys.exit(1)
+    snapshot_and_prune(args.source, args.dest, args.keep_last, args.keep_daily)
+
+
+if __name__ == "__main__":
+    main()
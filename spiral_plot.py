@@ -1,131 +1,285 @@
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-plt.rcParams['font.family'] = 'Hiragino Sans' # ★ 日本語の文字化け対策
-import matplotlib.animation as animation
-from matplotlib.collections import LineCollection
-import imageio
+#!/usr/bin/env python3
+"""
+SpiralPlot: 1か月分の温度・湿度を螺旋 (角度 = 時刻, 半径 = 温度, 色 = 湿度) で描くアニメーション GIF。
+
+- 線分 (segments) と色は最初に1回だけ計算する。各フレームでは、前のフレームまでの画像
+  (Agg のバッファ) を戻し、増えた点の線分だけを描き足す。1フレームの処理量は描き足す点の数に比例し、
+  全体でも点の数に比例する (以前は毎フレーム先頭からの線分を作り直して全部描いていたため二乗)
+- --workers を指定すると、フレームを連続した範囲に分けてプロセスプールで描き、順に GIF につなぐ。
+  各プロセスは担当範囲の直前までの線分を1回で描いてから、描き足しを始める
+- 線分の色は全期間の湿度の範囲 (カラーバーと同じ) に固定する (描き足した線分の色は後から変えられないため)
+- グリッドは線分の下に描く (描き足した線分がグリッドの上に重なるため、全体でそろえる)
+
+使い方:
+    python spiral_plot.py --file ~/sensor_data_downloads/temp_humid_2025-08.txt --start 2025-08-01
+    python spiral_plot.py --workers 4
+    python spiral_plot.py --benchmark
+"""
+import argparse
 import os
+import tempfile
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+from itertools import chain
+
+import matplotlib
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.cm import ScalarMappable
+from matplotlib.collections import LineCollection
+from matplotlib.colors import Normalize
+from matplotlib.figure import Figure
+from PIL import Image
 
-# --- ステップ1 & 2: データの準備 ---
-# 実際のファイルパスに置き換えてください
-file_path = '/Users/kataokahideo/sensor_data_downloads/temp_humid_2025-08.txt'
+import month_cache
 
-# read_csvで直接パース
-df_raw = pd.read_csv(
-    file_path,
-    header=None,
-    names=['datetime_str', 'tmp_str', 'hum_str']
-)
+matplotlib.rcParams['font.family'] = 'Hiragino Sans' # ★ 日本語の文字化け対策
 
-# データ前処理
-df_raw['datetime'] = pd.to_datetime(df_raw['datetime_str'], errors='coerce')
-df_raw['tmp'] = pd.to_numeric(df_raw['tmp_str'].str.extract(r'(\d+\.\d)')[0], errors='coerce')
-df_raw['hum'] = pd.to_numeric(df_raw['hum_str'].str.extract(r'(\d+\.\d)')[0], errors='coerce')
+# 実際のファイルパス・出力先に置き換えてください (--file / --output-dir でも指定できる)
+DEFAULT_FILE_PATH = '/Users/kataokahideo/sensor_data_downloads/temp_humid_2025-08.txt'
+DEFAULT_OUTPUT_DIR = '/Users/kataokahideo/Desktop/Summer2025/Results'
+DEFAULT_START_DATE = '2025-08-01'
+GIF_NAME = 'temperature_humidity_spiral_enhanced.gif'
+PNG_NAME = 'final_spiral_enhanced.png'
 
-df = df_raw[['datetime', 'tmp', 'hum']].dropna().sort_values('datetime').reset_index(drop=True)
+TOTAL_DAYS = 31 # 31日分を対象にする
+POINTS_PER_FRAME = 72
+FPS = 20
+FIGSIZE = (8, 8)
+GIF_DPI = 100 # dpiを指定してファイルサイズを調整
+PNG_DPI = 150
 
-# 8月1日から31日までのデータを抽出
-start_date = datetime(2025, 8, 1)
-end_date = start_date + timedelta(days=31) # 31日分を対象にする
-df = df[(df['datetime'] >= start_date) & (df['datetime'] < end_date)].copy() # SettingWithCopyWarningを回避
+# 螺旋の線分と色 (最初に1回だけ計算する)
+Spiral = namedtuple("Spiral", ["segments", "colors", "hours", "start_date",
+                               "min_temp", "max_temp", "min_hum", "max_hum"])
 
-# ★ データの最小・最大温度を動的に取得
-min_temp = df['tmp'].min()
-max_temp = df['tmp'].max()
 
-# 螺旋軌跡のための列を計算
-df['total_hours'] = (df['datetime'] - start_date) / timedelta(hours=1)
-# ★ 半径を動的な温度範囲で正規化（オフセットは削除）
-df['r'] = (df['tmp'] - min_temp) / (max_temp - min_temp)
+def load_month(file_path, start_date, days=TOTAL_DAYS):
+    """解析済みの月次データをキャッシュ (month_cache) から読み、start_date から days 日分を返す"""
+    df = month_cache.load_dataframe(file_path).rename(
+        columns={'timestamp': 'datetime', 'temperature': 'tmp', 'humidity': 'hum'})
+    df = df.sort_values('datetime').reset_index(drop=True)
+    end_date = start_date + timedelta(days=days)
+    return df[(df['datetime'] >= start_date) & (df['datetime'] < end_date)]
 
-# 角度は累積時間で計算
-df['theta'] = 2 * np.pi * df['total_hours'] / 24
 
-# --- ステップ3: アニメーションの準備 ---
-POINTS_PER_FRAME = 72
-TOTAL_DAYS = 31 # 31日分に変更
-NUM_FRAMES = int(np.ceil(len(df) / POINTS_PER_FRAME)) + 1
+def build_spiral(df, start_date):
+    """datetime / tmp / hum の DataFrame から、全フレームで使う線分と色を計算する"""
+    min_temp, max_temp = df['tmp'].min(), df['tmp'].max()
+    hours = ((df['datetime'] - start_date) / timedelta(hours=1)).to_numpy()
+    # ★ 半径を動的な温度範囲で正規化、角度は累積時間で計算
+    r = ((df['tmp'] - min_temp) / (max_temp - min_temp)).to_numpy()
+    theta = 2 * np.pi * hours / 24
+    humidity = df['hum'].to_numpy()
 
-fig = plt.figure(figsize=(8, 8))
-ax = fig.add_subplot(111, projection='polar')
-line_collection = LineCollection([], cmap='viridis', lw=1.5, alpha=0.6) # ★ 透明度を上げて見やすくする
-ax.add_collection(line_collection)
+    points = np.column_stack([theta, r]).reshape(-1, 1, 2)
+    segments = np.concatenate([points[:-1], points[1:]], axis=1)
+    colors = (humidity[:-1] + humidity[1:]) / 2
+    return Spiral(segments, colors, hours, start_date, min_temp, max_temp, humidity.min(), humidity.max())
 
-# カラーバー用の設定
-sm = plt.cm.ScalarMappable(cmap='viridis', norm=plt.Normalize(vmin=df['hum'].min(), vmax=df['hum'].max()))
-cbar = fig.colorbar(sm, ax=ax, pad=0.1) # padでカラーバーとプロットの間隔を調整
-cbar.set_label('Humidity (%)', weight='bold')
 
-# ★ Grok提案3: 進行バー用のテキストオブジェクトを初期化
-progress_text = fig.text(0.5, 0.02, '', ha='center', transform=fig.transFigure, fontsize=10)
+def frame_count(spiral):
+    return int(np.ceil(len(spiral.hours) / POINTS_PER_FRAME)) + 1
 
-# ★ 左上の注釈をプロット外に一度だけ描画
-fig.suptitle('Temperature & Humidity Spiral (August 2025)', fontsize=16, weight='bold')
-fig.text(0.05, 0.92, f'Radius: Temp ({min_temp:.1f}-{max_temp:.1f}°C)', transform=fig.transFigure)
-fig.text(0.05, 0.89, 'Color: Humidity', transform=fig.transFigure)
 
-# --- ステップ4: 各フレームの描画関数 ---
-def animate(n):
+def frame_end(spiral, n):
+    """フレーム n までに描く点の数"""
+    return min(n * POINTS_PER_FRAME, len(spiral.hours))
+
+
+def _create_figure(spiral):
+    """軸・カラーバー・注釈を1回だけ設定した Figure を作る。戻り値: (fig, ax, 線分, 進行テキスト)"""
+    fig = Figure(figsize=FIGSIZE)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111, projection='polar')
     ax.set_rlim(0, 1.2) # ★ 半径の上限を1.2に
     ax.set_rticks([0.25, 0.5, 0.75, 1.0])
     ax.set_rlabel_position(22.5)
     ax.set_theta_zero_location('N')
     ax.set_theta_direction(-1)
+    ax.set_axisbelow(True)
     ax.grid(True, linestyle='--', alpha=0.3)
-    
+
     # ★ 円周のラベルを角度から時刻に変更
     hours = np.arange(0, 24, 3)
-    hour_labels = [f'{h}:00' for h in hours]
-    hour_angles = hours * 2 * np.pi / 24
-    ax.set_xticks(hour_angles)
-    ax.set_xticklabels(hour_labels)
-    
-    end_index = min(n * POINTS_PER_FRAME, len(df))
-    data_subset = df.iloc[:end_index]
-    
-    if data_subset.empty:
-        ax.set_title("開始: 温度・湿度 螺旋軌跡 (2025/08)")
-        return
+    ax.set_xticks(hours * 2 * np.pi / 24)
+    ax.set_xticklabels([f'{h}:00' for h in hours])
 
-    theta = data_subset['theta'].values
-    r = data_subset['r'].values
-    humidity = data_subset['hum'].values
-    
-    if len(theta) < 2:
-        return
+    norm = Normalize(vmin=spiral.min_hum, vmax=spiral.max_hum)
+    line_collection = LineCollection([], cmap='viridis', norm=norm, lw=1.5, alpha=0.6) # ★ 透明度を上げて見やすくする
+    ax.add_collection(line_collection)
 
-    points = np.array([theta, r]).T.reshape(-1, 1, 2)
-    segments = np.concatenate([points[:-1], points[1:]], axis=1)
-    
-    line_collection.set_segments(segments)
-    segment_colors = (humidity[:-1] + humidity[1:]) / 2
-    line_collection.set_array(segment_colors)
-
-    current_date = start_date + timedelta(hours=data_subset['total_hours'].iloc[-1])
-    ax.set_title(f'Date: {current_date.strftime("%Y-%m-%d %H:%M")} | Points: {len(data_subset)}', y=1.05)
-    
+    # カラーバー用の設定
+    cbar = fig.colorbar(ScalarMappable(cmap='viridis', norm=norm), ax=ax, pad=0.1) # padでカラーバーとプロットの間隔を調整
+    cbar.set_label('Humidity (%)', weight='bold')
+
+    # ★ Grok提案3: 進行バー用のテキストオブジェクトを初期化
+    progress_text = fig.text(0.5, 0.02, '', ha='center', transform=fig.transFigure, fontsize=10)
+
+    # ★ 左上の注釈をプロット外に一度だけ描画
+    fig.suptitle(f'Temperature & Humidity Spiral ({spiral.start_date:%B %Y})', fontsize=16, weight='bold')
+    fig.text(0.05, 0.92, f'Radius: Temp ({spiral.min_temp:.1f}-{spiral.max_temp:.1f}°C)', transform=fig.transFigure)
+    fig.text(0.05, 0.89, 'Color: Humidity', transform=fig.transFigure)
+    ax.set_title('', y=1.05)
+    return fig, ax, line_collection, progress_text
+
+
+def _set_frame_text(ax, progress_text, spiral, n, end_index):
+    if end_index == 0:
+        ax.title.set_text(f"開始: 温度・湿度 螺旋軌跡 ({spiral.start_date:%Y/%m})")
+        return
+    current_date = spiral.start_date + timedelta(hours=spiral.hours[end_index - 1])
+    ax.title.set_text(f'Date: {current_date.strftime("%Y-%m-%d %H:%M")} | Points: {end_index}')
     # ★ Grok提案3: 進行バーを更新
-    progress_text.set_text(f'Progress: {n}/{NUM_FRAMES-1}')
+    progress_text.set_text(f'Progress: {n}/{frame_count(spiral) - 1}')
+
+
+def gif_palette(spiral):
+    """
+    全フレーム共通の 256 色パレット。線分がすべて描かれた最終フレームから作る。
+    フレームごとに適応パレットを作る (PillowWriter と同じ) より1桁速く、GIF も小さくなる
+    """
+    fig, ax, line_collection, progress_text = _create_figure(spiral)
+    line_collection.set_segments(spiral.segments)
+    line_collection.set_array(spiral.colors)
+    n = frame_count(spiral) - 1
+    _set_frame_text(ax, progress_text, spiral, n, frame_end(spiral, n))
+    fig.canvas.draw()
+    rgb = np.asarray(fig.canvas.buffer_rgba())[:, :, :3]
+    return Image.fromarray(rgb).convert('P', palette=Image.Palette.ADAPTIVE)
+
+
+def render_frames(spiral, first=0, stop=None, palette=None):
+    """
+    フレーム [first, stop) を順に描き、GIF 用のパレット画像 (PIL, モード P) を返す。
+    前のフレームの画像に、増えた線分だけを描き足す。palette は gif_palette() の結果
+    """
+    stop = frame_count(spiral) if stop is None else stop
+    palette = gif_palette(spiral) if palette is None else palette
+    fig, ax, line_collection, progress_text = _create_figure(spiral)
+    canvas = fig.canvas
+    # 線分・タイトル・進行テキストのない背景
+    canvas.draw()
+    background = canvas.copy_from_bbox(fig.bbox)
+    drawn = 0
+    for n in range(first, stop):
+        end_index = frame_end(spiral, n)
+        canvas.restore_region(background)
+        target = max(end_index - 1, 0)
+        if target > drawn:
+            line_collection.set_segments(spiral.segments[drawn:target])
+            line_collection.set_array(spiral.colors[drawn:target])
+            ax.draw_artist(line_collection)
+            drawn = target
+            background = canvas.copy_from_bbox(fig.bbox)
+        _set_frame_text(ax, progress_text, spiral, n, end_index)
+        ax.draw_artist(ax.title)
+        fig.draw_artist(progress_text)
+        rgb = np.asarray(canvas.buffer_rgba())[:, :, :3]
+        yield Image.fromarray(rgb).quantize(palette=palette, dither=Image.Dither.NONE)
+
+
+def _render_range(spiral, first, stop, palette):
+    # プロセスプールで実行する (ジェネレーターは渡せないため、担当範囲の画像をまとめて返す)
+    return list(render_frames(spiral, first, stop, palette))
+
+
+def frame_ranges(total, workers):
+    """フレーム [0, total) を workers 個の連続した範囲に分ける"""
+    bounds = np.linspace(0, total, max(1, min(workers, total)) + 1).astype(int)
+    return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+def write_gif(spiral, path, workers=1):
+    """アニメーション GIF を書く (workers > 1 ならフレームの範囲ごとにプロセスプールで描いて順につなぐ)"""
+    total = frame_count(spiral)
+    palette = gif_palette(spiral)
+    if workers > 1:
+        ranges = frame_ranges(total, workers)
+        with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+            futures = [pool.submit(_render_range, spiral, first, stop, palette) for first, stop in ranges]
+            frames = chain.from_iterable(future.result() for future in futures)
+            _save_gif(frames, path)
+    else:
+        _save_gif(render_frames(spiral, palette=palette), path)
+    return total
+
+
+def _save_gif(frames, path):
+    first = next(frames)
+    first.save(path, save_all=True, append_images=frames, duration=int(1000 / FPS), loop=0)
+
+
+def save_final_png(spiral, path):
+    """最終フレームを PNG で保存する"""
+    fig, ax, line_collection, progress_text = _create_figure(spiral)
+    line_collection.set_segments(spiral.segments)
+    line_collection.set_array(spiral.colors)
+    n = frame_count(spiral) - 1
+    _set_frame_text(ax, progress_text, spiral, n, frame_end(spiral, n))
+    # ★ Grok提案4: bbox_inches='tight'で余白を最適化
+    fig.savefig(path, dpi=PNG_DPI, bbox_inches='tight')
+
+
+def synthetic_month(start_date, minutes, days=TOTAL_DAYS):
+    """ベンチマーク用: minutes 分おきの days 日分の温度・湿度 (日周期 + ゆっくりした変化)"""
+    times = pd.date_range(start_date, start_date + timedelta(days=days), freq=f'{minutes}min', inclusive='left')
+    hours = (times - start_date) / timedelta(hours=1)
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        'datetime': times,
+        'tmp': 28 + 3 * np.sin(2 * np.pi * hours / 24) + np.sin(2 * np.pi * hours / 240) + rng.normal(0, 0.1, len(times)),
+        'hum': 60 - 8 * np.sin(2 * np.pi * hours / 24) + rng.normal(0, 0.5, len(times)),
+    })
+
+
+def run_benchmark(workers_list):
+    """1か月分 (15分間隔・1分間隔) の GIF 生成時間を、プロセス数ごとに計測する"""
+    start_date = datetime.strptime(DEFAULT_START_DATE, '%Y-%m-%d')
+    print(f"CPU {os.cpu_count()}コア, {POINTS_PER_FRAME}点/フレーム, {FIGSIZE[0] * GIF_DPI}x{FIGSIZE[1] * GIF_DPI}px")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for minutes in (15, 1):
+            spiral = build_spiral(synthetic_month(start_date, minutes), start_date)
+            for workers in workers_list:
+                path = os.path.join(tmpdir, f'spiral_{minutes}_{workers}.gif')
+                started = time.perf_counter()
+                frames = write_gif(spiral, path, workers)
+                seconds = time.perf_counter() - started
+                print(f"{minutes:>2}分間隔 {len(spiral.hours):>6,}点 {frames:>4}フレーム "
+                      f"workers={workers}: {seconds:7.2f}秒 ({seconds / frames * 1000:.0f}ms/フレーム, "
+                      f"{os.path.getsize(path) / 2**20:.1f}MB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='温度・湿度の螺旋アニメーション (GIF) と最終フレーム (PNG) を作る')
+    parser.add_argument('--file', default=DEFAULT_FILE_PATH, help='月次ファイル')
+    parser.add_argument('--start', default=DEFAULT_START_DATE, help=f'開始日 (デフォルト: {DEFAULT_START_DATE})')
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR, help='成果物の保存先ディレクトリ')
+    parser.add_argument('--workers', type=int, default=1, help='フレームを並列に描くプロセス数')
+    parser.add_argument('--benchmark', action='store_true', help='1か月分 (15分・1分間隔) の GIF 生成時間を計測する')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        run_benchmark(sorted({1, args.workers, os.cpu_count() or 1}))
+        return
 
-# --- ステップ5: アニメーション生成とGIF/PNG出力 ---
-ani = animation.FuncAnimation(fig, animate, frames=NUM_FRAMES, interval=50, blit=False)
+    start_date = datetime.strptime(args.start, '%Y-%m-%d')
+    spiral = build_spiral(load_month(args.file, start_date), start_date)
+    os.makedirs(args.output_dir, exist_ok=True)
 
-# 成果物の保存先ディレクトリを設定
-output_dir = '/Users/kataokahideo/Desktop/Summer2025/Results'
-os.makedirs(output_dir, exist_ok=True)
+    output_gif_path = os.path.join(args.output_dir, GIF_NAME)
+    print(f"アニメーションを生成し、'{output_gif_path}' に保存します...")
+    started = time.perf_counter()
+    frames = write_gif(spiral, output_gif_path, args.workers)
+    print(f"保存が完了しました。({frames}フレーム, {time.perf_counter() - started:.1f}秒)")
 
-output_gif_path = os.path.join(output_dir, 'temperature_humidity_spiral_enhanced.gif')
-print(f"アニメーションを生成し、'{output_gif_path}' に保存します...")
+    final_png_path = os.path.join(args.output_dir, PNG_NAME)
+    save_final_png(spiral, final_png_path)
+    print(f"最終フレームを '{final_png_path}' に保存しました。")
 
-# PillowWriterオブジェクトを作成し、durationとloopを直接渡す
-writer = animation.PillowWriter(fps=20)
-ani.save(output_gif_path, writer=writer, dpi=100) # dpiを指定してファイルサイズを調整
-print("保存が完了しました。")
 
-# 最終フレームをPNGで保存
-final_png_path = os.path.join(output_dir, 'final_spiral_enhanced.png')
-# ★ Grok提案4: bbox_inches='tight'で余白を最適化
-fig.savefig(final_png_path, dpi=150, bbox_inches='tight')
-print(f"最終フレームを '{final_png_path}' に保存しました。")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Storage: 取り込み先・可視化の読み込み元の DB (MySQL / 組み込みの SQLite) を選んでエンジンを作る。
+
+- mysql  : 従来どおり DB_HOST / DB_USER / DB_PASSWORD / DB_NAME の MySQL サーバー
+- sqlite : 1台構成向けの組み込みDB (SENSOR_DB_PATH のファイル)。ネットワーク越しの往復がなく、
+           ローカルだけでパイプライン全体をテスト・計測できる
+
+バックエンドは環境変数 SENSOR_DB_BACKEND (既定: mysql) で選ぶ。
+SQLite では接続ごとに WAL (書き込み中も読み込みを止めない)・synchronous=NORMAL・busy_timeout を設定する。
+UPSERT は bulk_loader が方言ごとに使い分け (SQLite は INSERT ... ON CONFLICT)、バッチごとに1トランザクションで書く。
+表と索引は devices / rollups / import_state が作成する (sensor_data の主キー (device_id, timestamp) と
+時刻の索引など)。可視化スクリプトが読むビュー (hourly_data, hourly_data_separate) は
+MySQL ではサーバー側で定義済みのため、SQLite の場合だけ同等のものを ensure_views() で作る。
+
+使い方:
+    SENSOR_DB_BACKEND=sqlite SENSOR_DB_PATH=~/sensor.db python unified_importer.py --no-download
+    python unified_importer.py --sqlite ~/sensor.db --no-download
+"""
+import logging
+import os
+
+from sqlalchemy import create_engine, event, text
+
+import devices
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("mysql", "sqlite")
+DEFAULT_BACKEND = "mysql"
+DEFAULT_SQLITE_PATH = os.path.expanduser("~/sensor_data.db")
+
+# ロックされていた場合に待つ時間 (ミリ秒)。取り込み中に可視化スクリプトが読んでも失敗しないように
+SQLITE_BUSY_TIMEOUT_MS = 30000
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}",
+    "PRAGMA temp_store = MEMORY",
+)
+
+# 時刻 (0〜24 の小数, 15分単位などで丸めて使う) つきのビュー。MySQL 側の同名ビューに合わせる
+SQLITE_VIEWS_SQL = [
+    """
+    CREATE VIEW IF NOT EXISTS hourly_data AS
+    SELECT timestamp,
+           CAST(strftime('%H', timestamp) AS REAL) + CAST(strftime('%M', timestamp) AS REAL) / 60.0 AS hour,
+           temperature, humidity
+    FROM sensor_data
+    """,
+    """
+    CREATE VIEW IF NOT EXISTS hourly_data_separate AS
+    SELECT 'sensor_data' AS source, timestamp,
+           CAST(strftime('%H', timestamp) AS REAL) + CAST(strftime('%M', timestamp) AS REAL) / 60.0 AS hour,
+           temperature, humidity
+    FROM sensor_data
+    """,
+]
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
+
+def create_sqlite_engine(path=None, **kwargs):
+    """SQLite ファイルのエンジン (接続ごとに WAL などを設定する)。path が None なら DEFAULT_SQLITE_PATH"""
+    path = os.path.expanduser(path or DEFAULT_SQLITE_PATH)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    engine = create_engine(f"sqlite:///{path}", **kwargs)
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    return engine
+
+
+def mysql_url(db_config, driver="mysqlconnector"):
+    return (f"mysql+{driver}://{db_config['user']}:{db_config.get('password') or ''}"
+            f"@{db_config['host']}/{db_config['database']}")
+
+
+def db_config_from_env():
+    return {
+        'host': os.environ.get('DB_HOST', 'localhost'),
+        'user': os.environ.get('DB_USER', 'root'),
+        'password': os.environ.get('DB_PASSWORD'),
+        'database': os.environ.get('DB_NAME', 'sensor_data_db'),
+    }
+
+
+def backend_from_env():
+    backend = os.environ.get('SENSOR_DB_BACKEND', DEFAULT_BACKEND).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"未対応の SENSOR_DB_BACKEND です: {backend} ({' / '.join(BACKENDS)})")
+    return backend
+
+
+def create_engine_for(backend=None, sqlite_path=None, db_config=None, driver="mysqlconnector", **kwargs):
+    """
+    backend (None なら sqlite_path の指定か環境変数で決める) のエンジンを作る。
+    MySQL でパスワードが無い場合は ValueError
+    """
+    backend = backend or ("sqlite" if sqlite_path else backend_from_env())
+    if backend == "sqlite":
+        return create_sqlite_engine(sqlite_path or os.environ.get('SENSOR_DB_PATH'), **kwargs)
+    db_config = db_config or db_config_from_env()
+    if not db_config.get('password'):
+        raise ValueError("データベースのパスワードが設定されていません。環境変数 'DB_PASSWORD' を設定してください。")
+    return create_engine(mysql_url(db_config, driver), **kwargs)
+
+
+def ensure_views(engine):
+    """SQLite の場合、可視化スクリプトが読むビューを作る (MySQL ではサーバー側の定義を使う)"""
+    if engine.dialect.name != "sqlite":
+        return
+    devices.ensure_schema(engine)
+    with engine.begin() as connection:
+        for sql in SQLITE_VIEWS_SQL:
+            connection.execute(text(sql))
+
+
+def engine_for_reading(driver="pymysql"):
+    """可視化スクリプト用: 環境変数で選んだ DB のエンジン (SQLite ならビューも用意する)"""
+    engine = create_engine_for(driver=driver)
+    ensure_views(engine)
+    return engine
@@ -0,0 +1,83 @@
+import unittest
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+# プロジェクトルートをパスに追加（CIでimport可能にする）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adaptive_sampling import decide, should_record, parse_reading, load_state, STATE_FILENAME
+
+MIN_SEC = 60
+HEARTBEAT_SEC = 900
+
+
+def run_minutes(values, start=datetime(2025, 12, 30, 0, 0)):
+    """毎分のサンプル列 [(tmp, hum), ...] を判定し、記録されたサンプルの分番号と最終状態を返す"""
+    state, recorded = None, []
+    for minute, (tmp, hum) in enumerate(values):
+        ts = start + timedelta(minutes=minute)
+        record, state, _ = decide(state, ts, tmp, hum, min_interval=MIN_SEC, heartbeat=HEARTBEAT_SEC)
+        if record:
+            recorded.append(minute)
+    return recorded, state
+
+
+class TestAdaptiveSampling(unittest.TestCase):
+
+    def test_stable_conditions_back_off_to_heartbeat(self):
+        """安定時は記録間隔がheartbeatまで伸び、それ以上は伸びない"""
+        recorded, state = run_minutes([(20.0, 50.0)] * 120)
+        self.assertEqual(recorded[0], 0)
+        self.assertEqual(state["interval_sec"], HEARTBEAT_SEC)
+        gaps = [b - a for a, b in zip(recorded, recorded[1:])]
+        self.assertTrue(all(gap * 60 <= HEARTBEAT_SEC for gap in gaps))
+        self.assertLess(len(recorded), 120 // 10)  # 毎分記録より大幅に少ない
+
+    def test_transient_is_recorded_immediately_at_min_interval(self):
+        """急変（エアコン起動など）は即記録され、以降は最短間隔で記録する"""
+        values = [(28.0, 60.0)] * 60 + [(28.0 - 0.5 * i, 60.0 - 2 * i) for i in range(1, 6)]
+        recorded, state = run_minutes(values)
+        self.assertTrue(set(range(60, 65)).issubset(recorded))
+        self.assertEqual(state["interval_sec"], MIN_SEC)
+
+    def test_slow_drift_is_caught_by_step_threshold(self):
+        """変化率は小さくても、前回記録からの累積変化が閾値を超えたら記録する"""
+        values = [(20.0, 50.0)] * 30 + [(20.0 + 0.1 * (i // 3), 50.0) for i in range(1, 15)]
+        recorded, _ = run_minutes(values)
+        # 記録されなかったサンプルは、直前の記録値から閾値(0.3℃)未満の変化しかない
+        last_value = None
+        for minute, (tmp, _) in enumerate(values):
+            if minute in recorded:
+                last_value = tmp
+            else:
+                self.assertLess(round(abs(tmp - last_value), 1), 0.3)
+        self.assertIn(values.index((20.3, 50.0)), recorded)
+
+    def test_long_gap_resets_state(self):
+        """長時間停止後（再起動など）は初回扱いで記録する"""
+        record, state, _ = decide(None, datetime(2025, 12, 30, 0, 0), 20.0, 50.0)
+        record, _, _ = decide(state, datetime(2025, 12, 30, 3, 0), 20.0, 50.0)
+        self.assertTrue(record)
+
+    def test_should_record_persists_state_and_cadence(self):
+        """状態ファイルに実効的な記録間隔と当日の統計が残る"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.assertTrue(should_record("2025-12-30 00:00:00,tmp=20.0,hum=50.0", tmpdir))
+            self.assertFalse(should_record("2025-12-30 00:01:00,tmp=20.0,hum=50.0", tmpdir))
+            state = load_state(os.path.join(tmpdir, STATE_FILENAME))
+            self.assertEqual(state["samples_today"], 2)
+            self.assertEqual(state["recorded_today"], 1)
+            self.assertIn("interval_sec", state)
+            # 解釈できない行は安全側（記録）
+            self.assertTrue(should_record("broken", tmpdir))
+
+    def test_parse_reading_both_formats(self):
+        """REQ-01.1: 秒なし・秒ありどちらの行も解釈できる"""
+        self.assertEqual(parse_reading("2025-08-01 00:03,tmp=29.1,hum=57.3"), (datetime(2025, 8, 1, 0, 3), 29.1, 57.3))
+        self.assertEqual(parse_reading("2025-12-30 01:02:03,tmp=-1.5,hum=40.0")[1], -1.5)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
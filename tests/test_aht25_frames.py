@@ -0,0 +1,99 @@
+import unittest
+from unittest.mock import patch, MagicMock
+from datetime import datetime, timezone, timedelta
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+# プロジェクトルートをパスに追加（CIでimport可能にする）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aht25_frames import (
+    decode_frame,
+    decode_frames,
+    crc8,
+    append_frame,
+    iter_frames,
+    read_frames,
+)
+from sensor_copier_v6_20251230 import read_sensor_data
+
+JST = timezone(timedelta(hours=9))
+
+
+def frames_for_raw(hum_raw, tmp_raw):
+    """20bit生値の配列からフレーム配列を組み立てる"""
+    frames = np.zeros((len(hum_raw), 7), dtype=np.uint8)
+    frames[:, 0] = 0x1C
+    frames[:, 1] = hum_raw >> 12
+    frames[:, 2] = (hum_raw >> 4) & 0xFF
+    frames[:, 3] = ((hum_raw & 0x0F) << 4) | (tmp_raw >> 16)
+    frames[:, 4] = (tmp_raw >> 8) & 0xFF
+    frames[:, 5] = tmp_raw & 0xFF
+    return frames
+
+
+class TestAHT25Frames(unittest.TestCase):
+
+    def test_batch_decoder_matches_scalar_for_every_raw_value(self):
+        """一括デコーダは全20bit生値（湿度・温度とも）でスカラー変換と完全一致する"""
+        raw = np.arange(2**20, dtype=np.uint32)
+        frames = frames_for_raw(raw, raw[::-1].copy())
+        result = decode_frames(frames)
+        scalar = [decode_frame(frame) for frame in frames.tolist()]
+        self.assertEqual(result["temperature"].tolist(), [t for t, _ in scalar])
+        self.assertEqual(result["humidity"].tolist(), [h for _, h in scalar])
+
+    def test_validity_flags_follow_sensor_reader_rules(self):
+        """ステータス不正・範囲外・CRCの判定がスカラー側と一致する"""
+        frames = np.array([
+            [0x18, 0x80, 0x00, 0x06, 0x00, 0x00, 0x00],  # ≈25℃, 50%（正常）
+            [0x18, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00],  # ≈-50℃（範囲外）
+            [0x00, 0x80, 0x00, 0x06, 0x00, 0x00, 0x00],  # ステータス不正
+        ], dtype=np.uint8)
+        frames[0, 6] = crc8(frames[0].tolist())
+        result = decode_frames(frames)
+        self.assertEqual(result["status_ok"].tolist(), [True, True, False])
+        self.assertEqual(result["in_range"].tolist(), [True, False, True])
+        self.assertEqual(result["crc_ok"].tolist(), [True, crc8(frames[1].tolist()) == 0, crc8(frames[2].tolist()) == 0])
+
+    def test_record_roundtrip(self):
+        """記録したフレームを標準ライブラリ版・NumPy版の両方で読み戻せる（欠けた末尾は無視）"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "raw_frames_2025-12.bin")
+            frames = [[0x18, 0x80, 0x00, 0x06, 0x00, 0x00, i] for i in range(3)]
+            for i, frame in enumerate(frames):
+                append_frame(path, 1767000000 + i, frame)
+            with open(path, "ab") as f:
+                f.write(b"\x01\x02")  # 書き込み途中で停電した想定
+
+            self.assertEqual([(ts, list(fr)) for ts, fr in iter_frames(path)],
+                             [(1767000000 + i, fr) for i, fr in enumerate(frames)])
+            timestamps, arr = read_frames(path)
+            self.assertEqual(timestamps.tolist(), [1767000000, 1767000001, 1767000002])
+            self.assertEqual(arr.tolist(), frames)
+
+    def test_copier_captures_raw_frame_when_enabled(self):
+        """SensorCopier: 有効時は無効フレームも含めて1読み取り1レコード記録する"""
+        mock_bus = MagicMock()
+        fake_now = datetime(2025, 12, 30, 12, 34, 56, tzinfo=JST)
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                patch('sensor_copier_v6_20251230.RAW_FRAME_CAPTURE', True), \
+                patch('sensor_copier_v6_20251230.RAM_DATA_DIR', tmpdir), \
+                patch('sensor_copier_v6_20251230.get_jst_now', return_value=fake_now):
+            mock_bus.read_i2c_block_data.return_value = [0x18, 0x80, 0x00, 0x06, 0x00, 0x00, 0x00]
+            line = read_sensor_data(mock_bus)
+            mock_bus.read_i2c_block_data.return_value = [0x00, 0x80, 0x00, 0x06, 0x00, 0x00, 0x00]
+            self.assertIsNone(read_sensor_data(mock_bus))
+
+            timestamps, frames = read_frames(os.path.join(tmpdir, "raw_frames_2025-12.bin"))
+            self.assertEqual(len(frames), 2)
+            self.assertEqual(timestamps[0], int(fake_now.timestamp()))
+            result = decode_frames(frames[:1])
+            self.assertEqual(line, f"2025-12-30 12:34:56,tmp={result['temperature'][0]},hum={result['humidity'][0]}")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,72 @@
+import unittest
+import os
+import sys
+import tempfile
+
+# プロジェクトルートをパスに追加（CIでimport可能にする）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from monthly_index import BLOCK_SIZE, update_index
+from block_verify import verify_tail, scrub
+
+
+class TestBlockVerify(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "temp_humid_2025-12.txt")
+        with open(self.path, "w") as f:
+            for i in range(10000):  # 約380KB = 完結ブロック5個 + 末尾
+                f.write(f"2025-12-{1 + i // 400:02d} {(i // 16) % 24:02d}:{(i % 16) * 3:02d}:00,tmp=20.{i % 10},hum=50.{i % 10}\n")
+        self.index = update_index(self.path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def corrupt(self, offset):
+        with open(self.path, "r+b") as f:
+            f.seek(offset)
+            original = f.read(1)
+            f.seek(offset)
+            f.write(b"X" if original != b"X" else b"Y")
+
+    def test_intact_file_passes_tail_and_scrub(self):
+        """正常なファイルは末尾照合・全体スクラブとも合格"""
+        self.assertGreaterEqual(len(self.index["block_sha256"]), 5)
+        self.assertTrue(verify_tail(self.path)[0])
+        self.assertEqual(scrub(self.path, rate=None), (True, []))
+
+    def test_tail_corruption_is_detected_cheaply(self):
+        """停電などで末尾が壊れた場合、末尾照合で検出できる"""
+        self.corrupt(self.index["byte_length"] - 10)
+        ok, message = verify_tail(self.path)
+        self.assertFalse(ok)
+        self.assertIn("末尾", message)
+
+    def test_truncation_is_detected(self):
+        """索引より短く切り詰められたファイルは不合格"""
+        with open(self.path, "r+b") as f:
+            f.truncate(self.index["byte_length"] - 100)
+        self.assertFalse(verify_tail(self.path)[0])
+
+    def test_scrub_reports_bad_block_numbers(self):
+        """中間ブロックの破損は末尾照合では見えず、スクラブで番号付きで検出される"""
+        self.corrupt(BLOCK_SIZE + 5)
+        self.assertTrue(verify_tail(self.path)[0])
+        self.assertEqual(scrub(self.path, rate=None), (False, [1]))
+
+    def test_appended_unindexed_bytes_do_not_fail_verification(self):
+        """索引更新前の追記分（未索引）は照合対象外で、誤検知しない"""
+        with open(self.path, "a") as f:
+            f.write("2025-12-31 23:59:00,tmp=20.0,hum=50.0\n")
+        self.assertTrue(verify_tail(self.path)[0])
+
+    def test_scrub_respects_rate_limit(self):
+        """帯域制限に応じて待機が挿入される"""
+        waits = []
+        scrub(self.path, rate=BLOCK_SIZE, sleep=waits.append)
+        self.assertGreater(sum(waits), len(self.index["block_sha256"]) - 2)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,110 @@
+import unittest
+import os
+import sys
+import tempfile
+from unittest import mock
+
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+# プロジェクトルートをパスに追加（CIでimport可能にする）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bulk_loader
+import unified_importer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CREATE_SENSOR_DATA = "CREATE TABLE sensor_data (timestamp DATETIME PRIMARY KEY, temperature FLOAT, humidity FLOAT)"
+
+
+def make_df(count, start="2025-08-01", temperature=25.0):
+    return pd.DataFrame({
+        "timestamp": pd.date_range(start, periods=count, freq="min"),
+        "temperature": temperature,
+        "humidity": 60.0,
+    })
+
+
+class SQLiteTestBase(unittest.TestCase):
+    """組み込みDB (SQLite) に sensor_data を作って試験する"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.tmp.name, 'sensor.db')}")
+        with self.engine.begin() as connection:
+            connection.execute(text(CREATE_SENSOR_DATA))
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp.cleanup()
+
+    def rows(self):
+        with self.engine.connect() as connection:
+            return connection.execute(text(
+                "SELECT timestamp, temperature, humidity FROM sensor_data ORDER BY timestamp")).fetchall()
+
+
+class TestBulkLoad(SQLiteTestBase):
+
+    def test_batches_and_upsert(self):
+        """バッチに分けて挿入し、重複する時刻は値が更新されること"""
+        stats = bulk_loader.bulk_load(self.engine, make_df(25), batch_size=10)
+        self.assertEqual((stats.rows, stats.batches, stats.method), (25, 3, "executemany"))
+
+        bulk_loader.bulk_load(self.engine, make_df(10, start="2025-08-01 00:20", temperature=30.0), batch_size=10)
+        rows = self.rows()
+        self.assertEqual(len(rows), 30)
+        self.assertEqual(rows[0], ("2025-08-01 00:00:00", 25.0, 60.0))
+        self.assertEqual([r[1] for r in rows[20:]], [30.0] * 10)
+
+    def test_each_batch_is_committed(self):
+        """途中のバッチで失敗しても、それまでのバッチはコミット済みであること"""
+        calls = []
+        original = bulk_loader._load_executemany
+
+        def failing(connection, sql, batch):
+            calls.append(len(batch))
+            if len(calls) == 3:
+                raise RuntimeError("接続断")
+            original(connection, sql, batch)
+
+        with mock.patch.object(bulk_loader, "_load_executemany", side_effect=failing):
+            with self.assertRaises(RuntimeError):
+                bulk_loader.bulk_load(self.engine, make_df(50), batch_size=10)
+        self.assertEqual(len(self.rows()), 20)
+
+    def test_batches_are_bounded(self):
+        """1度に組み立てる行は batch_size 件までであること"""
+        sizes = [len(batch) for batch in bulk_loader.iter_batches(make_df(23), 10)]
+        self.assertEqual(sizes, [10, 10, 3])
+
+    def test_infile_only_for_mysql(self):
+        """LOAD DATA LOCAL INFILE の高速パスは MySQL でのみ使われること"""
+        self.assertFalse(bulk_loader.infile_available(self.engine))
+        mysql_engine = mock.Mock()
+        mysql_engine.dialect.name = "mysql"
+        self.assertTrue(bulk_loader.infile_available(mysql_engine))
+        self.assertFalse(bulk_loader.infile_available(mysql_engine, use_infile=False))
+
+    def test_unsupported_dialect(self):
+        with self.assertRaises(ValueError):
+            bulk_loader.upsert_sql("oracle")
+
+
+class TestImporterEndToEnd(SQLiteTestBase):
+
+    def test_process_files_into_sqlite(self):
+        """同梱の月次ファイルを SQLite に取り込み、再実行しても重複しないこと"""
+        path = os.path.join(ROOT, "temp_humid_2025-07.txt")
+        first = unified_importer.process_files([path], self.engine, None, batch_size=500)
+        self.assertGreater(first, 0)
+        self.assertEqual(len(self.rows()), first)
+
+        # チェックポイントにより2回目は何も読まない
+        self.assertEqual(unified_importer.process_files([path], self.engine, None, batch_size=500), 0)
+        self.assertEqual(len(self.rows()), first)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import unittest
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+from unittest import mock
+
+import pandas as pd
+from sqlalchemy import create_engine, inspect, text
+
+# プロジェクトルートをパスに追加（CIでimport可能にする）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import devices
+import rollups
+import unified_importer
+
+
+def write_month(dirpath, month, count, temperature=25.0, header=None):
+    os.makedirs(dirpath, exist_ok=True)
+    path = os.path.join(dirpath, f"temp_humid_{month}.txt")
+    with open(path, "w") as f:
+        if header:
+            f.write(f"# device: {header}\n")
+        for i in range(count):
+            f.write(f"{month}-01 {i // 60:02d}:{i % 60:02d}:00,tmp={temperature},hum=55.0\n")
+    return path
+
+
+class TestDevices(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, "downloads")
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.tmp.name, 'sensor.db')}")
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp.cleanup()
+
+    def rows(self):
+        with self.engine.connect() as connection:
+            return dict(connection.execute(text(
+                "SELECT device_id, COUNT(*) FROM sensor_data GROUP BY device_id")).fetchall())
+
+    def run_import(self, last_timestamp=None, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return unified_importer.process_files(self.root, self.engine, last_timestamp, **kwargs)
+
+    def test_legacy_table_is_migrated(self):
+        """従来の sensor_data (timestamp が主キー) は、行とビューを保ったままデバイス列つきに移行されること"""
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                "CREATE TABLE sensor_data (timestamp DATETIME PRIMARY KEY, temperature FLOAT, humidity FLOAT)"))
+            connection.execute(text("INSERT INTO sensor_data VALUES ('2025-08-01 00:00:00', 25.0, 60.0)"))
+            connection.execute(text("CREATE VIEW recent AS SELECT timestamp, temperature FROM sensor_data"))
+        devices.ensure_schema(self.engine)
+
+        self.assertEqual(inspect(self.engine).get_pk_constraint("sensor_data")["constrained_columns"],
+                         ["device_id", "timestamp"])
+        self.assertEqual(self.rows(), {"default": 1})
+        with self.engine.connect() as connection:
+            self.assertEqual(connection.execute(text("SELECT COUNT(*) FROM recent")).scalar(), 1)
+
+    def test_mysql_migration_drops_only_existing_keys(self):
+        """MySQL の移行文は、実際にある主キー・一意キーだけを外すこと"""
+        add_pk = "ADD PRIMARY KEY (device_id, timestamp)"
+        [sql] = devices.mysql_migrate_sql(["timestamp"], [], set())
+        self.assertIn("DROP PRIMARY KEY", sql)
+        self.assertIn(add_pk, sql)
+        self.assertIn("ADD INDEX idx_sensor_data_timestamp", sql)
+
+        # 一意キーだけの表・キーの無い表では DROP PRIMARY KEY を出さない
+        [sql] = devices.mysql_migrate_sql([], ["uq_timestamp"], {"uq_timestamp"})
+        self.assertNotIn("DROP PRIMARY KEY", sql)
+        self.assertIn("DROP INDEX `uq_timestamp`", sql)
+        self.assertIn(add_pk, sql)
+        [sql] = devices.mysql_migrate_sql([], [], {"idx_sensor_data_timestamp"})
+        self.assertNotIn("DROP", sql)
+        self.assertNotIn("ADD INDEX", sql)
+
+        # timestamp 以外の主キーは残し、(device_id, timestamp) の一意キーを追加する
+        [sql] = devices.mysql_migrate_sql(["id"], ["timestamp"], {"timestamp"})
+        self.assertNotIn("PRIMARY KEY", sql)
+        self.assertIn("DROP INDEX `timestamp`", sql)
+        self.assertIn("ADD UNIQUE KEY uq_sensor_data_device_timestamp (device_id, timestamp)", sql)
+
+    def test_device_from_header_and_folder(self):
+        header = write_month(os.path.join(self.root, "pi-01"), "2025-08", 1, header="pi-99")
+        folder = write_month(os.path.join(self.root, "pi-02"), "2025-08", 1)
+        plain = write_month(self.root, "2025-07", 1)
+        self.assertEqual(devices.device_for(header, self.root), "pi-99")
+        self.assertEqual(devices.device_for(folder, self.root), "pi-02")
+        self.assertEqual(devices.device_for(plain, self.root), devices.DEFAULT_DEVICE)
+        self.assertEqual(sorted(devices.discover(self.root)), sorted([header, folder, plain]))
+        with self.assertRaises(ValueError):
+            devices.validate("pi 01; DROP")
+
+    def test_same_timestamps_on_two_devices(self):
+        """同じファイル名・同じ時刻のデータが、デバイスごとに別の行・別の集計として取り込まれること"""
+        write_month(os.path.join(self.root, "pi-01"), "2025-08", 120, temperature=20.0)
+        write_month(os.path.join(self.root, "pi-02"), "2025-08", 120, temperature=30.0)
+        self.assertEqual(self.run_import(), 240)
+        self.assertEqual(self.rows(), {"pi-01": 120, "pi-02": 120})
+
+        profile = rollups.load_hourly_profile(self.engine, device="pi-02")
+        self.assertEqual(profile["temperature_mean"].tolist(), [30.0, 30.0])
+        combined = rollups.load_hourly_profile(self.engine)
+        self.assertEqual(combined["samples"].tolist(), [120, 120])
+        self.assertEqual(combined["temperature_mean"].tolist(), [25.0, 25.0])
+
+        # チェックポイントもデバイスごと: 2回目はどちらも読まない
+        self.assertEqual(self.run_import(), 0)
+
+    def test_lagging_device_is_not_blocked(self):
+        """他のデバイスの最新時刻より古い行も、そのデバイスのウォーターマークより新しければ取り込まれること"""
+        write_month(os.path.join(self.root, "pi-01"), "2025-09", 60)
+        self.run_import()
+        lagging = write_month(os.path.join(self.root, "pi-02"), "2025-08", 60)
+
+        last = unified_importer.get_last_timestamps(self.engine)
+        self.assertEqual(last, {"pi-01": pd.Timestamp("2025-09-01 00:59:00")})
+        self.assertEqual(self.run_import(last), 60)
+        # 従来の全体共通のウォーターマークでは、遅れているデバイスの行は捨てられてしまう
+        os.remove(lagging)
+        write_month(os.path.join(self.root, "pi-03"), "2025-08", 60)
+        self.assertEqual(self.run_import(unified_importer.get_last_timestamp(self.engine)), 0)
+
+    def test_devices_are_imported_concurrently(self):
+        """device_workers を指定すると、デバイスごとの書き込みが別スレッドで並行して行われること"""
+        for device in ("pi-01", "pi-02", "pi-03"):
+            for month in ("2025-07", "2025-08"):
+                write_month(os.path.join(self.root, device), month, 60)
+        barrier = threading.Barrier(3, timeout=10)
+        writers = {}
+        original = unified_importer.insert_to_db
+
+        def recording(df, engine, **kwargs):
+            writers.setdefault(kwargs["device"], set()).add(threading.get_ident())
+            if len(writers[kwargs["device"]]) == 1 and df["timestamp"].iloc[0].month == 7:
+                # 3デバイスの最初の書き込みが同時に進んでいること (直列なら待ち合わせがタイムアウトする)
+                barrier.wait()
+            return original(df, engine, **kwargs)
+
+        with mock.patch.object(unified_importer, "insert_to_db", side_effect=recording):
+            total = self.run_import(device_workers=3)
+        self.assertEqual(total, 3 * 2 * 60)
+        self.assertEqual(self.rows(), {"pi-01": 120, "pi-02": 120, "pi-03": 120})
+        self.assertEqual(len({ident for idents in writers.values() for ident in idents}), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import os
+import sys
+import tempfile
+import threading
+import queue
+
+# プロジェクトルートをパスに追加（CIでimport可能にする）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import file_watcher
+
+
+class TestFileWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.stop = threading.Event()
+
+    def tearDown(self):
+        self.stop.set()
+        self.tmp.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def append(self, name, text):
+        with open(self.path(name), "a") as f:
+            f.write(text)
+
+    def start(self, use_inotify):
+        """iter_changes を別スレッドで回し、返ってきたリストをキューに入れる"""
+        results = queue.Queue()
+
+        def run():
+            for paths in file_watcher.iter_changes(self.tmp.name, poll_interval=0.1,
+                                                   use_inotify=use_inotify, stop=self.stop):
+                results.put([os.path.basename(p) for p in paths])
+
+        threading.Thread(target=run, daemon=True).start()
+        return results
+
+    def check_changes(self, use_inotify):
+        self.append("temp_humid_2025-08.txt", "2025-08-01 00:00:00,tmp=25.0,hum=60.0\n")
+        results = self.start(use_inotify)
+        # 監視開始時点のファイルは最初にまとめて返る
+        self.assertEqual(results.get(timeout=5), ["temp_humid_2025-08.txt"])
+
+        self.append("temp_humid_2025-08.txt", "2025-08-01 00:10:00,tmp=25.1,hum=60.0\n")
+        self.assertEqual(results.get(timeout=5), ["temp_humid_2025-08.txt"])
+
+        # 対象外のファイルは無視し、rename で置かれた新しい月は検知する
+        self.append("notes.txt", "memo\n")
+        self.append("temp_humid_2025-09.txt.part", "2025-09-01 00:00:00,tmp=25.0,hum=60.0\n")
+        os.rename(self.path("temp_humid_2025-09.txt.part"), self.path("temp_humid_2025-09.txt"))
+        self.assertEqual(results.get(timeout=5), ["temp_humid_2025-09.txt"])
+        self.assertTrue(results.empty())
+
+    def test_polling(self):
+        """ポーリングで追記・新規ファイルを検知すること"""
+        self.check_changes(use_inotify=False)
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "inotify は Linux のみ")
+    def test_inotify(self):
+        """inotify で追記・新規ファイルを検知すること"""
+        fd = file_watcher.open_inotify(self.tmp.name)
+        self.assertIsNotNone(fd)
+        os.close(fd)
+        self.check_changes(use_inotify=True)
+
+    def test_changed_paths(self):
+        before = {"/d/a.txt": (10, 1), "/d/b.txt": (5, 1)}
+        after = {"/d/a.txt": (10, 1), "/d/b.txt": (7, 2), "/d/c.txt": (1, 3)}
+        self.assertEqual(file_watcher.changed_paths(before, after), ["/d/b.txt", "/d/c.txt"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import unittest
+import os
+import sys
+import tempfile
+from unittest import mock
+
+from sqlalchemy import create_engine
+
+# プロジェクトルートをパスに追加（CIでimport可能にする）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import import_state
+import unified_importer
+
+
+def line(minute, tmp=25.0):
+    return f"2025-08-01 00:{minute:02d}:00,tmp={tmp},hum=60.0\n"
+
+
+class ImportStateTestBase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "temp_humid_2025-08.txt")
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.tmp.name, 'state.db')}")
+        import_state.ensure_table(self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp.cleanup()
+
+    def write(self, text, mode="w"):
+        with open(self.path, mode) as f:
+            f.write(text)
+
+    def run_import(self, fail=False):
+        """insert_to_db を差し替えて process_files を実行し、挿入された行の分を返す"""
+        inserted = []
+
+        def fake_insert(df, engine, **kwargs):
+            if fail:
+                raise RuntimeError("DB down")
+            inserted.extend(ts.minute for ts in df['timestamp'])
+            return len(df)
+
+        with mock.patch.object(unified_importer, "insert_to_db", side_effect=fake_insert):
+            unified_importer.process_files(self.path, self.engine, last_timestamp=None)
+        return inserted
+
+
+class TestPlan(ImportStateTestBase):
+
+    def test_checkpoint_then_skip(self):
+        """記録後にファイルが変化していなければ skip になること"""
+        self.write(line(0) + line(1))
+        action, offset, hasher, st = import_state.plan(self.path, None)
+        self.assertEqual((action, offset), ("new", 0))
+        import_state.checkpoint(self.engine, self.path, hasher, 0, st.st_size, st)
+
+        state = import_state.load_state(self.engine, self.path)
+        self.assertEqual(state["byte_offset"], st.st_size)
+        self.assertEqual(import_state.plan(self.path, state)[0], "skip")
+
+    def test_resume_after_append(self):
+        """追記されたら、取り込み済み位置から resume になること"""
+        self.write(line(0))
+        _, _, hasher, st = import_state.plan(self.path, None)
+        import_state.checkpoint(self.engine, self.path, hasher, 0, st.st_size, st)
+        self.write(line(1), mode="a")
+
+        action, offset, _, _ = import_state.plan(self.path, import_state.load_state(self.engine, self.path))
+        self.assertEqual((action, offset), ("resume", len(line(0))))
+
+    def test_full_when_prefix_changed_or_truncated(self):
+        """取り込み済み範囲が書き換わった・短くなった場合は full になること"""
+        self.write(line(0) + line(1))
+        _, _, hasher, st = import_state.plan(self.path, None)
+        import_state.checkpoint(self.engine, self.path, hasher, 0, st.st_size, st)
+        state = import_state.load_state(self.engine, self.path)
+
+        self.write(line(0, tmp=26.0) + line(1) + line(2))
+        self.assertEqual(import_state.plan(self.path, state)[:2], ("full", 0))
+
+        self.write(line(0))
+        self.assertEqual(import_state.plan(self.path, state)[:2], ("full", 0))
+
+    def test_terminated_length(self):
+        """書き込み途中の最終行を除いた長さを返すこと"""
+        self.write(line(0) + "2025-08-01 00:01:00,tmp=2")
+        with open(self.path, "rb") as f:
+            self.assertEqual(import_state.terminated_length(f, os.path.getsize(self.path)), len(line(0)))
+
+
+class TestProcessFilesCheckpoints(ImportStateTestBase):
+
+    def test_only_new_bytes_are_imported(self):
+        """2回目以降は新しく追記された行だけが取り込まれ、変化がなければ何も読まないこと"""
+        self.write(line(0) + line(1))
+        self.assertEqual(self.run_import(), [0, 1])
+
+        with mock.patch.object(unified_importer, "parse_monthly_file") as parse:
+            self.assertEqual(self.run_import(), [])
+            parse.assert_not_called()
+
+        self.write(line(2), mode="a")
+        self.assertEqual(self.run_import(), [2])
+
+    def test_partial_last_line_is_read_again(self):
+        """改行で終わらない最終行は取り込まず、チェックポイントをその手前に置いて次回読み直すこと"""
+        self.write(line(0) + line(1).rstrip("\n"))
+        self.assertEqual(self.run_import(), [0])
+        self.assertEqual(import_state.load_state(self.engine, self.path)["byte_offset"], len(line(0)))
+
+        self.write("\n" + line(2), mode="a")
+        self.assertEqual(self.run_import(), [1, 2])
+
+    def test_half_written_value_is_not_inserted(self):
+        """書き込み途中で値が切れている最終行 (hum=6) を、切れた値のまま取り込まないこと"""
+        self.write(line(0) + line(1)[:-4])
+        self.assertEqual(self.run_import(), [0])
+        self.write("0.0\n", mode="a")
+        self.assertEqual(self.run_import(), [1])
+
+    def test_settled_file_without_trailing_newline(self):
+        """最終行に改行の無いファイルは、しばらく更新されなければ最終行も取り込み、以後は skip になること"""
+        self.write(line(0) + line(1).rstrip("\n"))
+        self.assertEqual(self.run_import(), [0])
+        state = import_state.load_state(self.engine, self.path)
+        self.assertEqual(state["file_size"], len(line(0)))
+
+        # 更新が止まった (月が終わった) ファイル: 同じサイズ・更新時刻のままでも skip されずに最終行が入る
+        settled = os.stat(self.path).st_mtime - import_state.SETTLED_TAIL_SEC
+        os.utime(self.path, (settled, settled))
+        self.assertEqual(self.run_import(), [1])
+        self.assertEqual(import_state.load_state(self.engine, self.path)["byte_offset"], os.path.getsize(self.path))
+        self.assertEqual(self.run_import(), [])
+
+    def test_failed_insert_does_not_advance_checkpoint(self):
+        """挿入に失敗した場合はチェックポイントが進まず、次回同じ範囲から取り込み直すこと"""
+        self.write(line(0))
+        self.run_import()
+        self.write(line(1) + line(2), mode="a")
+
+        self.run_import(fail=True)
+        self.assertEqual(import_state.load_state(self.engine, self.path)["byte_offset"], len(line(0)))
+        self.assertEqual(self.run_import(), [1, 2])
+
+    def test_rewritten_file_is_fully_reimported(self):
+        """取り込み済み範囲が書き換わったファイルは先頭から取り込み直すこと"""
+        self.write(line(0) + line(1))
+        self.run_import()
+        self.write(line(0, tmp=26.0) + line(1) + line(2))
+        self.assertEqual(self.run_import(), [0, 1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
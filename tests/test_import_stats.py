@@ -0,0 +1,86 @@
+import unittest
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+
+from sqlalchemy import create_engine, text
+
+# プロジェクトルートをパスに追加（CIでimport可能にする）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import import_stats
+import unified_importer
+
+
+class TestImportStats(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.tmp.name, 'sensor.db')}")
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                "CREATE TABLE sensor_data (timestamp DATETIME PRIMARY KEY, temperature FLOAT, humidity FLOAT)"))
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp.cleanup()
+
+    def write(self, month, lines):
+        path = os.path.join(self.tmp.name, f"temp_humid_{month}.txt")
+        with open(path, "w") as f:
+            f.write("".join(lines))
+        return path
+
+    def test_stage_and_file_counts(self):
+        """段階ごと・ファイルごとに行数と除外数が記録されること"""
+        good = [f"2025-08-01 00:{m:02d}:00,tmp=25.0,hum=60.0\n" for m in range(50)]
+        aug = self.write("2025-08", good + ["broken\n", "2025-08-02 00:00:00,tmp=80.0,hum=60.0\n"])
+        jul = self.write("2025-07", [f"2025-07-01 00:{m:02d}:00,tmp=25.0,hum=60.0\n" for m in range(10)])
+
+        stats = import_stats.new_stats()
+        with contextlib.redirect_stdout(io.StringIO()):
+            total = unified_importer.process_files(iter([jul, aug]), self.engine,
+                                                   unified_importer.pd.Timestamp("2025-07-01 00:04:00"), stats=stats)
+        report = import_stats.finish(stats)
+        stages = report["stages"]
+
+        self.assertEqual(total, 55)
+        self.assertEqual(stages["download"]["rows_out"], 2)
+        self.assertEqual((stages["parse"]["rows_in"], stages["parse"]["rejected"]), (62, 1))
+        self.assertEqual((stages["validate"]["rows_in"], stages["validate"]["rows_out"]), (61, 60))
+        self.assertEqual((stages["filter"]["rows_in"], stages["filter"]["rows_out"]), (60, 55))
+        self.assertEqual((stages["insert"]["rows_in"], report["rows_inserted"]), (55, 55))
+        self.assertEqual(stages["checkpoint"]["bytes"], os.path.getsize(aug) + os.path.getsize(jul))
+        self.assertEqual(report["files"]["temp_humid_2025-07.txt"]["filter"]["rows_out"], 5)
+        self.assertEqual(report["files"]["temp_humid_2025-08.txt"]["validate"]["rejected"], 1)
+        for stage in ("plan", "parse", "parse_wait", "rollups"):
+            self.assertGreaterEqual(stages[stage]["wall"], 0)
+        self.assertGreater(report["peak_rss_mb"], 0)
+        self.assertIn("temp_humid_2025-08.txt", import_stats.format_report(report))
+
+    def test_json_history(self):
+        """--stats-json の出力を1実行1行で追記し、実行ごとに比較表示できること"""
+        path = os.path.join(self.tmp.name, "stats.jsonl")
+        for rows in (100, 200):
+            stats = import_stats.new_stats()
+            import_stats.add(stats, "insert", "temp_humid_2025-08.txt", wall=0.5, rows_in=rows, rows_out=rows)
+            import_stats.append_json(import_stats.finish(stats), path)
+
+        reports = import_stats.load_history(path)
+        self.assertEqual([r["rows_inserted"] for r in reports], [100, 200])
+        self.assertEqual(reports[1]["stages"]["insert"]["rows_per_sec"], 400)
+        with open(path) as f:
+            self.assertEqual(len([json.loads(line) for line in f]), 2)
+        self.assertIn("400", import_stats.format_history(reports))
+
+    def test_disabled_stats_are_noop(self):
+        with import_stats.timed(None, "insert") as values:
+            values["rows_in"] = 1
+        import_stats.add(None, "insert", rows_in=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
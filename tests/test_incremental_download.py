@@ -0,0 +1,179 @@
+import unittest
+import os
+import sys
+import tempfile
+from unittest import mock
+
+from sqlalchemy import create_engine, text
+
+# プロジェクトルートをパスに追加（CIでimport可能にする）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import incremental_download
+import monthly_index
+from incremental_download import download_iter, download_all, load_manifest
+
+
+def month_lines(month, start, count):
+    return "".join(f"{month}-01 {i // 60:02d}:{i % 60:02d}:00,tmp=25.0,hum=60.0\n" for i in range(start, start + count))
+
+
+class TestIncrementalDownload(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.remote = os.path.join(self.tmp.name, "remote")
+        self.local = os.path.join(self.tmp.name, "local")
+        os.makedirs(self.remote)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_remote(self, name, text, mode="w"):
+        with open(os.path.join(self.remote, name), mode) as f:
+            f.write(text)
+
+    def read_local(self, name):
+        with open(os.path.join(self.local, name)) as f:
+            return f.read()
+
+    def read_remote(self, name):
+        with open(os.path.join(self.remote, name)) as f:
+            return f.read()
+
+    def test_first_run_then_unchanged(self):
+        """初回は全ファイルを取得し、変化がなければ2回目は何も取得しないこと"""
+        self.write_remote("temp_humid_2025-07.txt", month_lines("2025-07", 0, 50))
+        self.write_remote("temp_humid_2025-08.txt", month_lines("2025-08", 0, 50))
+        self.write_remote("notes.txt", "対象外")
+
+        self.assertEqual(download_all(self.remote, self.local), {"skip": 0, "append": 0, "full": 2})
+        self.assertEqual(self.read_local("temp_humid_2025-08.txt"), self.read_remote("temp_humid_2025-08.txt"))
+        self.assertFalse(os.path.exists(os.path.join(self.local, "notes.txt")))
+        self.assertEqual(set(load_manifest(self.local)), {"temp_humid_2025-07.txt", "temp_humid_2025-08.txt"})
+
+        with mock.patch.object(incremental_download, "fetch_file") as fetch:
+            self.assertEqual(download_all(self.remote, self.local), {"skip": 2, "append": 0, "full": 0})
+            fetch.assert_not_called()
+
+    def test_unchanged_local_remote_is_not_hashed(self):
+        """ローカルのリモートは、サイズ・更新時刻が前回と同じファイルの MD5 を計算し直さないこと"""
+        self.write_remote("temp_humid_2025-07.txt", month_lines("2025-07", 0, 50))
+        self.write_remote("temp_humid_2025-08.txt", month_lines("2025-08", 0, 50))
+        download_all(self.remote, self.local)
+
+        with mock.patch.object(incremental_download, "_md5_file", wraps=incremental_download._md5_file) as md5:
+            self.assertEqual(download_all(self.remote, self.local)["skip"], 2)
+            md5.assert_not_called()
+
+            self.write_remote("temp_humid_2025-08.txt", month_lines("2025-08", 50, 10), mode="a")
+            self.assertEqual(download_all(self.remote, self.local)["append"], 1)
+        hashed = {os.path.basename(call.args[0]) for call in md5.call_args_list}
+        self.assertEqual(hashed, {"temp_humid_2025-08.txt", "temp_humid_2025-08.txt.part"})
+        self.assertEqual(self.read_local("temp_humid_2025-08.txt"), self.read_remote("temp_humid_2025-08.txt"))
+
+    def test_sidecar_index_is_downloaded_with_monthly_file(self):
+        """サイドカー索引も取得され、ローカルの月次ファイルに対して使える状態で置かれること"""
+        name = "temp_humid_2025-08.txt"
+        self.write_remote(name, month_lines("2025-08", 0, 50))
+        monthly_index.update_index(os.path.join(self.remote, name))
+        self.assertEqual(download_all(self.remote, self.local), {"skip": 0, "append": 0, "full": 1})
+        self.assertIsNotNone(monthly_index.load_index(os.path.join(self.local, name)))
+
+        self.write_remote(name, month_lines("2025-08", 50, 10), mode="a")
+        monthly_index.update_index(os.path.join(self.remote, name))
+        self.assertEqual(download_all(self.remote, self.local)["append"], 1)
+        index = monthly_index.load_index(os.path.join(self.local, name))
+        self.assertEqual(index["line_count"], 60)
+
+        with mock.patch.object(incremental_download, "fetch_file") as fetch:
+            self.assertEqual(download_all(self.remote, self.local)["skip"], 1)
+            fetch.assert_not_called()
+
+    def test_appended_range_only(self):
+        """追記されたファイルは、追記範囲だけをリモートから読むこと"""
+        name = "temp_humid_2025-08.txt"
+        self.write_remote(name, month_lines("2025-08", 0, 50))
+        download_all(self.remote, self.local)
+        old_size = os.path.getsize(os.path.join(self.local, name))
+        self.write_remote(name, month_lines("2025-08", 50, 10), mode="a")
+
+        offsets = []
+        original = incremental_download._copy_remote_range
+
+        def recording(remote, n, offset, dst, bwlimit=None):
+            offsets.append(offset)
+            return original(remote, n, offset, dst, bwlimit)
+
+        with mock.patch.object(incremental_download, "_copy_remote_range", side_effect=recording):
+            self.assertEqual(download_all(self.remote, self.local)["append"], 1)
+        self.assertEqual(offsets, [old_size])
+        self.assertEqual(self.read_local(name), self.read_remote(name))
+
+    def test_rewritten_remote_falls_back_to_full(self):
+        """先頭部分が書き換わって伸びたファイルは、MD5照合で検出して全体を取り直すこと"""
+        name = "temp_humid_2025-08.txt"
+        self.write_remote(name, month_lines("2025-08", 0, 50))
+        download_all(self.remote, self.local)
+        self.write_remote(name, month_lines("2025-08", 0, 50).replace("tmp=25.0", "tmp=26.0") +
+                          month_lines("2025-08", 50, 10))
+
+        self.assertEqual(download_all(self.remote, self.local)["full"], 1)
+        self.assertEqual(self.read_local(name), self.read_remote(name))
+
+    def test_shrunk_remote_is_fetched_fully(self):
+        """リモートが短くなった場合は全体を取り直すこと"""
+        name = "temp_humid_2025-08.txt"
+        self.write_remote(name, month_lines("2025-08", 0, 50))
+        download_all(self.remote, self.local)
+        self.write_remote(name, month_lines("2025-08", 0, 20))
+
+        self.assertEqual(download_all(self.remote, self.local)["full"], 1)
+        self.assertEqual(self.read_local(name), self.read_remote(name))
+
+    def test_failed_file_is_retried_next_time(self):
+        """1ファイルの失敗は他のファイルを止めず、マニフェストにも載らないため次回再取得されること"""
+        self.write_remote("temp_humid_2025-07.txt", month_lines("2025-07", 0, 50))
+        self.write_remote("temp_humid_2025-08.txt", month_lines("2025-08", 0, 50))
+        original = incremental_download._copy_remote_range
+
+        def flaky(remote, name, offset, dst, bwlimit=None):
+            if "2025-07" in name:
+                raise IOError("接続断")
+            return original(remote, name, offset, dst, bwlimit)
+
+        with mock.patch.object(incremental_download, "_copy_remote_range", side_effect=flaky):
+            paths = [os.path.basename(path) for path, _ in download_iter(self.remote, self.local)]
+        self.assertEqual(paths, ["temp_humid_2025-08.txt"])
+        self.assertFalse(os.path.exists(os.path.join(self.local, "temp_humid_2025-07.txt")))
+        self.assertFalse([n for n in os.listdir(self.local) if n.endswith(".part")])
+
+        self.assertEqual(download_all(self.remote, self.local), {"skip": 1, "append": 0, "full": 1})
+
+    def test_importer_consumes_files_as_they_arrive(self):
+        """ダウンロード完了順のイテレータをそのままインポーターに渡して取り込めること"""
+        import unified_importer
+        for month in ("2025-07", "2025-08"):
+            self.write_remote(f"temp_humid_{month}.txt", month_lines(month, 0, 30))
+        engine = create_engine(f"sqlite:///{os.path.join(self.tmp.name, 'sensor.db')}")
+        with engine.begin() as connection:
+            connection.execute(text(
+                "CREATE TABLE sensor_data (timestamp DATETIME PRIMARY KEY, temperature FLOAT, humidity FLOAT)"))
+
+        paths = (path for path, _ in download_iter(self.remote, self.local, workers=2))
+        self.assertEqual(unified_importer.process_files(paths, engine, None), 60)
+        engine.dispose()
+
+
+class TestRemoteSpec(unittest.TestCase):
+
+    def test_rclone_remote_detection(self):
+        self.assertFalse(incremental_download.is_local_remote("raspi_data:sensor_data/"))
+        self.assertTrue(incremental_download.is_local_remote("/tmp/sensor_data"))
+        self.assertEqual(incremental_download._remote_path("raspi_data:sensor_data/", "a.txt"),
+                         "raspi_data:sensor_data/a.txt")
+        self.assertEqual(incremental_download._remote_path("raspi_data:", "a.txt"), "raspi_data:a.txt")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+import gzip
+import os
+import sys
+import tempfile
+
+# プロジェクトルートをパスに追加（CIでimport可能にする）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import merge_monthly
+import monthly_index
+
+
+class TestMergeMonthly(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.target = self.write("temp_humid_2025-12.txt", [
+            "# device: pi-02",
+            "2025-12-01 00:00:00,tmp=20.0,hum=50.0",
+            "2025-12-01 00:20:00,tmp=20.2,hum=50.2",
+            "2025-12-01 00:40:00,tmp=20.4,hum=50.4",
+        ])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name, lines):
+        path = os.path.join(self.tmp.name, name)
+        opener = gzip.open if name.endswith(".gz") else open
+        with opener(path, "wt") as f:
+            f.write("\n".join(lines) + "\n")
+        return path
+
+    def read(self):
+        with open(self.target) as f:
+            return f.read().splitlines()
+
+    def test_lines_only_in_target_are_kept(self):
+        """復元ファイルとバックアップの行を加えても、現行ファイルにしか無い行が残り、現行の行が優先されること"""
+        recovered = self.write("recovered_temp_humid_2025-12.txt", [
+            "2025-12-01 00:10:00,tmp=20.1,hum=50.1",
+            "2025-12-01 00:20:00,tmp=99.9,hum=99.9",
+        ])
+        backup = self.write("backup.txt.gz", [
+            "2025-12-01 00:00,tmp=88.8,hum=88.8",
+            "2025-12-01 00:30,tmp=20.3,hum=50.3\r",
+        ])
+        results = merge_monthly.merge(self.target, [recovered, backup])
+        self.assertEqual(self.read(), [
+            "# device: pi-02",
+            "2025-12-01 00:00:00,tmp=20.0,hum=50.0",
+            "2025-12-01 00:10:00,tmp=20.1,hum=50.1",
+            "2025-12-01 00:20:00,tmp=20.2,hum=50.2",
+            "2025-12-01 00:30,tmp=20.3,hum=50.3",
+            "2025-12-01 00:40:00,tmp=20.4,hum=50.4",
+        ])
+        self.assertEqual([stats["kept"] for _, stats in results], [3, 1, 1])
+
+        merge_monthly.merge(self.target, [recovered], prefer_sources=True)
+        self.assertIn("2025-12-01 00:20:00,tmp=99.9,hum=99.9", self.read())
+
+    def test_by_minute(self):
+        """--by-minute では、同じ分の行 (秒だけ違う行) が1行にまとめられること"""
+        source = self.write("other.txt", ["2025-12-01 00:20:31,tmp=20.9,hum=50.9",
+                                          "2025-12-01 00:21:00,tmp=21.0,hum=51.0"])
+        merge_monthly.merge(self.target, [source], by_minute=True)
+        self.assertEqual(len(self.read()), 1 + 4)
+        self.assertNotIn("2025-12-01 00:20:31,tmp=20.9,hum=50.9", self.read())
+
+    def test_unsorted_source_leaves_target_untouched(self):
+        before = self.read()
+        source = self.write("bad.txt", ["2025-12-01 00:50:00,tmp=1,hum=1", "2025-12-01 00:05:00,tmp=1,hum=1"])
+        with self.assertRaises(ValueError):
+            merge_monthly.merge(self.target, [source])
+        self.assertEqual(self.read(), before)
+        self.assertFalse(os.path.exists(self.target + merge_monthly.TEMP_SUFFIX))
+
+    def test_sidecar_index_is_rebuilt(self):
+        monthly_index.update_index(self.target)
+        source = self.write("other.txt", ["2025-12-01 00:10:00,tmp=20.1,hum=50.1"])
+        merge_monthly.merge(self.target, [source])
+        index = monthly_index.load_index(self.target)
+        self.assertIsNotNone(index)
+        rebuilt = monthly_index.build_index(self.target)
+        self.assertEqual((index["line_count"], index["block_sha256"], index["tail_sha256"]),
+                         (rebuilt["line_count"], rebuilt["block_sha256"], rebuilt["tail_sha256"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
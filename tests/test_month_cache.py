@@ -0,0 +1,90 @@
+import unittest
+import os
+import sys
+import tempfile
+from unittest import mock
+
+import numpy as np
+
+# プロジェクトルートをパスに追加（CIでimport可能にする）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import month_cache
+import monthly_parser
+
+
+def month_lines(month, start, count):
+    return "".join(f"{month}-01 {i // 60:02d}:{i % 60:02d}:00,tmp={20 + i % 10}.5,hum=55.0\n"
+                   for i in range(start, start + count))
+
+
+class TestMonthCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmp.name, "cache")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name, text, mode="w"):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, mode) as f:
+            f.write(text)
+        return path
+
+    def test_hit_returns_same_arrays_without_parsing(self):
+        """2回目はファイルを解析せず、キャッシュから同じ配列を返すこと"""
+        path = self.write("temp_humid_2025-08.txt", month_lines("2025-08", 0, 200) + "broken line\n")
+        first = month_cache.load_month(path, self.cache_dir)
+        with mock.patch.object(monthly_parser, "parse_file") as parse:
+            second = month_cache.load_month(path, self.cache_dir)
+            parse.assert_not_called()
+        self.assertEqual(second.timestamp.dtype, np.dtype("datetime64[s]"))
+        np.testing.assert_array_equal(second.timestamp, first.timestamp)
+        np.testing.assert_array_equal(second.temperature, first.temperature)
+        self.assertEqual((second.rejected, second.consumed), (1, os.path.getsize(path)))
+        df = month_cache.load_dataframe(path, self.cache_dir)
+        self.assertEqual(list(df.columns), ["timestamp", "temperature", "humidity"])
+        self.assertEqual(len(df), 200)
+
+    def test_appended_file_is_reparsed_and_old_version_removed(self):
+        """追記で内容が変わると解析し直し、同じファイルの古いキャッシュは削除されること"""
+        path = self.write("temp_humid_2025-08.txt", month_lines("2025-08", 0, 100))
+        month_cache.load_month(path, self.cache_dir)
+        self.write("temp_humid_2025-08.txt", month_lines("2025-08", 100, 20), mode="a")
+
+        self.assertEqual(len(month_cache.load_month(path, self.cache_dir).timestamp), 120)
+        self.assertEqual(os.listdir(self.cache_dir),
+                         [os.path.basename(month_cache.cache_path(path, month_cache.file_digest(path)))])
+
+    def test_lru_eviction_keeps_recently_used(self):
+        """上限を超えたら、最後に使われたのが古いキャッシュから削除されること"""
+        paths = [self.write(f"temp_humid_2025-0{m}.txt", month_lines(f"2025-0{m}", 0, 300)) for m in (1, 2, 3)]
+        for i, path in enumerate(paths[:2]):
+            month_cache.load_month(path, self.cache_dir)
+            entry = month_cache.cache_path(path, month_cache.file_digest(path), self.cache_dir)
+            os.utime(entry, ns=(i * 10**9, i * 10**9))
+        # 1月を読み直して最近使ったことにし、3月を追加すると2月が追い出される
+        month_cache.load_month(paths[0], self.cache_dir)
+        entry_size = os.path.getsize(month_cache.cache_path(paths[0], month_cache.file_digest(paths[0]),
+                                                            self.cache_dir))
+        month_cache.load_month(paths[2], self.cache_dir, max_bytes=entry_size * 2)
+
+        cached = sorted(name.split(".")[0] for name in os.listdir(self.cache_dir))
+        self.assertEqual(cached, ["temp_humid_2025-01", "temp_humid_2025-03"])
+
+    def test_corrupt_entry_is_rebuilt(self):
+        """壊れたキャッシュは解析し直して上書きされること"""
+        path = self.write("temp_humid_2025-08.txt", month_lines("2025-08", 0, 50))
+        month_cache.load_month(path, self.cache_dir)
+        entry = month_cache.cache_path(path, month_cache.file_digest(path), self.cache_dir)
+        with open(entry, "wb") as f:
+            f.write(b"not a zip")
+        self.assertEqual(len(month_cache.load_month(path, self.cache_dir).timestamp), 50)
+        self.assertEqual(len(month_cache.load_month(path, self.cache_dir).timestamp), 50)
+        self.assertEqual(month_cache.clear(self.cache_dir), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
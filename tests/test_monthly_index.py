@@ -0,0 +1,132 @@
+import unittest
+import os
+import sys
+import json
+import tempfile
+from datetime import datetime
+
+# プロジェクトルートをパスに追加（CIでimport可能にする）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from monthly_index import (
+    BLOCK_SIZE,
+    build_index,
+    update_index,
+    load_index,
+    index_path_for,
+    has_data_after,
+    seek_offset_for,
+    parse_line_timestamp,
+)
+
+
+def make_lines(day_count, per_day, month="2025-12"):
+    lines = []
+    for day in range(1, day_count + 1):
+        for i in range(per_day):
+            lines.append(f"{month}-{day:02d} {i // 4:02d}:{(i % 4) * 15:02d}:00,tmp=20.{i % 10},hum=50.{i % 10}\n")
+    return lines
+
+
+class TestMonthlyIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "temp_humid_2025-12.txt")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_parse_line_timestamp_accepts_both_formats(self):
+        """REQ-01.1: 秒なし(旧)・秒あり(v6)の両フォーマットを同じ形に正規化する"""
+        self.assertEqual(parse_line_timestamp(b"2025-08-01 00:03,tmp=29.1,hum=57.3"), "2025-08-01 00:03:00")
+        self.assertEqual(parse_line_timestamp(b"2025-12-29 12:34:56,tmp=20.1,hum=40.0"), "2025-12-29 12:34:56")
+        self.assertIsNone(parse_line_timestamp(b"garbage line"))
+
+    def test_incremental_update_matches_full_rebuild(self):
+        """追記ごとの差分更新結果が、全体再構築と完全に一致する"""
+        lines = make_lines(day_count=30, per_day=96)
+        for i, line in enumerate(lines):
+            with open(self.path, "a") as f:
+                f.write(line)
+            # 毎行は遅いので、ブロック境界をまたぐ程度の間隔で更新
+            if i % 500 == 0 or i == len(lines) - 1:
+                update_index(self.path)
+
+        incremental = load_index(self.path)
+        full = build_index(self.path)
+        for key in ("byte_length", "line_count", "first_timestamp", "last_timestamp",
+                    "sorted", "block_sha256", "day_offsets"):
+            with self.subTest(key=key):
+                self.assertEqual(incremental[key], full[key])
+        self.assertEqual(incremental["line_count"], len(lines))
+        self.assertEqual(len(incremental["block_sha256"]), os.path.getsize(self.path) // BLOCK_SIZE)
+
+    def test_day_offsets_point_to_first_line_of_day(self):
+        """日ごとのオフセットでシークすると、その日の最初の行が読める"""
+        with open(self.path, "w") as f:
+            f.writelines(make_lines(day_count=5, per_day=10))
+        index = update_index(self.path)
+        with open(self.path, "rb") as f:
+            for day, (offset, line_no) in index["day_offsets"].items():
+                f.seek(offset)
+                self.assertTrue(f.readline().startswith(day.encode()))
+
+    def test_partial_trailing_line_is_deferred(self):
+        """改行のない末尾行（書き込み途中・停電）は索引に含めず、次回に取り込む"""
+        with open(self.path, "w") as f:
+            f.write("2025-12-01 00:00:00,tmp=20.0,hum=50.0\n2025-12-01 00:15")
+        index = update_index(self.path)
+        self.assertEqual(index["line_count"], 1)
+        self.assertIsNone(load_index(self.path))  # 末尾まで追いついていない
+
+        with open(self.path, "a") as f:
+            f.write(":00,tmp=20.1,hum=50.1\n")
+        index = update_index(self.path)
+        self.assertEqual(index["line_count"], 2)
+        self.assertEqual(index["last_timestamp"], "2025-12-01 00:15:00")
+        self.assertIsNotNone(load_index(self.path))
+
+    def test_rebuilds_when_file_shrinks(self):
+        """ファイルが索引より短くなった（上書き復元など）場合は再構築する"""
+        with open(self.path, "w") as f:
+            f.writelines(make_lines(day_count=3, per_day=10))
+        update_index(self.path)
+        with open(self.path, "w") as f:
+            f.writelines(make_lines(day_count=1, per_day=10))
+        index = update_index(self.path)
+        self.assertEqual(index["line_count"], 10)
+        self.assertEqual(list(index["day_offsets"]), ["2025-12-01"])
+
+    def test_skip_and_seek_helpers_for_downstream(self):
+        """下流ツール向け: 透かし以降のデータ有無判定と、シーク位置の算出"""
+        with open(self.path, "w") as f:
+            f.writelines(make_lines(day_count=3, per_day=10))
+        index = update_index(self.path)
+
+        self.assertFalse(has_data_after(index, datetime(2025, 12, 3, 2, 15)))
+        self.assertTrue(has_data_after(index, datetime(2025, 12, 3, 2, 0)))
+        self.assertEqual(seek_offset_for(index, datetime(2025, 12, 2, 12, 0)), index["day_offsets"]["2025-12-02"][0])
+        self.assertEqual(seek_offset_for(index, None), 0)
+
+        # 時系列が崩れたファイルではシークしない
+        with open(self.path, "a") as f:
+            f.write("2025-12-01 00:00:00,tmp=20.0,hum=50.0\n")
+        index = update_index(self.path)
+        self.assertFalse(index["sorted"])
+        self.assertEqual(seek_offset_for(index, datetime(2025, 12, 2, 12, 0)), 0)
+
+    def test_corrupt_index_file_is_rebuilt(self):
+        """索引ファイルが壊れていてもエラーにせず再構築する"""
+        with open(self.path, "w") as f:
+            f.writelines(make_lines(day_count=1, per_day=4))
+        with open(index_path_for(self.path), "w") as f:
+            f.write("{not json")
+        index = update_index(self.path)
+        self.assertEqual(index["line_count"], 4)
+        with open(index_path_for(self.path)) as f:
+            self.assertEqual(json.load(f)["line_count"], 4)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,172 @@
+import unittest
+import os
+import sys
+import random
+import re
+import tempfile
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# プロジェクトルートをパスに追加（CIでimport可能にする）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from monthly_parser import parse_bytes, parse_file, iter_file_chunks, to_dataframe
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_LINE_RE = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}(?::\d{2})?),tmp=(\d+\.\d+),hum=(\d+\.\d+)$")
+
+
+def reference_parse(text):
+    """1行ずつ標準ライブラリで解析する比較用の実装"""
+    rows, rejected = [], 0
+    for line in text.split("\n"):
+        line = line.rstrip("\r")
+        if not line:
+            continue
+        m = _LINE_RE.match(line)
+        try:
+            if not m:
+                raise ValueError(line)
+            fmt = "%Y-%m-%d %H:%M:%S" if len(m.group(1)) == 19 else "%Y-%m-%d %H:%M"
+            rows.append((datetime.strptime(m.group(1), fmt), float(m.group(2)), float(m.group(3))))
+        except ValueError:
+            rejected += 1
+    return rows, rejected
+
+
+def as_rows(result):
+    return [(ts.astype(datetime), t, h)
+            for ts, t, h in zip(result.timestamp, result.temperature.tolist(), result.humidity.tolist())]
+
+
+class TestParseBytes(unittest.TestCase):
+
+    def test_both_timestamp_layouts(self):
+        """秒なし (旧形式) と秒あり (v6形式) が混在していても両方解析できること (REQ-01.1)"""
+        data = b"2025-08-01 00:00,tmp=29.1,hum=65.3\n2025-08-01 00:15:42,tmp=28.9,hum=66.0\n"
+        result = parse_bytes(data)
+        self.assertEqual(as_rows(result), [
+            (datetime(2025, 8, 1, 0, 0), 29.1, 65.3),
+            (datetime(2025, 8, 1, 0, 15, 42), 28.9, 66.0),
+        ])
+        self.assertEqual(result.rejected, 0)
+        self.assertEqual(result.consumed, len(data))
+
+    def test_malformed_lines_are_rejected(self):
+        """形式違い・存在しない日付・数値でない値の行は除外され、件数が数えられること"""
+        data = (
+            "2025-08-01 00:00,tmp=29.1,hum=65.3\n"
+            "2025-02-30 00:00,tmp=29.1,hum=65.3\n"      # 存在しない日付
+            "2025-08-01 24:00,tmp=29.1,hum=65.3\n"      # 存在しない時刻
+            "2025-08-01 00:00,tmp=abc,hum=65.3\n"       # 数値でない
+            "2025-08-01 00:00,tmp=29.1\n"               # 湿度欠落
+            "2025-08-01 00:00,tmp=29.1,hum=65.3,x=1\n"  # 余分な列
+            "2025-08-01 00:00,hum=65.3,tmp=29.1\n"      # 列の順序違い
+            "garbage\n"
+            "\n"                                        # 空行は不正に数えない
+            "2025-08-01 00:30,tmp=3.25,hum=100.0\r\n"   # CRLF
+        ).encode()
+        result = parse_bytes(data)
+        self.assertEqual(as_rows(result), [
+            (datetime(2025, 8, 1, 0, 0), 29.1, 65.3),
+            (datetime(2025, 8, 1, 0, 30), 3.25, 100.0),
+        ])
+        self.assertEqual(result.rejected, 7)
+
+    def test_values_follow_legacy_format(self):
+        """従来の取り込みと同じく「数字.数字」だけを受け付け、整数・符号つき・小数点だけの側を不正にすること"""
+        for tmp in ("29", "-3.2", "+3.2", ".5", "29.", "2.9.1", "."):
+            with self.subTest(tmp=tmp):
+                result = parse_bytes(f"2025-08-01 00:00,tmp={tmp},hum=65.3\n".encode())
+                self.assertEqual((len(result.timestamp), result.rejected), (0, 1))
+        result = parse_bytes(b"2025-08-01 00:00,tmp=0.5,hum=100.00\n")
+        self.assertEqual(as_rows(result), [(datetime(2025, 8, 1, 0, 0), 0.5, 100.0)])
+
+    def test_lines_without_commas_are_rejected(self):
+        """カンマを1つも含まないバッファでも例外にならず、不正行として数えられること"""
+        self.assertEqual(parse_bytes(b"garbage\n").rejected, 1)
+        result = parse_bytes(b"2025-08-01 00:03 tmp=1 hum=2\n")
+        self.assertEqual((len(result.timestamp), result.rejected), (0, 1))
+        result = parse_bytes(b"# device: pi-02\n2025-08-01 00:1")
+        self.assertEqual((len(result.timestamp), result.rejected), (0, 1))
+        self.assertEqual(parse_bytes(b"# device: pi-02\n2025-08-01 00:1", final=False).rejected, 0)
+
+    def test_partial_last_line(self):
+        """final=False では書き込み途中の最終行を解析せず、consumed に含めないこと"""
+        data = b"2025-08-01 00:00,tmp=29.1,hum=65.3\n2025-08-01 00:15,tmp=2"
+        partial = parse_bytes(data, final=False)
+        self.assertEqual(len(partial.timestamp), 1)
+        self.assertEqual(partial.consumed, data.index(b"\n") + 1)
+
+        final = parse_bytes(data, final=True)
+        self.assertEqual(len(final.timestamp), 1)
+        self.assertEqual(final.rejected, 1)
+        self.assertEqual(final.consumed, len(data))
+
+    def test_matches_reference_parser(self):
+        """ランダムな正常行・不正行で、1行ずつの標準ライブラリ解析と完全に一致すること"""
+        rng = random.Random(0)
+        ts = datetime(2024, 12, 31, 23, 0)
+        lines = []
+        for _ in range(3000):
+            ts += timedelta(seconds=rng.randint(1, 1800))
+            stamp = ts.strftime("%Y-%m-%d %H:%M:%S" if rng.random() < 0.5 else "%Y-%m-%d %H:%M")
+            tmp = f"{rng.uniform(-10, 45):.{rng.randint(0, 3)}f}"
+            hum = f"{rng.uniform(0, 100):.{rng.randint(0, 3)}f}"
+            line = f"{stamp},tmp={tmp},hum={hum}"
+            if rng.random() < 0.05:
+                cut = rng.randint(0, len(line) - 1)
+                line = line[:cut] + rng.choice(["", "x", ",", "=", "."]) + line[cut + 1:]
+            lines.append(line)
+        text = "\n".join(lines) + "\n"
+
+        expected_rows, expected_rejected = reference_parse(text)
+        result = parse_bytes(text.encode())
+        self.assertEqual(as_rows(result), expected_rows)
+        self.assertEqual(result.rejected, expected_rejected)
+
+
+class TestFileParsing(unittest.TestCase):
+
+    def test_chunked_equals_whole_file(self):
+        """行の途中で区切れる小さなチャンクで読んでも、一括解析と同じ結果になること"""
+        path = os.path.join(ROOT, "temp_humid_2025-08.txt")
+        whole = parse_file(path)
+        chunks = list(iter_file_chunks(path, chunk_bytes=1000))
+        self.assertGreater(len(chunks), 10)
+        self.assertTrue(np.array_equal(np.concatenate([c.timestamp for c in chunks]), whole.timestamp))
+        self.assertTrue(np.array_equal(np.concatenate([c.temperature for c in chunks]), whole.temperature))
+        self.assertTrue(np.array_equal(np.concatenate([c.humidity for c in chunks]), whole.humidity))
+        self.assertEqual(chunks[-1].consumed, os.path.getsize(path))
+
+    def test_offset(self):
+        """offset 以降のみを解析すること (索引によるシーク)"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "temp_humid_2025-08.txt")
+            first = b"2025-08-01 00:00,tmp=29.1,hum=65.3\n"
+            with open(path, "wb") as f:
+                f.write(first + b"2025-08-01 00:15,tmp=28.9,hum=66.0\n")
+            result = parse_file(path, offset=len(first))
+            self.assertEqual(as_rows(result), [(datetime(2025, 8, 1, 0, 15), 28.9, 66.0)])
+
+    def test_sample_file_fully_parsed(self):
+        """同梱の月次ファイルが不正行なしで全行解析できること"""
+        path = os.path.join(ROOT, "temp_humid_2025-08.txt")
+        with open(path) as f:
+            expected_rows, _ = reference_parse(f.read())
+        result = parse_file(path)
+        self.assertEqual(result.rejected, 0)
+        self.assertEqual(as_rows(result), expected_rows)
+
+    def test_to_dataframe(self):
+        """unified_importer と同じ列構成の DataFrame になること"""
+        df = to_dataframe(parse_bytes(b"2025-08-01 00:15:42,tmp=28.9,hum=66.0\n"))
+        self.assertEqual(list(df.columns), ["timestamp", "temperature", "humidity"])
+        self.assertEqual(str(df["timestamp"].dtype), "datetime64[ns]")
+        self.assertEqual(df["timestamp"].iloc[0].to_pydatetime(), datetime(2025, 8, 1, 0, 15, 42))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+import contextlib
+import gzip
+import io
+import os
+import sys
+import tempfile
+from unittest import mock
+
+# プロジェクトルートをパスに追加（CIでimport可能にする）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import recover_data
+
+
+def log_line(data, marker="RAMバッファの月次ファイルに追記"):
+    return f"2025-12-14 00:00:01,123 - INFO - {marker}: {data}\n"
+
+
+class TestRecoverData(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log_dir = os.path.join(self.tmp.name, "logs")
+        self.out = os.path.join(self.tmp.name, "out")
+        os.makedirs(self.log_dir)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_log(self, name, lines):
+        path = os.path.join(self.log_dir, name)
+        opener = gzip.open if name.endswith(".gz") else open
+        with opener(path, "wt", encoding="utf-8") as f:
+            f.writelines(lines)
+        return path
+
+    def recover(self, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return recover_data.recover(recover_data.discover_logs(self.log_dir), self.out, workers=2, **kwargs)
+
+    def read(self, month):
+        with open(os.path.join(self.out, f"recovered_temp_humid_{month}.txt")) as f:
+            return f.read().splitlines()
+
+    def test_discover_rotated_and_gzip_logs(self):
+        for name in ("sensor_copier_v6.log", "sensor_copier_v6.log.1", "sensor_copier_v6.log.2.gz",
+                     "sensor_copier.log", "sensor_copier_v3.log.gz", "other.txt", "sensor_copier_v6.log.bak"):
+            self.write_log(name, [])
+        names = [os.path.basename(path) for path in recover_data.discover_logs(self.log_dir)]
+        self.assertEqual(names, ["sensor_copier.log", "sensor_copier_v3.log.gz", "sensor_copier_v6.log.2.gz",
+                                 "sensor_copier_v6.log.1", "sensor_copier_v6.log"])
+
+    def test_recover_month_across_logs(self):
+        """複数のログ (gzip・旧マーカーを含む) に重複して記録された行が、時刻順・重複なしで復元されること"""
+        self.write_log("sensor_copier.log", [
+            log_line("2025-12-01 00:10,tmp=25.1,hum=60.0", marker="月次ファイルに追記"),
+            "2025-12-14 00:00:02,000 - ERROR - センサー読み取り失敗\n",
+            log_line("2025-11-30 23:50:00,tmp=24.0,hum=59.0", marker="月次ファイルに追記"),
+        ])
+        self.write_log("sensor_copier_v2.log.1.gz", [
+            log_line("2025-12-01 00:20:00,tmp=25.2,hum=60.1"),
+            log_line("2025-12-01 00:10,tmp=25.1,hum=60.0"),
+        ])
+        self.write_log("sensor_copier_v2.log", [
+            log_line("2025-12-01 00:20:00,tmp=25.2,hum=60.1"),
+            log_line("2025-12-31 23:59:00,tmp=20.0,hum=50.0\r"),
+            log_line("2025-12-02 壊れた行"),
+        ])
+        written = self.recover(month="2025-12")
+        self.assertEqual(list(written), ["2025-12"])
+        self.assertEqual(self.read("2025-12"), ["2025-12-01 00:10,tmp=25.1,hum=60.0",
+                                                "2025-12-01 00:20:00,tmp=25.2,hum=60.1",
+                                                "2025-12-31 23:59:00,tmp=20.0,hum=50.0"])
+
+    def test_range_split_by_month_with_external_merge(self):
+        """小さなランと少ない同時マージ数でも、期間内の行が月ごとのファイルに正しく書き分けられること"""
+        lines = [log_line(f"2025-{month:02d}-{day:02d} {hour:02d}:00:00,tmp=25.0,hum=60.0")
+                 for month in (10, 11, 12) for day in (1, 15, 28) for hour in range(24)]
+        self.write_log("sensor_copier_v6.log", lines[::2])
+        self.write_log("sensor_copier_v6.log.1", lines[1::2])
+        self.write_log("sensor_copier_v6.log.2.gz", lines[::3])
+
+        with mock.patch.object(recover_data, "MERGE_FAN_IN", 3):
+            written = self.recover(start="2025-10-15 12:00", end="2025-12-01", run_lines=10)
+        self.assertEqual(sorted(written), ["2025-10", "2025-11", "2025-12"])
+        october, november, december = (self.read(month) for month in ("2025-10", "2025-11", "2025-12"))
+        self.assertEqual((october[0], len(october)), ("2025-10-15 12:00:00,tmp=25.0,hum=60.0", 12 + 24))
+        self.assertEqual(len(november), 72)
+        self.assertEqual(december[-1], "2025-12-01 23:00:00,tmp=25.0,hum=60.0")
+        self.assertEqual(november, sorted(set(november)))
+
+
+if __name__ == '__main__':
+    unittest.main()
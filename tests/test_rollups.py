@@ -0,0 +1,141 @@
+import unittest
+import os
+import sys
+import tempfile
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+# プロジェクトルートをパスに追加（CIでimport可能にする）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rollups
+import unified_importer
+
+
+def make_df(start, periods, freq="7min", seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "timestamp": pd.date_range(start, periods=periods, freq=freq),
+        "temperature": rng.uniform(20, 35, periods).round(1),
+        "humidity": rng.uniform(40, 80, periods).round(1),
+    })
+
+
+class TestRollups(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.tmp.name, 'sensor.db')}")
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                "CREATE TABLE sensor_data (timestamp DATETIME PRIMARY KEY, temperature FLOAT, humidity FLOAT)"))
+        rollups.ensure_tables(self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp.cleanup()
+
+    def raw(self):
+        df = pd.read_sql(text("SELECT * FROM sensor_data"), self.engine)
+        df["timestamp"] = pd.to_datetime(df["timestamp"])
+        return df
+
+    def assert_matches_raw(self):
+        """集計テーブルが sensor_data 全体からの集計と一致すること"""
+        raw = self.raw()
+        daily = rollups.load_daily(self.engine).set_index("day")
+        expected_daily = raw.groupby(raw["timestamp"].dt.strftime("%Y-%m-%d"))
+        self.assertEqual(sorted(daily.index), sorted(expected_daily.groups))
+        np.testing.assert_allclose(daily["samples"], expected_daily.size().loc[daily.index])
+        np.testing.assert_allclose(daily["temperature_mean"], expected_daily["temperature"].mean().loc[daily.index])
+        np.testing.assert_allclose(daily["humidity_max"], expected_daily["humidity"].max().loc[daily.index])
+        np.testing.assert_allclose(daily["temperature_std"],
+                                   expected_daily["temperature"].std(ddof=0).loc[daily.index], atol=1e-6)
+
+        profile = rollups.load_hourly_profile(self.engine).set_index(["month", "hour_of_day"])
+        keys = [raw["timestamp"].dt.strftime("%Y-%m"), raw["timestamp"].dt.hour]
+        expected_profile = raw.groupby(keys)
+        self.assertEqual(len(profile), expected_profile.ngroups)
+        np.testing.assert_allclose(profile["samples"], expected_profile.size().loc[profile.index])
+        np.testing.assert_allclose(profile["temperature_min"],
+                                   expected_profile["temperature"].min().loc[profile.index])
+        np.testing.assert_allclose(profile["humidity_mean"],
+                                   expected_profile["humidity"].mean().loc[profile.index])
+
+    def test_incremental_updates_match_full_aggregation(self):
+        """複数回に分けて取り込んでも、集計が全件集計と一致すること"""
+        unified_importer.insert_to_db(make_df("2025-07-30", 1500, seed=1), self.engine)
+        unified_importer.insert_to_db(make_df("2025-08-05 13:00", 300, seed=2), self.engine)
+        self.assert_matches_raw()
+
+    def test_overwritten_rows_are_not_double_counted(self):
+        """UPSERT で値が上書きされた行は、差し替え後の値で集計されること"""
+        unified_importer.insert_to_db(make_df("2025-08-01", 400, seed=1), self.engine)
+        unified_importer.insert_to_db(make_df("2025-08-01 10:00", 50, seed=3), self.engine)
+        self.assert_matches_raw()
+
+    def test_only_touched_hours_are_read(self):
+        """再集計で読む生データは、今回取り込んだ時間帯に限られること"""
+        unified_importer.insert_to_db(make_df("2025-08-01", 2000, seed=1), self.engine)
+        queries = []
+        original = rollups._select
+
+        def recording(connection, sql, params):
+            if "FROM sensor_data" in sql:
+                queries.append(params)
+            return original(connection, sql, params)
+
+        with mock.patch.object(rollups, "_select", side_effect=recording):
+            unified_importer.insert_to_db(make_df("2025-08-03 05:10", 3, freq="10min", seed=4), self.engine)
+        self.assertEqual(queries, [{"device": "default",
+                                    "start": "2025-08-03 05:00:00", "end": "2025-08-03 06:00:00"}])
+        self.assert_matches_raw()
+
+    def test_summary_and_rebuild(self):
+        """日別集計からの統計が全件の AVG/COUNT と一致し、作り直しても同じ集計になること"""
+        unified_importer.insert_to_db(make_df("2025-07-31 20:00", 600, seed=5), self.engine)
+        raw = self.raw()
+        stats = rollups.summary(self.engine)
+        self.assertEqual(stats["total_rows"], len(raw))
+        self.assertAlmostEqual(stats["avg_temp"], raw["temperature"].mean(), places=9)
+        before = rollups.load_hourly_profile(self.engine)
+
+        with self.engine.begin() as connection:
+            for table in ("sensor_rollup_hourly", "sensor_rollup_daily", "sensor_rollup_month_hour"):
+                connection.execute(text(f"DELETE FROM {table}"))
+        self.assertIsNone(rollups.summary(self.engine))
+        rollups.rebuild(self.engine, window_days=1)
+        pd.testing.assert_frame_equal(rollups.load_hourly_profile(self.engine), before)
+
+
+    def test_tables_created_over_existing_rows_are_rebuilt(self):
+        """行のある sensor_data に集計テーブルを後から作った場合も、差分取り込み後の統計が全件と一致すること"""
+        with self.engine.begin() as connection:
+            for table in rollups.TABLES:
+                connection.execute(text(f"DROP TABLE {table}"))
+        make_df("2025-07-01", 1000, seed=6).assign(timestamp=lambda df: df["timestamp"].astype(str)).to_sql(
+            "sensor_data", self.engine, if_exists="append", index=False)
+        rollups.ensure_tables(self.engine)
+        unified_importer.insert_to_db(make_df("2025-08-01", 300, seed=7), self.engine)
+        raw = self.raw()
+        stats = rollups.summary(self.engine)
+        self.assertEqual(stats["total_rows"], len(raw))
+        self.assertAlmostEqual(stats["avg_temp"], raw["temperature"].mean(), places=9)
+        self.assert_matches_raw()
+
+    def test_legacy_tables_are_rebuilt(self):
+        """デバイス列の無い旧形式の集計テーブルは、作り直した上で生データから再構築されること"""
+        unified_importer.insert_to_db(make_df("2025-08-01", 500, seed=8), self.engine)
+        with self.engine.begin() as connection:
+            connection.execute(text("DROP TABLE sensor_rollup_daily"))
+            connection.execute(text("CREATE TABLE sensor_rollup_daily (day DATE PRIMARY KEY, samples INTEGER)"))
+            connection.execute(text("INSERT INTO sensor_rollup_daily VALUES ('2025-08-01', 1)"))
+        rollups.ensure_tables(self.engine)
+        self.assertEqual(rollups.summary(self.engine)["total_rows"], 500)
+        self.assert_matches_raw()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+import os
+import sys
+import tempfile
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+# プロジェクトルートをパスに追加（CIでimport可能にする）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import row_filter
+import unified_importer
+
+
+def month_lines(month, start, count, temperature="25.5"):
+    return "".join(f"{month}-01 {i // 60:02d}:{i % 60:02d}:00,tmp={temperature},hum=55.0\n"
+                   for i in range(start, start + count))
+
+
+class TestRowFilter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.tmp.name, 'sensor.db')}")
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                "CREATE TABLE sensor_data (timestamp DATETIME PRIMARY KEY, temperature FLOAT, humidity FLOAT)"))
+        row_filter.ensure_table(self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp.cleanup()
+
+    def write(self, name, text_):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w") as f:
+            f.write(text_)
+        return path
+
+    def import_files(self, paths, late_data):
+        """insert_to_db に渡った行数と挿入結果を返す"""
+        passed = []
+        original = unified_importer.insert_to_db
+
+        def spy(df, engine, **kwargs):
+            passed.append(len(df))
+            return original(df, engine, **kwargs)
+
+        with mock.patch.object(unified_importer, "insert_to_db", side_effect=spy):
+            total = unified_importer.process_files(paths, self.engine,
+                                                   unified_importer.get_last_timestamp(self.engine),
+                                                   late_data=late_data)
+        return total, sum(passed)
+
+    def count(self):
+        with self.engine.connect() as connection:
+            return connection.execute(text("SELECT COUNT(*) FROM sensor_data")).scalar()
+
+    def test_recovered_older_month_is_imported_only_in_late_mode(self):
+        """最新時刻より古い復旧データは、通常モードでは捨てられ、late_data では取り込まれること"""
+        self.import_files([self.write("temp_humid_2025-08.txt", month_lines("2025-08", 0, 100))], False)
+        recovered = self.write("temp_humid_2025-07.txt", month_lines("2025-07", 0, 80))
+
+        self.assertEqual(self.import_files([recovered], False), (0, 0))
+        # 通常モードで「取り込み済み」と記録されたファイルも、late_data では読み直して取り込む
+        self.assertEqual(self.import_files([recovered], True), (80, 80))
+        self.assertEqual(self.count(), 180)
+        # 変化がなければ何も書き込まない
+        self.assertEqual(self.import_files([recovered, os.path.join(self.tmp.name, "temp_humid_2025-08.txt")],
+                                           True), (0, 0))
+
+    def test_late_mode_reads_only_new_bytes(self):
+        """late_data でもチェックポイントを使い、変化のないファイルは読まず、追記分だけを解析すること"""
+        path = self.write("temp_humid_2025-08.txt", month_lines("2025-08", 0, 100))
+        self.assertEqual(self.import_files([path], True), (100, 100))
+        with mock.patch.object(unified_importer, "parse_monthly_file") as parse:
+            self.assertEqual(self.import_files([path], True), (0, 0))
+            parse.assert_not_called()
+
+        size = os.path.getsize(path)
+        with open(path, "a") as f:
+            f.write(month_lines("2025-08", 100, 10))
+        original = unified_importer.parse_monthly_file
+        with mock.patch.object(unified_importer, "parse_monthly_file", side_effect=original) as parse:
+            self.assertEqual(self.import_files([path], True), (10, 10))
+        self.assertEqual([call.args[1] for call in parse.call_args_list], [size])
+        self.assertEqual(self.count(), 110)
+
+    def test_only_new_or_changed_rows_are_written(self):
+        """書き換えられたファイルを取り込み直すとき、追加・変更された行だけが挿入されること"""
+        path = self.write("temp_humid_2025-08.txt", month_lines("2025-08", 10, 100))
+        self.import_files([path], True)
+        # 先頭に遅れて届いた5行を足し、1行の値を変える
+        lines = month_lines("2025-08", 10, 100).splitlines(keepends=True)
+        lines[50] = lines[50].replace("tmp=25.5", "tmp=26.0")
+        self.write("temp_humid_2025-08.txt", month_lines("2025-08", 0, 5) + "".join(lines))
+
+        self.assertEqual(self.import_files([path], True), (6, 6))
+        self.assertEqual(self.count(), 105)
+        with self.engine.connect() as connection:
+            changed = connection.execute(text(
+                "SELECT temperature FROM sensor_data WHERE timestamp = '2025-08-01 01:00:00'")).scalar()
+        self.assertEqual(changed, 26.0)
+
+    def test_filter_is_built_from_existing_rows_once(self):
+        """フィルタが無い月は sensor_data から1回だけ作り、以降は DB に問い合わせないこと"""
+        self.import_files([self.write("temp_humid_2025-08.txt", month_lines("2025-08", 0, 100))], False)
+        df = pd.DataFrame({
+            "timestamp": pd.date_range("2025-08-01 01:30", periods=20, freq="min"),
+            "temperature": np.float32(25.5).repeat(20).astype(np.float64),
+            "humidity": np.full(20, 55.0),
+        })
+        filters = {}
+        with mock.patch.object(row_filter, "_build_from_db", wraps=row_filter._build_from_db) as build:
+            fresh = row_filter.select_new(self.engine, filters, df)
+            self.assertEqual(len(fresh), 10)
+            row_filter.record(self.engine, filters, fresh)
+            self.assertTrue(row_filter.select_new(self.engine, filters, df).empty)
+        self.assertEqual(build.call_count, 1)
+
+        # 保存したフィルタは次回の実行 (新しい dict) でも使われる
+        with mock.patch.object(row_filter, "_build_from_db") as build:
+            self.assertTrue(row_filter.select_new(self.engine, {}, df).empty)
+            build.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# プロジェクトルートをパスに追加（CIでimport可能にする）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bulk_loader
+import monthly_parser
+import sensor_export
+import storage
+
+
+class TestSensorExport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = storage.create_sqlite_engine(os.path.join(self.tmp.name, "sensor.db"))
+        # 2025-07-31 22:00 から 10分おき 400行 (7月末〜8月) を2デバイス分
+        times = pd.date_range("2025-07-31 22:00", periods=400, freq="10min")
+        for device, offset in (("default", 0.0), ("pi-02", 5.0)):
+            df = pd.DataFrame({"timestamp": times,
+                               "temperature": 25.3 + offset + np.arange(400) % 7 / 10,
+                               "humidity": 61.25 + np.zeros(400)})
+            bulk_loader.bulk_load(self.engine, df, device=device)
+        self.times = times
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp.cleanup()
+
+    def test_batches_are_bounded_and_ordered(self):
+        """期間・デバイスで絞り込んだ行が、batch_size 行以下のバッチで時刻順に返されること"""
+        batches = list(sensor_export.iter_batches(self.engine, "2025-08-01", "2025-08-01", "pi-02", batch_size=50))
+        self.assertTrue(all(len(batch) <= 50 for batch in batches))
+        rows = [row for batch in batches for row in batch]
+        self.assertEqual(len(rows), 144)
+        self.assertEqual((rows[0][:2], rows[-1][:2]), (("pi-02", "2025-08-01 00:00:00"),
+                                                        ("pi-02", "2025-08-01 23:50:00")))
+        self.assertEqual([row[1] for row in rows], sorted(row[1] for row in rows))
+
+    def test_monthly_round_trip(self):
+        """月次ファイル形式の出力が、元のファイルと同じ書式でデバイスのフォルダに分けて書かれること"""
+        out = os.path.join(self.tmp.name, "export")
+        rows, written = sensor_export.export(self.engine, out, "monthly", batch_size=64)
+        self.assertEqual(rows, 800)
+        self.assertEqual(sorted(os.path.relpath(path, out) for path in written),
+                         ["pi-02/temp_humid_2025-07.txt", "pi-02/temp_humid_2025-08.txt",
+                          "temp_humid_2025-07.txt", "temp_humid_2025-08.txt"])
+        with open(os.path.join(out, "temp_humid_2025-07.txt")) as f:
+            self.assertEqual(f.readline(), "2025-07-31 22:00:00,tmp=25.3,hum=61.25\n")
+        parsed = monthly_parser.to_dataframe(
+            monthly_parser.parse_file(os.path.join(out, "pi-02", "temp_humid_2025-08.txt")))
+        self.assertEqual(len(parsed), 400 - 12)
+        self.assertEqual(parsed["timestamp"].iloc[0], pd.Timestamp("2025-08-01 00:00:00"))
+        self.assertEqual(parsed["temperature"].iloc[0], 30.8)
+        self.assertFalse([name for _, _, names in os.walk(out) for name in names if name.endswith(".part")])
+
+    def test_npz_and_csv(self):
+        """列形式 (.npz) は np.load で読め、CSV はヘッダーつきで全行が書かれること"""
+        path = os.path.join(self.tmp.name, "sensor.npz")
+        rows, _ = sensor_export.export(self.engine, path, "npz", start="2025-08-01", batch_size=100)
+        self.assertEqual(rows, 2 * (400 - 12))
+        with np.load(path) as data:
+            self.assertEqual(data["devices"].tolist(), ["default", "pi-02"])
+            self.assertEqual(len(data["timestamp"]), rows)
+            self.assertEqual(data["timestamp"][0], np.datetime64("2025-08-01T00:00:00"))
+            self.assertEqual(np.bincount(data["device"]).tolist(), [388, 388])
+            self.assertEqual(data["humidity"][-1], 61.25)
+
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            rows, _ = sensor_export.export(self.engine, "-", "csv", end="2025-07-31 23:59", device="default")
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(rows, 12)
+        self.assertEqual(lines[0], "device_id,timestamp,temperature,humidity")
+        self.assertEqual(lines[1], "default,2025-07-31 22:00:00,25.3,61.25")
+        self.assertEqual(len(lines), 13)
+
+
+if __name__ == '__main__':
+    unittest.main()
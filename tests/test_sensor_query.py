@@ -0,0 +1,102 @@
+import unittest
+import os
+import sys
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+# プロジェクトルートをパスに追加（CIでimport可能にする）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from monthly_index import update_index
+from sensor_query import iter_range, query_lines, query_arrays, to_key, line_key
+
+
+def write_month(dirpath, month, lines):
+    path = os.path.join(dirpath, f"temp_humid_{month}.txt")
+    with open(path, "w") as f:
+        f.writelines(lines)
+    return path
+
+
+def brute_force(lines, start, end):
+    start_key, end_key = to_key(start), to_key(end, end_of_range=True)
+    hits = []
+    for line in lines:
+        raw = line.rstrip("\n").encode()
+        key = line_key(raw, 0)
+        if key is not None and start_key <= key <= end_key:
+            hits.append(line.rstrip("\n"))
+    return hits
+
+
+class TestSensorQuery(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dir = self.tmpdir.name
+        # 7月: 旧フォーマット(秒なし)、8月: v6フォーマット(秒あり) + 不正行
+        ts = datetime(2025, 7, 30, 0, 0)
+        self.july, self.august = [], []
+        while ts < datetime(2025, 8, 3):
+            if ts.month == 7:
+                self.july.append(f"{ts:%Y-%m-%d %H:%M},tmp=28.{ts.minute % 10},hum=60.0\n")
+            else:
+                self.august.append(f"{ts:%Y-%m-%d %H:%M:%S},tmp=29.{ts.minute % 10},hum=55.0\n")
+                if ts.minute == 0 and ts.hour == 3:
+                    self.august.append("broken line without timestamp\n")
+            ts += timedelta(minutes=7, seconds=13)
+        write_month(self.dir, "2025-07", self.july)
+        write_month(self.dir, "2025-08", self.august)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_random_ranges_match_brute_force(self):
+        """二分探索の結果が全行走査と一致する（月またぎ・新旧フォーマット混在）"""
+        all_lines = self.july + self.august
+        rng = random.Random(42)
+        for _ in range(100):
+            start = datetime(2025, 7, 29, 22) + timedelta(seconds=rng.randrange(5 * 86400))
+            end = start + timedelta(seconds=rng.randrange(2 * 86400))
+            with self.subTest(start=start, end=end):
+                self.assertEqual(query_lines(self.dir, start, end), brute_force(all_lines, start, end))
+
+    def test_boundaries_are_inclusive_and_legacy_minutes_match(self):
+        """両端を含み、秒なし行は HH:MM:00 として比較される"""
+        first = self.july[0].rstrip("\n")
+        self.assertEqual(query_lines(self.dir, "2025-07-30 00:00", "2025-07-30 00:00"), [first])
+        self.assertEqual(query_lines(self.dir, "2025-07-30 00:00:01", "2025-07-30 00:07"), [self.july[1].rstrip("\n")])
+
+    def test_index_narrowing_gives_same_result(self):
+        """サイドカー索引がある場合も同じ結果になる"""
+        start, end = "2025-08-01 02:00", "2025-08-02 05:00"
+        expected = query_lines(self.dir, start, end)
+        update_index(os.path.join(self.dir, "temp_humid_2025-08.txt"))
+        self.assertEqual(query_lines(self.dir, start, end), expected)
+        self.assertGreater(len(expected), 0)
+
+    def test_unsorted_file_falls_back_to_linear_scan(self):
+        """索引上で時系列順でないファイルは線形走査で正しく抽出する"""
+        lines = ["2025-09-02 00:00:00,tmp=20.0,hum=50.0\n",
+                 "2025-09-01 00:00:00,tmp=21.0,hum=51.0\n",
+                 "2025-09-03 00:00:00,tmp=22.0,hum=52.0\n"]
+        path = write_month(self.dir, "2025-09", lines)
+        update_index(path)
+        self.assertEqual(query_lines(self.dir, "2025-09-01", "2025-09-01"), [lines[1].rstrip("\n")])
+
+    def test_query_arrays_returns_typed_arrays(self):
+        """配列APIは datetime64 と float64 を返す"""
+        result = query_arrays(self.dir, "2025-08-01", "2025-08-01")
+        self.assertEqual(str(result["timestamp"].dtype), "datetime64[s]")
+        self.assertEqual(len(result["timestamp"]), len(result["temperature"]))
+        self.assertTrue((result["humidity"] == 55.0).all())
+
+    def test_empty_and_missing_months(self):
+        """存在しない月や逆転した範囲は空を返す"""
+        self.assertEqual(query_lines(self.dir, "2024-01-01", "2024-02-01"), [])
+        self.assertEqual(list(iter_range(self.dir, "2025-08-02", "2025-08-01")), [])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
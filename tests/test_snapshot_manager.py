@@ -0,0 +1,125 @@
+import unittest
+from unittest import mock
+import os
+import shutil
+import sys
+import time
+import tempfile
+from datetime import datetime, timedelta
+
+# プロジェクトルートをパスに追加（CIでimport可能にする）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import snapshot_manager
+from snapshot_manager import take_snapshot, list_snapshots, select_for_deletion, snapshot_and_prune, prune_snapshots
+
+
+def proc_wchar():
+    """このプロセスが write 系のシステムコールに渡した累計バイト数"""
+    with open("/proc/self/io") as f:
+        return int(next(line for line in f if line.startswith("wchar:")).split()[1])
+
+
+class TestSnapshotManager(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.tmpdir.name, "ram")
+        self.root = os.path.join(self.tmpdir.name, "snapshots")
+        os.makedirs(self.src)
+        # 締まった過去月（大きめ）と当月
+        with open(os.path.join(self.src, "temp_humid_2025-11.txt"), "w") as f:
+            f.writelines(f"2025-11-{1 + i // 3000:02d} 00:00:00,tmp=20.0,hum=50.0\n" for i in range(40000))
+        self.current = os.path.join(self.src, "temp_humid_2025-12.txt")
+        with open(self.current, "w") as f:
+            f.write("2025-12-01 00:00:00,tmp=20.0,hum=50.0\n")
+        self.t0 = datetime(2025, 12, 30, 12, 0, 0)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read(self, *parts):
+        with open(os.path.join(*parts)) as f:
+            return f.read()
+
+    def append_line(self):
+        line = "2025-12-01 00:15:00,tmp=20.1,hum=50.1\n"
+        with open(self.current, "a") as f:
+            f.write(line)
+        return len(line)
+
+    def test_unchanged_files_are_hardlinked_and_appends_write_new_bytes_only(self):
+        """未変更ファイルはハードリンク、reflink できる場合の追記ファイルは新規分のみ書く。各世代の内容は独立"""
+        first, _ = take_snapshot(self.src, self.root, now=self.t0)
+        appended = self.append_line()
+
+        def fake_reflink(src_path, dst_path):
+            # reflink 対応のファイルシステムの代わり: ブロック共有の複製は書き込みに数えない
+            shutil.copyfile(src_path, dst_path)
+            return True
+
+        with mock.patch.object(snapshot_manager, "_reflink", side_effect=fake_reflink):
+            second, counts = take_snapshot(self.src, self.root, now=self.t0 + timedelta(hours=4))
+
+        self.assertEqual(counts, {"link": 1, "append": 1, "copy": 0, "bytes": appended})
+        closed_first = os.stat(os.path.join(first, "temp_humid_2025-11.txt"))
+        closed_second = os.stat(os.path.join(second, "temp_humid_2025-11.txt"))
+        self.assertEqual(closed_first.st_ino, closed_second.st_ino)
+        # 前世代は追記の影響を受けない（ポイントインタイム）
+        self.assertEqual(self.read(first, "temp_humid_2025-12.txt").count("\n"), 1)
+        self.assertEqual(self.read(second, "temp_humid_2025-12.txt"), self.read(self.current))
+
+    @unittest.skipUnless(os.path.exists("/proc/self/io"), "Linux の I/O 統計が必要")
+    def test_without_reflink_current_month_is_copied_once(self):
+        """reflink できない場合は前世代を複製せず、ソースから1回だけ全体を書くこと (実際の書き込み量で確認)"""
+        take_snapshot(self.src, self.root, now=self.t0)
+        self.append_line()
+        before = proc_wchar()
+        _, counts = take_snapshot(self.src, self.root, now=self.t0 + timedelta(hours=4))
+        written = proc_wchar() - before
+
+        size = os.path.getsize(self.current)
+        self.assertEqual((counts["append"], counts["copy"], counts["bytes"]), (0, 1, size))
+        self.assertLess(written, size + 4096)
+
+    def test_rewritten_file_is_fully_copied(self):
+        """先頭部分が変わったファイル（復旧で上書き等）は全体コピーする"""
+        first, _ = take_snapshot(self.src, self.root, now=self.t0)
+        with open(self.current, "w") as f:
+            f.write("2025-12-01 00:00:00,tmp=99.9,hum=50.0\n2025-12-01 00:15:00,tmp=20.1,hum=50.1\n")
+        second, counts = take_snapshot(self.src, self.root, now=self.t0 + timedelta(hours=4))
+        self.assertEqual(counts["copy"], 1)
+        self.assertEqual(self.read(second, "temp_humid_2025-12.txt"), self.read(self.current))
+
+    def test_snapshot_is_fast_for_typical_data(self):
+        """通常データ量（過去月数ヶ月 + 当月）で1秒を大きく下回る"""
+        take_snapshot(self.src, self.root, now=self.t0)
+        self.append_line()
+        started = time.perf_counter()
+        snapshot_and_prune(self.src, self.root, now=self.t0 + timedelta(hours=4))
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertTrue(os.path.islink(os.path.join(self.root, "latest")))
+
+    def test_retention_keeps_recent_and_daily(self):
+        """保持ポリシー: 直近N世代 + 日次の最終世代"""
+        names = [(self.t0 - timedelta(hours=4 * i)).strftime("%Y%m%d-%H%M%S") for i in range(60)]
+        deleted = select_for_deletion(names, keep_last=3, keep_daily=5, now=self.t0)
+        kept = sorted(set(names) - set(deleted))
+        self.assertTrue(set(sorted(names)[-3:]).issubset(kept))
+        self.assertEqual(len({name[:8] for name in kept}), 5)
+        self.assertEqual(len(kept), 3 + 4)  # 当日分は直近3世代に含まれる
+
+    def test_prune_removes_only_snapshot_directories(self):
+        """削除対象は世代ディレクトリのみ（他のファイルには触れない）"""
+        for i in range(4):
+            take_snapshot(self.src, self.root, now=self.t0 - timedelta(days=40 - i))
+        other = os.path.join(self.root, "README.txt")
+        open(other, "w").close()
+        removed = prune_snapshots(self.root, keep_last=1, keep_daily=5, now=self.t0)
+        self.assertEqual(len(removed), 3)
+        self.assertEqual(len(list_snapshots(self.root)), 1)
+        self.assertTrue(os.path.exists(other))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,68 @@
+import unittest
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+# プロジェクトルートをパスに追加（CIでimport可能にする）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import spiral_plot
+    from PIL import Image, ImageSequence
+except ImportError:  # matplotlib / Pillow は可視化用の依存 (CI ではインストールしない)
+    spiral_plot = None
+
+
+@unittest.skipUnless(spiral_plot is not None, "matplotlib / Pillow が必要")
+class TestSpiralPlot(unittest.TestCase):
+
+    def setUp(self):
+        self.start = datetime(2025, 8, 1)
+        # 2日分 (15分間隔) = 192点 → 3フレーム + 開始フレーム
+        self.spiral = spiral_plot.build_spiral(spiral_plot.synthetic_month(self.start, 15, days=2), self.start)
+        self.palette = spiral_plot.gif_palette(self.spiral)
+
+    def full_redraw(self, n):
+        """以前と同じく、先頭からの線分をまとめて描いたフレーム n"""
+        fig, ax, line_collection, progress_text = spiral_plot._create_figure(self.spiral)
+        end_index = spiral_plot.frame_end(self.spiral, n)
+        line_collection.set_segments(self.spiral.segments[:end_index - 1])
+        line_collection.set_array(self.spiral.colors[:end_index - 1])
+        spiral_plot._set_frame_text(ax, progress_text, self.spiral, n, end_index)
+        fig.canvas.draw()
+        rgb = np.asarray(fig.canvas.buffer_rgba())[:, :, :3]
+        return Image.fromarray(rgb).quantize(palette=self.palette, dither=Image.Dither.NONE)
+
+    def test_incremental_frames_match_full_redraw(self):
+        """増分だけを描き足したフレームが、先頭から全部描いたフレームと同じ画像になること"""
+        total = spiral_plot.frame_count(self.spiral)
+        self.assertEqual(total, 3 + 1)
+        frames = list(spiral_plot.render_frames(self.spiral, palette=self.palette))
+        self.assertEqual(len(frames), total)
+        for n in (2, total - 1):
+            incremental = np.asarray(frames[n])
+            expected = np.asarray(self.full_redraw(n))
+            self.assertGreater((incremental == expected).mean(), 0.999)
+
+    def test_parallel_ranges_are_stitched_in_order(self):
+        """フレームの範囲を別プロセスで描いてつないだ GIF が、1プロセスの GIF と同じフレーム列になること"""
+        self.assertEqual(spiral_plot.frame_ranges(5, 2), [(0, 2), (2, 5)])
+        self.assertEqual(spiral_plot.frame_ranges(2, 4), [(0, 1), (1, 2)])
+        with tempfile.TemporaryDirectory() as tmpdir:
+            frames = []
+            for workers in (1, 2):
+                path = os.path.join(tmpdir, f"spiral_{workers}.gif")
+                self.assertEqual(spiral_plot.write_gif(self.spiral, path, workers), 4)
+                with Image.open(path) as gif:
+                    frames.append([np.asarray(frame.convert("RGB")) for frame in ImageSequence.Iterator(gif)])
+        serial, parallel = frames
+        self.assertEqual(len(parallel), len(serial))
+        for a, b in zip(serial, parallel):
+            np.testing.assert_array_equal(a, b)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+import contextlib
+import io
+import os
+import sys
+import tempfile
+from unittest import mock
+
+import pandas as pd
+from sqlalchemy import text
+
+# プロジェクトルートをパスに追加（CIでimport可能にする）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rollups
+import storage
+import unified_importer
+
+
+class TestStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "db", "sensor.db")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_sqlite_pragmas(self):
+        """SQLite の接続ごとに WAL・busy_timeout が設定されること"""
+        engine = storage.create_sqlite_engine(self.path)
+        with engine.connect() as connection:
+            self.assertEqual(connection.execute(text("PRAGMA journal_mode")).scalar(), "wal")
+            self.assertEqual(connection.execute(text("PRAGMA busy_timeout")).scalar(),
+                             storage.SQLITE_BUSY_TIMEOUT_MS)
+            self.assertEqual(connection.execute(text("PRAGMA synchronous")).scalar(), 1)
+        engine.dispose()
+
+    def test_backend_selection(self):
+        with mock.patch.dict(os.environ, {"SENSOR_DB_BACKEND": "sqlite", "SENSOR_DB_PATH": self.path}):
+            engine = storage.create_engine_for()
+            self.assertEqual((engine.dialect.name, engine.url.database), ("sqlite", self.path))
+            engine.dispose()
+        with mock.patch.dict(os.environ, {"SENSOR_DB_BACKEND": "oracle"}):
+            with self.assertRaises(ValueError):
+                storage.create_engine_for()
+        with self.assertRaises(ValueError):
+            storage.create_engine_for("mysql", db_config={"host": "h", "user": "u", "password": None,
+                                                          "database": "d"})
+        self.assertEqual(storage.mysql_url({"host": "h", "user": "u", "password": "p", "database": "d"}, "pymysql"),
+                         "mysql+pymysql://u:p@h/d")
+
+    def test_import_and_read_views(self):
+        """SQLite に取り込んだデータを、可視化スクリプトと同じビュー・集計テーブルで読めること"""
+        source = os.path.join(self.tmp.name, "temp_humid_2025-08.txt")
+        with open(source, "w") as f:
+            for minute in range(0, 120, 15):
+                f.write(f"2025-08-01 {minute // 60:02d}:{minute % 60:02d}:00,tmp=25.5,hum=60.0\n")
+        engine = storage.create_sqlite_engine(self.path)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(unified_importer.process_files(source, engine, None), 8)
+
+        with mock.patch.dict(os.environ, {"SENSOR_DB_BACKEND": "sqlite", "SENSOR_DB_PATH": self.path}):
+            reader = storage.engine_for_reading()
+        df = pd.read_sql("SELECT source, hour, temperature, humidity FROM hourly_data_separate", reader)
+        self.assertEqual(df["hour"].tolist(), [0.0, 0.25, 0.5, 0.75, 1.0, 1.25, 1.5, 1.75])
+        self.assertEqual(set(df["source"]), {"sensor_data"})
+        self.assertEqual(len(pd.read_sql("SELECT hour, temperature FROM hourly_data", reader)), 8)
+        self.assertEqual(rollups.load_hourly_profile(reader)["samples"].tolist(), [4, 4])
+        reader.dispose()
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,258 @@
+import unittest
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+
+from sqlalchemy import create_engine, text
+
+# プロジェクトルートをパスに追加（CIでimport可能にする）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import unified_importer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 子プロセスで1ファイルをストリーミング取り込みし、取り込み中に増えたピークRSS (MB) を出力する。
+# DBへの挿入は件数を返すだけの関数に差し替える (mock はDataFrameへの参照を保持してしまうため使わない)
+RSS_PROBE = """
+import contextlib, io, logging, os, resource, sys
+sys.path.insert(0, sys.argv[1])
+from sqlalchemy import create_engine
+import unified_importer
+path, max_memory_mb = sys.argv[2], int(sys.argv[3])
+unified_importer.logger.setLevel(logging.WARNING)
+unified_importer.insert_to_db = lambda df, engine, **kwargs: len(df)
+engine = create_engine('sqlite:///' + path + '.db')
+unit = 1 if sys.platform == 'darwin' else 1024
+base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+with contextlib.redirect_stdout(io.StringIO()):
+    total = unified_importer.process_files([path], engine, None, workers=1, max_memory_mb=max_memory_mb)
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+print(total, (peak - base) / 2**20)
+"""
+
+
+def write_month(dirpath, month, count):
+    path = os.path.join(dirpath, f"temp_humid_{month}.txt")
+    with open(path, "w") as f:
+        for i in range(count):
+            f.write(f"{month}-01 {i // 60:02d}:{i % 60:02d}:00,tmp={20 + i % 10}.5,hum=55.0\n")
+    return path
+
+
+class TestParallelImport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.months = ["2025-03", "2024-11", "2025-01", "2024-12", "2025-02"]
+        for month in self.months:
+            write_month(self.tmp.name, month, 120)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def import_with(self, workers):
+        engine = create_engine(f"sqlite:///{os.path.join(self.tmp.name, f'w{workers}.db')}")
+        with engine.begin() as connection:
+            connection.execute(text(
+                "CREATE TABLE sensor_data (timestamp DATETIME PRIMARY KEY, temperature FLOAT, humidity FLOAT)"))
+        total = unified_importer.process_files(self.tmp.name, engine, None, workers=workers)
+        with engine.connect() as connection:
+            rows = connection.execute(text("SELECT * FROM sensor_data ORDER BY timestamp")).fetchall()
+        engine.dispose()
+        return total, rows
+
+    def test_parallel_matches_sequential(self):
+        """プロセスプールで解析しても、1プロセスの場合と同じ内容が取り込まれること"""
+        total_1, rows_1 = self.import_with(workers=1)
+        total_3, rows_3 = self.import_with(workers=3)
+        self.assertEqual(total_1, 120 * len(self.months))
+        self.assertEqual(total_3, total_1)
+        self.assertEqual(rows_3, rows_1)
+
+    def test_single_writer_in_timestamp_order(self):
+        """書き込みはファイル (月) の時刻順に、各ファイル内も時刻順で行われること"""
+        written = []
+
+        def fake_insert(df, engine, **kwargs):
+            self.assertTrue(df['timestamp'].is_monotonic_increasing)
+            written.append(df['timestamp'].iloc[0].strftime("%Y-%m"))
+            return len(df)
+
+        engine = create_engine(f"sqlite:///{os.path.join(self.tmp.name, 'order.db')}")
+        with mock.patch.object(unified_importer, "insert_to_db", side_effect=fake_insert):
+            unified_importer.process_files(self.tmp.name, engine, None, workers=2)
+        engine.dispose()
+        self.assertEqual(written, sorted(self.months))
+
+    def test_parse_error_does_not_stop_other_files(self):
+        """1ファイルの解析に失敗しても、他のファイルは取り込まれること"""
+        original = unified_importer.parse_monthly_file
+
+        def flaky(filepath, *args):
+            if "2025-01" in filepath:
+                raise IOError("読み込み失敗")
+            return original(filepath, *args)
+
+        with mock.patch.object(unified_importer, "parse_monthly_file", side_effect=flaky):
+            total, rows = self.import_with(workers=1)
+        self.assertEqual(total, 120 * (len(self.months) - 1))
+
+    def test_cached_months_give_same_rows(self):
+        """month_cache を使っても同じ内容が取り込まれ、ファイル全体の解析結果がキャッシュされること"""
+        import month_cache
+        total_1, rows_1 = self.import_with(workers=1)
+        cache_dir = os.path.join(self.tmp.name, "cache")
+        engine = create_engine(f"sqlite:///{os.path.join(self.tmp.name, 'cached.db')}")
+        with engine.begin() as connection:
+            connection.execute(text(
+                "CREATE TABLE sensor_data (timestamp DATETIME PRIMARY KEY, temperature FLOAT, humidity FLOAT)"))
+        with mock.patch.object(month_cache, "DEFAULT_CACHE_DIR", cache_dir):
+            self.assertEqual(unified_importer.process_files(self.tmp.name, engine, None, use_cache=True), total_1)
+        with engine.connect() as connection:
+            rows = connection.execute(text("SELECT * FROM sensor_data ORDER BY timestamp")).fetchall()
+        engine.dispose()
+        self.assertEqual(rows, rows_1)
+        self.assertEqual(len(os.listdir(cache_dir)), len(self.months))
+
+
+class TestStreamingImport(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_seconds(self, name, count):
+        import pandas as pd
+        times = pd.date_range("2025-01-01", periods=count, freq="s").strftime("%Y-%m-%d %H:%M:%S")
+        path = os.path.join(self.tmp.name, f"temp_humid_{name}.txt")
+        with open(path, "w") as f:
+            f.write("\n".join(times + ",tmp=25.3,hum=61.2") + "\n")
+        return path
+
+    def test_chunks_are_inserted_and_checkpointed_in_order(self):
+        """チャンクごとに挿入とチェックポイント記録が行われ、失敗したチャンク以降は次回に回されること"""
+        path = write_month(self.tmp.name, "2025-08", 1000)
+        engine = create_engine(f"sqlite:///{os.path.join(self.tmp.name, 'state.db')}")
+        batches = []
+
+        def fake_insert(df, engine, **kwargs):
+            if len(batches) == 3:
+                raise RuntimeError("DB down")
+            batches.append(len(df))
+            return len(df)
+
+        with mock.patch.object(unified_importer, "insert_to_db", side_effect=fake_insert):
+            unified_importer.process_files(path, engine, None, chunksize=100)
+        # --chunksize 100 (行の目安) ごとに挿入され、4チャンク目で失敗している
+        self.assertEqual(len(batches), 3)
+        self.assertTrue(all(50 <= size <= 200 for size in batches))
+
+        # 3チャンク分だけチェックポイントが進んでおり、次回は残りだけを取り込む
+        import import_state
+        offset = import_state.load_state(engine, path)["byte_offset"]
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(offset).count(b"\n"), sum(batches))
+        remaining = []
+        with mock.patch.object(unified_importer, "insert_to_db",
+                               side_effect=lambda df, engine, **kwargs: remaining.append(len(df)) or len(df)):
+            unified_importer.process_files(path, engine, None, chunksize=100)
+        self.assertEqual(sum(remaining), 1000 - sum(batches))
+        engine.dispose()
+
+    def test_watch_ingests_appended_rows(self):
+        """監視モードで、追記された行が数秒以内に取り込まれること"""
+        import threading
+        import time
+        path = write_month(self.tmp.name, "2025-08", 100)
+        engine = create_engine(f"sqlite:///{os.path.join(self.tmp.name, 'watch.db')}")
+        with engine.begin() as connection:
+            connection.execute(text(
+                "CREATE TABLE sensor_data (timestamp DATETIME PRIMARY KEY, temperature FLOAT, humidity FLOAT)"))
+
+        def count():
+            with engine.connect() as connection:
+                return connection.execute(text("SELECT COUNT(*) FROM sensor_data")).scalar()
+
+        def wait_for(rows):
+            deadline = time.monotonic() + 10
+            while count() < rows and time.monotonic() < deadline:
+                time.sleep(0.05)
+            return count()
+
+        stop = threading.Event()
+        reads = []
+        original = unified_importer.parse_monthly_file
+
+        def recording(filepath, offset=0, end=None, *args):
+            reads.append((offset, end))
+            return original(filepath, offset, end, *args)
+
+        with mock.patch.object(unified_importer, "parse_monthly_file", side_effect=recording):
+            watcher = threading.Thread(target=unified_importer.watch_directory,
+                                       args=(self.tmp.name, engine), kwargs={'stop': stop, 'poll_interval': 0.1})
+            watcher.start()
+            try:
+                self.assertEqual(wait_for(100), 100)
+                size = os.path.getsize(path)
+                with open(path, "a") as f:
+                    f.write("2025-08-02 00:00:00,tmp=25.5,hum=60.0\n2025-08-02 00:10:00,tmp=25.6,hum=60.0\n")
+                started = time.monotonic()
+                self.assertEqual(wait_for(102), 102)
+                self.assertLess(time.monotonic() - started, 5)
+            finally:
+                stop.set()
+                watcher.join(timeout=10)
+        # 2回目は追記されたバイトだけを読んでいる
+        self.assertEqual(reads[-1][0], size)
+        engine.dispose()
+
+    def test_pipelined_download_and_import(self):
+        """ダウンロード中のファイルを待たず、届いたファイルから解析・挿入が始まること"""
+        import incremental_download
+        remote = os.path.join(self.tmp.name, "remote")
+        local = os.path.join(self.tmp.name, "local")
+        os.makedirs(remote)
+        months = ["2025-06", "2025-07", "2025-08"]
+        for month in months:
+            write_month(remote, month, 600)
+        size = os.path.getsize(os.path.join(remote, "temp_humid_2025-08.txt"))
+        engine = create_engine(f"sqlite:///{os.path.join(self.tmp.name, 'pipeline.db')}")
+        landed_at_first_insert = []
+        original = unified_importer.insert_to_db
+
+        def recording(df, engine, **kwargs):
+            if not landed_at_first_insert:
+                landed_at_first_insert.append(len(incremental_download.list_remote(local)))
+            return original(df, engine, **kwargs)
+
+        # 1ファイルずつ約0.5秒かけて届く、遅いリモートの代わり
+        paths = unified_importer._background_iter(
+            unified_importer._iter_downloaded(remote, local, workers=1, bwlimit=size * 2))
+        with mock.patch.object(unified_importer, "insert_to_db", side_effect=recording):
+            total = unified_importer.process_files(paths, engine, None, workers=2)
+        engine.dispose()
+        self.assertEqual(total, 600 * len(months))
+        self.assertLess(landed_at_first_insert[0], len(months))
+
+    def test_peak_rss_is_flat(self):
+        """ストリーミング時のピークRSSの増分が、ファイルサイズを4倍にしてもほぼ変わらないこと"""
+        max_memory_mb = 16
+        deltas = []
+        for name, count in (("small", 150000), ("large", 600000)):
+            path = self.write_seconds(name, count)
+            output = subprocess.run([sys.executable, "-c", RSS_PROBE, ROOT, path, str(max_memory_mb)],
+                                    capture_output=True, text=True, check=True).stdout.split()
+            self.assertEqual(int(output[0]), count)
+            deltas.append(float(output[1]))
+        small, large = deltas
+        self.assertLess(large - small, 8, f"ピークRSS増分: {small:.1f}MB -> {large:.1f}MB")
+        self.assertLess(large, max_memory_mb * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import time
+import tempfile
+
+# プロジェクトルートをパスに追加（CIでimport可能にする）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import upload_fanout
+from upload_fanout import enqueue, drain_all, load_queue, build_rclone_copy_cmd, parse_bwlimit
+
+
+class TestUploadFanout(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        root = self.tmpdir.name
+        self.queue_dir = os.path.join(root, "queue")
+        self.src_dir = os.path.join(root, "src")
+        os.makedirs(self.src_dir)
+        self.latest = os.path.join(self.src_dir, "latest_temp_humid.txt")
+        with open(self.latest, "w") as f:
+            f.write("2025-12-30 00:00:00,tmp=20.0,hum=50.0\n")
+        self.nas1 = {"name": "nas1", "type": "local", "target": os.path.join(root, "nas1")}
+        self.nas2 = {"name": "nas2", "type": "local", "target": os.path.join(root, "nas2")}
+        # 宛先ディレクトリの位置に通常ファイルを置き、必ず失敗する宛先を作る
+        broken_target = os.path.join(root, "broken")
+        open(broken_target, "w").close()
+        self.broken = {"name": "broken", "type": "local", "target": broken_target}
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_fan_out_to_all_local_destinations(self):
+        """全宛先へコピーされ、キューが空になる"""
+        dests = [self.nas1, self.nas2]
+        enqueue(self.queue_dir, dests, self.latest)
+        results = drain_all(self.queue_dir, dests, time_budget=10)
+        self.assertEqual(results, {"nas1": (1, 0), "nas2": (1, 0)})
+        for d in dests:
+            with open(os.path.join(d["target"], "latest_temp_humid.txt")) as f:
+                self.assertIn("tmp=20.0", f.read())
+
+    def test_failing_destination_does_not_block_others_and_keeps_retry_state(self):
+        """失敗する宛先があっても他は送信され、失敗側はバックオフ付きで残る"""
+        dests = [self.broken, self.nas1]
+        enqueue(self.queue_dir, dests, self.latest)
+        results = drain_all(self.queue_dir, dests, time_budget=10)
+        self.assertEqual(results["nas1"], (1, 0))
+        self.assertEqual(results["broken"], (0, 1))
+        item = load_queue(self.queue_dir, self.broken)[0]
+        self.assertEqual(item["attempts"], 1)
+        self.assertGreater(item["next_attempt_at"], time.time())
+
+        # バックオフ中は再送しない（試行回数が増えない）
+        drain_all(self.queue_dir, dests, time_budget=10)
+        self.assertEqual(load_queue(self.queue_dir, self.broken)[0]["attempts"], 1)
+
+    def test_slow_destination_is_cut_off_by_time_budget(self):
+        """帯域制限で遅い宛先は時間予算で打ち切られ、速い宛先は完了する"""
+        big = os.path.join(self.src_dir, "temp_humid_2025-12.txt")
+        with open(big, "wb") as f:
+            f.write(b"x" * 200 * 1024)
+        slow = dict(self.nas2, bwlimit="20k")
+        dests = [self.nas1, slow]
+        enqueue(self.queue_dir, dests, self.src_dir, is_file=False)
+        started = time.monotonic()
+        results = drain_all(self.queue_dir, dests, time_budget=3)
+        self.assertLess(time.monotonic() - started, 8)
+        self.assertEqual(results["nas1"], (1, 0))
+        # 期限でコピーを中断して終わる: 書きかけは残さず、再送状態も変えずにキューに残す
+        self.assertEqual(results["nas2"], (0, 1))
+        self.assertEqual(load_queue(self.queue_dir, slow)[0]["attempts"], 0)
+        self.assertFalse([n for n in os.listdir(slow["target"]) if n.endswith(".tmp")])
+
+    def test_enqueue_coalesces_same_source(self):
+        """同じソースの未送信項目は1件にまとめる"""
+        for _ in range(5):
+            enqueue(self.queue_dir, [self.broken], self.latest)
+        self.assertEqual(len(load_queue(self.queue_dir, self.broken)), 1)
+
+    def test_overlapping_run_does_not_drain_or_lose_entries(self):
+        """送信中に重なって起動しても送信は1プロセスだけが行い、送信中に追加された項目は失われない"""
+        enqueue(self.queue_dir, [self.nas1], self.latest)
+        held = upload_fanout._try_drain_lock(self.queue_dir)
+        try:
+            self.assertEqual(drain_all(self.queue_dir, [self.nas1], time_budget=10), {})
+        finally:
+            held.close()
+        self.assertEqual(len(load_queue(self.queue_dir, self.nas1)), 1)
+
+        other = os.path.join(self.src_dir, "temp_humid_2025-12.txt")
+        with open(other, "w") as f:
+            f.write("2025-12-30 00:00:00,tmp=20.0,hum=50.0\n")
+        original = upload_fanout.upload_item
+
+        def enqueue_while_sending(destination, item, **kwargs):
+            # 送信中に別の起動が、送信中のソースと新しいソースを追加する
+            enqueue(self.queue_dir, [self.nas1], self.latest)
+            enqueue(self.queue_dir, [self.nas1], other)
+            return original(destination, item, **kwargs)
+
+        with patch.object(upload_fanout, "upload_item", side_effect=enqueue_while_sending):
+            self.assertEqual(drain_all(self.queue_dir, [self.nas1], time_budget=10)["nas1"], (1, 2))
+        self.assertEqual(sorted(item["source"] for item in load_queue(self.queue_dir, self.nas1)),
+                         sorted([self.latest, other]))
+
+    def test_rclone_destination_uses_copy_with_its_own_bwlimit(self):
+        """rclone宛先は宛先ごとの帯域制限付きの copy で送る（教訓: INC-001）"""
+        gdrive = {"name": "gdrive", "type": "rclone", "target": "raspi_data:/sensor_data/", "bwlimit": "200k"}
+        enqueue(self.queue_dir, [gdrive], self.latest)
+        with patch("upload_fanout.subprocess.run") as mock_run:
+            results = drain_all(self.queue_dir, [gdrive], time_budget=10)
+        cmd = mock_run.call_args[0][0]
+        self.assertEqual(cmd[:2], ["rclone", "copy"])
+        self.assertNotIn("sync", cmd)
+        self.assertEqual(cmd[cmd.index("--bwlimit") + 1], "200k")
+        self.assertEqual(results["gdrive"], (1, 0))
+        self.assertEqual(build_rclone_copy_cmd("a", "b", bwlimit=None), ["rclone", "copy", "a", "b", "--checksum", "--no-traverse"])
+
+
+    def test_parse_bwlimit(self):
+        """rclone の --bwlimit 形式を bytes/sec に変換する (block_verify のスクラブ帯域と共通)"""
+        self.assertEqual(parse_bwlimit("200k"), 200 * 1024)
+        self.assertEqual(parse_bwlimit("1M"), 1024 * 1024)
+        self.assertEqual(parse_bwlimit("512"), 512)
+        self.assertIsNone(parse_bwlimit(None))
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
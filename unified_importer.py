@@ -3,10 +3,29 @@ import logging
 import os
 import glob
 import subprocess
+import threading
+import time
+import queue
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from datetime import datetime
 
+import bulk_loader
+import devices
+import file_watcher
+import import_state
+import import_stats
+import incremental_download
+import month_cache
+import monthly_index
+import monthly_parser
+import rollups
+import row_filter
+import storage
+
 # ログ設定（ファイル出力、コンソール両対応）
 LOG_DIR = os.path.expanduser('~/logs')  # デフォルトログディレクトリ
 os.makedirs(LOG_DIR, exist_ok=True)
@@ -24,19 +43,13 @@ logger = logging.getLogger(__name__)
 
 def get_config():
     """設定情報を環境変数から一元取得（config.py相当）"""
-    password = os.environ.get('DB_PASSWORD')
-    if not password:
+    if not os.environ.get('DB_PASSWORD') and storage.backend_from_env() == 'mysql':
         logger.warning("環境変数 'DB_PASSWORD' が設定されていません。")
     return {
         'rclone_remote': os.environ.get('RCLONE_REMOTE', 'raspi_data'),
         'gdrive_sensor_dir': os.environ.get('GDRIVE_SENSOR_DIR', 'sensor_data/'),
         'local_download_dir': os.environ.get('LOCAL_DOWNLOAD_DIR', os.path.expanduser('~/sensor_data_downloads/')),
-        'db': {
-            'host': os.environ.get('DB_HOST', 'localhost'),
-            'user': os.environ.get('DB_USER', 'root'),
-            'password': password,
-            'database': os.environ.get('DB_NAME', 'sensor_data_db')
-        }
+        'db': storage.db_config_from_env(),
     }
 
 def check_rclone_config(remote):
@@ -51,30 +64,57 @@ def check_rclone_config(remote):
         logger.error("rcloneが未インストール。`brew install rclone`などでインストールしてください。")
         return False
 
-def download_from_gdrive(config):
-    """Google Driveから同期ダウンロード（オプション）"""
-    logger.info(f"Google Driveからダウンロード: {config['rclone_remote']}:{config['gdrive_sensor_dir']} -> {config['local_download_dir']}")
-    print("\nGoogle Driveからダウンロード中...")
+def download_from_gdrive(config, workers=incremental_download.DEFAULT_WORKERS):
+    """
+    Google Driveから差分ダウンロード（オプション）。
+    ダウンロードが終わったファイルから順にパスを返すイテレータを返す（rclone未設定なら None）。
+    """
+    remote = f"{config['rclone_remote']}:{config['gdrive_sensor_dir']}"
+    logger.info(f"Google Driveから差分ダウンロード: {remote} -> {config['local_download_dir']}")
+    print("\nGoogle Driveから差分ダウンロード中...")
     os.makedirs(config['local_download_dir'], exist_ok=True)
     
     if not check_rclone_config(config['rclone_remote']):
-        return False
-    
+        return None
+    # 一覧とダウンロードをすぐに始め、DB接続やチェックポイントの確認と重ねる
+    return _background_iter(_iter_downloaded(remote, config['local_download_dir'], workers))
+
+def _iter_downloaded(remote, local_dir, workers, bwlimit=None):
+    counts = {"skip": 0, "append": 0, "full": 0}
     try:
-        subprocess.run([
-            'rclone', 'sync', '-v', '--progress',
-            f"{config['rclone_remote']}:{config['gdrive_sensor_dir']}", config['local_download_dir']
-        ], check=True)
-        logger.info("ファイル同期完了。")
-        print("ダウンロード完了！")
-        return True
+        for path, action in incremental_download.download_iter(remote, local_dir, workers, bwlimit=bwlimit):
+            counts[action] += 1
+            yield path
     except subprocess.CalledProcessError as e:
         logger.error(f"ダウンロード失敗: {e}")
         print(f"エラー: ダウンロード失敗: {e}")
-        return False
+        return
+    logger.info(f"ファイル同期完了。変化なし {counts['skip']}件, 追記分のみ {counts['append']}件, 全体 {counts['full']}件")
+    print("ダウンロード完了！")
+
+def get_last_timestamps(engine):
+    """DBからデバイスごとの最新タイムスタンプ取得 ({デバイスID: 最新時刻})"""
+    last_timestamps = {}
+    try:
+        devices.ensure_schema(engine)
+        with engine.connect() as connection:
+            query = text("SELECT device_id, MAX(timestamp) FROM sensor_data GROUP BY device_id")
+            for device, latest in connection.execute(query):
+                last_timestamps[device] = pd.to_datetime(latest)
+            logger.info(f"データベース内のデバイス別の最新時刻: "
+                        + (", ".join(f"{d}={t}" for d, t in sorted(last_timestamps.items())) or "なし"))
+    except Exception as e:
+        logger.error(f"MySQLエラー: {e}")
+    return last_timestamps
+
+def watermark_for(last_timestamp, device):
+    """last_timestamp がデバイス別の dict ならそのデバイスの最新時刻、それ以外は全デバイス共通の値"""
+    if isinstance(last_timestamp, dict):
+        return last_timestamp.get(device)
+    return last_timestamp
 
 def get_last_timestamp(engine):
-    """DBから最新タイムスタンプ取得"""
+    """DBから最新タイムスタンプ取得 (全デバイス共通)"""
     last_timestamp = None
     try:
         with engine.connect() as connection:
@@ -87,8 +127,55 @@ def get_last_timestamp(engine):
         logger.error(f"MySQLエラー: {e}")
     return last_timestamp
 
+# 解析の並列度の既定値と、1プロセスあたりの先読みファイル数
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+PARSE_PREFETCH_PER_WORKER = 2
+
+# --chunksize (行数) を読み込み単位 (bytes) に換算する際の1行あたりの目安
+APPROX_LINE_BYTES = 48
+
+# ストリーミング時、入力1byteあたりに必要な作業メモリの目安 (解析中の配列 + DataFrame + 挿入バッチ)
+STREAM_MEMORY_FACTOR = 16
+
+# チャンク境界を行境界に合わせるときに読む範囲 (1行の最大長より十分大きい)
+BOUNDARY_SCAN_BYTES = 4096
+
+def filter_valid_range(df):
+    """範囲チェック: 異常値除去（温度 0〜50℃、湿度 0〜100%）"""
+    df = df.assign(temperature=df['temperature'].round(2), humidity=df['humidity'].round(2))
+    return df[
+        (df['temperature'].between(0, 50)) &
+        (df['humidity'].between(0, 100))
+    ]
+
+def parse_monthly_file(filepath, offset=0, end=None, use_cache=False):
+    """
+    月次ファイルの [offset, end) を monthly_parser で解析し、範囲チェック済みの DataFrame を返す。
+    use_cache はファイル全体を読む場合だけ指定する (month_cache の解析済みデータを使う/保存する)
+    """
+    t0, c0 = time.perf_counter(), time.process_time()
+    if use_cache:
+        result = month_cache.load_month(filepath)
+    else:
+        result = monthly_parser.parse_file(filepath, offset, end)
+    t1, c1 = time.perf_counter(), time.process_time()
+    if result.rejected:
+        logger.warning(f"ファイル '{filepath}' の不正な行 {result.rejected} 行を除外しました。")
+    df = filter_valid_range(monthly_parser.to_dataframe(result))
+    logger.debug(f"前処理後: {len(df)}行")
+    # 段階別の計測値 (import_stats)。解析ワーカーのプロセス内で測った値を結果と一緒に返す
+    valid = len(result.timestamp)
+    df.attrs['stats'] = {
+        'parse': {'wall': t1 - t0, 'cpu': c1 - c0, 'rows_in': valid + result.rejected, 'rows_out': valid,
+                  'rejected': result.rejected,
+                  'bytes': result.consumed if use_cache else (end if end is not None else result.consumed) - offset},
+        'validate': {'wall': time.perf_counter() - t1, 'cpu': time.process_time() - c1,
+                     'rows_in': valid, 'rows_out': len(df), 'rejected': valid - len(df)},
+    }
+    return df
+
 def preprocess_data(df_raw, chunksize=None):
-    """データ前処理（共通関数: フィルタ、抽出、範囲チェック）"""
+    """データ前処理（旧パス: read_csv の結果に対するフィルタ、抽出、範囲チェック。ベンチマーク比較用）"""
     if chunksize:
         # チャンク処理モード（大容量ファイル用）
         processed_chunks = []
@@ -114,13 +201,7 @@ def _preprocess_single_chunk(chunk):
         chunk_copy['temperature'] = chunk_copy['temperature_str'].str.split('=').str[1].astype(float).round(2)
         chunk_copy['humidity'] = chunk_copy['humidity_str'].str.split('=').str[1].astype(float).round(2)
         
-        chunk_copy = chunk_copy[['timestamp', 'temperature', 'humidity']].dropna()
-        
-        # 範囲チェック: 異常値除去
-        chunk_copy = chunk_copy[
-            (chunk_copy['temperature'].between(0, 50)) &
-            (chunk_copy['humidity'].between(0, 100))
-        ]
+        chunk_copy = filter_valid_range(chunk_copy[['timestamp', 'temperature', 'humidity']].dropna())
         
         logger.debug(f"前処理後: {len(chunk_copy)}行")
         return chunk_copy
@@ -128,142 +209,655 @@ def _preprocess_single_chunk(chunk):
         logger.error(f"前処理エラー: {e}")
         return pd.DataFrame()
 
-def insert_to_db(df, engine):
-    """DB挿入（UPSERT） - SQLAlchemy 2.0 スタイル"""
+def insert_to_db(df, engine, batch_size=bulk_loader.DEFAULT_BATCH_SIZE, use_infile=True,
+                 stats=None, filepath=None, device=devices.DEFAULT_DEVICE):
+    """
+    DB挿入（UPSERT） - bulk_loader で device の行としてバッチごとにコミットし、触れた時間帯の集計テーブルを更新。
+    stats (import_stats) を渡すと、挿入と集計更新の時間を filepath の分として記録する。
+    """
     if df.empty:
         return 0
     
-    inserted_count = 0
     try:
-        data_dicts = df.to_dict(orient='records')
-        
-        with engine.connect() as connection:
-            insert_query = text("""
-            INSERT INTO sensor_data (timestamp, temperature, humidity)
-            VALUES (:timestamp, :temperature, :humidity)
-            ON DUPLICATE KEY UPDATE
-                temperature = VALUES(temperature),
-                humidity = VALUES(humidity);
-            """)
-            result = connection.execute(insert_query, data_dicts)
-            connection.commit()
-            inserted_count = result.rowcount
-            logger.info(f"{inserted_count} 行を挿入/更新しました。")
-            print(f"    {inserted_count} 行を挿入/更新しました。")
+        with import_stats.timed(stats, 'insert', filepath) as values:
+            loaded = bulk_loader.bulk_load(engine, df, batch_size=batch_size, use_infile=use_infile, device=device)
+            values.update(rows_in=len(df), rows_out=loaded.rows)
+        with import_stats.timed(stats, 'rollups', filepath) as values:
+            rollups.update_for_timestamps(engine, df['timestamp'], device)
+            values.update(rows_in=len(df), rows_out=len(df))
+        print(f"    {loaded.rows} 行を挿入/更新しました。({loaded.rows / max(loaded.seconds, 1e-9):,.0f}行/秒)")
     except Exception as e:
         logger.error(f"DB挿入エラー: {e}")
+        # 呼び出し側でチェックポイントを進めないよう、失敗は伝える
+        raise
     
-    return inserted_count
+    return loaded.rows
 
-def process_files(filepaths, engine, last_timestamp, chunksize=None):
-    """ファイル/ディレクトリ処理（複数/単一対応）"""
-    if isinstance(filepaths, str) and os.path.isdir(filepaths):
-        filepaths = glob.glob(os.path.join(filepaths, 'temp_humid_*.txt'))
-    
-    if not isinstance(filepaths, list):
-        filepaths = [filepaths]
-    
-    total_files = 0
-    total_inserted = 0
-    
+def _plan_file(filepath, engine, last_timestamp, late_data=False, root=None):
+    """
+    チェックポイントから取り込み範囲を決める。読む必要がなければ None
+    (late_data なら late モード用のチェックポイントを使う)。
+    デバイスはファイルのヘッダーか root 直下のサブフォルダ名から決め、チェックポイントと
+    ウォーターマークはそのデバイスのものを使う
+    """
+    device = devices.device_for(filepath, root)
+    last_timestamp = watermark_for(last_timestamp, device)
+    # 取り込み位置のチェックポイント: 変化のないファイルは開かずにスキップし、続きのバイトだけを読む
+    state = import_state.load_state(engine, filepath, device, late=late_data)
+    action, offset, hasher, st = import_state.plan(filepath, state)
+    if action == "skip":
+        logger.info(f"ファイル '{filepath}' は前回の取り込みから変化がありません。スキップします。")
+        return None
+    with open(filepath, 'rb') as f:
+        end = import_state.importable_length(f, st)
+    job = {'filepath': filepath, 'device': device, 'offset': offset, 'hash_pos': offset, 'end': end,
+           'hasher': hasher, 'stat': st, 'watermark': None, 'failed': False, 'late': late_data}
+
+    if action == "full":
+        logger.warning(f"ファイル '{filepath}' の取り込み済み範囲が変更されています。先頭から取り込み直します。")
+    elif action == "new":
+        # チェックポイント未記録のファイルは、従来どおりDBの最新時刻と索引で絞り込む
+        job['watermark'] = last_timestamp
+        index = monthly_index.load_index(filepath) if last_timestamp is not None else None
+        if index is not None and not monthly_index.has_data_after(index, last_timestamp):
+            logger.info(f"索引上、ファイル '{filepath}' に新しいデータがありません。読み込まずにスキップします。")
+            import_state.checkpoint(engine, filepath, hasher, offset, end, st, device=device, late=late_data)
+            return None
+        job['offset'] = monthly_index.seek_offset_for(index, last_timestamp) if index is not None else 0
+    return job
+
+def _iter_jobs(filepaths, engine, last_timestamp, late_data=False, stats=None, root=None):
+    """ファイルを1つずつ計画する (イテレータで渡されたファイルは届いた時点で計画する)"""
     for filepath in filepaths:
         if not os.path.exists(filepath):
             logger.warning(f"ファイルが存在しません: {filepath}")
             continue
-        
-        logger.info(f"ファイルを処理中: {filepath}")
-        print(f"  ファイルを処理中: '{filepath}'...")
-        
         try:
-            if chunksize:
-                df_raw_chunks = pd.read_csv(
-                    filepath, names=['datetime_str', 'temperature_str', 'humidity_str'],
-                    chunksize=chunksize, na_filter=False, skip_blank_lines=True
-                )
-                df = preprocess_data(df_raw_chunks, chunksize=chunksize)
-            else:
-                df_raw = pd.read_csv(
-                    filepath, header=None, names=['datetime_str', 'temperature_str', 'humidity_str'],
-                    na_filter=False, skip_blank_lines=True
-                )
-                df = preprocess_data(df_raw)
-
-            if df.empty:
-                logger.info(f"ファイル '{filepath}' に処理可能なデータがありません。")
-                continue
+            with import_stats.timed(stats, 'plan', filepath):
+                job = _plan_file(filepath, engine, last_timestamp, late_data, root)
+        except Exception as e:
+            logger.error(f"ファイル処理中にエラーが発生しました '{filepath}': {e}")
+            print(f"  エラー: 処理に失敗しました: {e}")
+            continue
+        if job is not None:
+            yield job
+
+def _split_ranges(filepath, start, stop, chunk_bytes):
+    """[start, stop) を約 chunk_bytes ごとの行境界で区切った範囲のリストを返す"""
+    if not chunk_bytes:
+        return [(start, stop)]
+    ranges = []
+    with open(filepath, 'rb') as f:
+        while stop - start > chunk_bytes:
+            f.seek(start + chunk_bytes)
+            newline = f.read(BOUNDARY_SCAN_BYTES).find(b'\n')
+            if newline < 0:
+                break
+            boundary = start + chunk_bytes + newline + 1
+            if boundary >= stop:
+                break
+            ranges.append((start, boundary))
+            start = boundary
+    ranges.append((start, stop))
+    return ranges
+
+def _iter_pieces(jobs, chunk_bytes, use_cache=False):
+    """ファイルごとのジョブを、解析・挿入・チェックポイントの単位 (piece) に分ける"""
+    for job in jobs:
+        # 書き込み途中の最終行 (importable_length より後ろ) は解析も挿入もせず、次回チェックポイントから読み直す
+        ranges = _split_ranges(job['filepath'], job['offset'], max(job['end'], job['offset']), chunk_bytes)
+        for i, (start, stop) in enumerate(ranges):
+            last = i == len(ranges) - 1
+            yield {'job': job, 'start': start, 'stop': stop, 'checkpoint': stop,
+                   'first': i == 0, 'last': last,
+                   'cache': use_cache and start == 0 and stop == job['stat'].st_size}
+
+def _submit_parse(pool, piece):
+    """解析を投入する。pool が None なら同じプロセスで解析し、完了済みの Future を返す"""
+    args = (piece['job']['filepath'], piece['start'], piece['stop'], piece['cache'])
+    if pool is not None:
+        return pool.submit(parse_monthly_file, *args)
+    future = Future()
+    try:
+        future.set_result(parse_monthly_file(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
 
-            if last_timestamp:
-                df = df[df['timestamp'] > last_timestamp]
+# バックグラウンドのスレッドが回すイテレータの終わりの印
+_END = object()
 
-            if df.empty:
-                logger.info(f"ファイル '{filepath}' に新しいデータがありません。スキップします。")
+def _start_feeder(iterable, maxsize=0):
+    """
+    iterable を別スレッドで回し、(要素, None) を順にキューに入れる。最後は (_END, 例外 or None)。
+    戻り値: (キュー, 停止用の Event)。取り出し側がやめるときは Event をセットする
+    """
+    items = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(value):
+        while not stop.is_set():
+            try:
+                items.put(value, timeout=0.1)
+                return True
+            except queue.Full:
                 continue
-            
-            inserted = insert_to_db(df, engine)
+        return False
+
+    def feed():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except Exception as e:
+            put((_END, e))
+            return
+        put((_END, None))
+
+    threading.Thread(target=feed, daemon=True, name='feeder').start()
+    return items, stop
+
+def _iter_background(items, stop):
+    try:
+        while True:
+            item, error = items.get()
+            if item is _END:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+def _background_iter(iterable, maxsize=0):
+    """iterable をすぐに別スレッドで回し始め、届いた要素から返すイテレータ (例外は取り出し側で送出する)"""
+    return _iter_background(*_start_feeder(iterable, maxsize))
+
+def _iter_parsed(pieces, workers):
+    """
+    piece をプロセスプールで解析し、投入順 (= ファイル名の時刻順) に (piece, Future) を返す。
+    先読みは workers * PARSE_PREFETCH_PER_WORKER 件までに抑え、解析済みデータでメモリが膨らまないようにする。
+    piece の計画 (ダウンロード完了待ちを含む) は別スレッドで進め、解析待ちが空のときだけ次の piece を待つため、
+    まだ届いていないファイルを待って解析済みの piece の書き込みが止まることはない。
+    workers が1なら先読みせず、取り出すたびにこのプロセスで解析する。
+    """
+    if workers <= 1:
+        for piece in pieces:
+            yield piece, _submit_parse(None, piece)
+        return
+    limit = workers * PARSE_PREFETCH_PER_WORKER
+    pool = ProcessPoolExecutor(max_workers=workers)
+    items, stop = _start_feeder(pieces, limit)
+    pending = deque()
+    exhausted = False
+    error = None
+    try:
+        while True:
+            while not exhausted and len(pending) < limit:
+                try:
+                    piece, error = items.get(block=not pending)
+                except queue.Empty:
+                    break
+                if piece is _END:
+                    exhausted = True
+                else:
+                    pending.append((piece, _submit_parse(pool, piece)))
+            if not pending:
+                break
+            yield pending.popleft()
+        # 計画側の失敗は、それまでに計画できた piece を書き込んでから伝える
+        if error is not None:
+            raise error
+    finally:
+        stop.set()
+        pool.shutdown(cancel_futures=True)
+
+def _write_parsed(piece, df, engine, batch_size, use_infile, filters=None, stats=None):
+    """
+    唯一の書き込み役: 解析結果を時刻順に挿入し、コミット後にチェックポイントを進める。
+    filters (row_filter の月別フィルタ) を渡すと、取り込み済みで値も同じ行は挿入せずに読み飛ばす。
+    """
+    job = piece['job']
+    filepath = job['filepath']
+    device = job.get('device', devices.DEFAULT_DEVICE)
+    for stage, values in df.attrs.pop('stats', {}).items():
+        import_stats.add(stats, stage, filepath, **values)
+
+    with import_stats.timed(stats, 'filter', filepath) as values:
+        values['rows_in'] = len(df)
+        if job['watermark'] is not None and not df.empty:
+            df = df[df['timestamp'] > job['watermark']]
+        if filters is not None and not df.empty:
+            parsed_rows = len(df)
+            df = row_filter.select_new(engine, filters, df, device)
+            if len(df) < parsed_rows:
+                logger.info(f"取り込み済みの行 {parsed_rows - len(df)} 行を読み飛ばしました。")
+        values['rows_out'] = len(df)
+
+    inserted = 0
+    if not df.empty:
+        df = df.sort_values('timestamp', kind='stable')
+        inserted = insert_to_db(df, engine, batch_size=batch_size, use_infile=use_infile,
+                                stats=stats, filepath=filepath, device=device)
+        if filters is not None:
+            with import_stats.timed(stats, 'filter', filepath):
+                row_filter.record(engine, filters, df, device)
+    elif piece['last'] and piece['first']:
+        logger.info(f"ファイル '{filepath}' に新しいデータがありません。")
+
+    # 挿入のコミット後にのみチェックポイントを進める (書き込み途中の最終行は次回読み直す)
+    if piece['checkpoint'] > job['hash_pos']:
+        with import_stats.timed(stats, 'checkpoint', filepath) as values:
+            import_state.checkpoint(engine, filepath, job['hasher'], job['hash_pos'],
+                                    piece['checkpoint'], job['stat'], device=device, late=job.get('late', False))
+            values['bytes'] = piece['checkpoint'] - job['hash_pos']
+        job['hash_pos'] = piece['checkpoint']
+    return inserted
+
+def stream_chunk_bytes(chunksize=None, max_memory_mb=None, workers=1):
+    """
+    ストリーミング時の1回の読み込み単位 (bytes)。None なら1ファイルを一括で扱う。
+    max_memory_mb は、同時に保持し得る piece 数 (先読み分 + 書き込み中) で割って配分する。
+    """
+    limits = []
+    if chunksize:
+        limits.append(chunksize * APPROX_LINE_BYTES)
+    if max_memory_mb:
+        in_flight = 1 if workers <= 1 else workers * PARSE_PREFETCH_PER_WORKER + 1
+        limits.append(max_memory_mb * 1024 * 1024 // (STREAM_MEMORY_FACTOR * in_flight))
+    return max(BOUNDARY_SCAN_BYTES, min(limits)) if limits else None
+
+def _import_stream(filepaths, engine, last_timestamp, chunk_bytes, batch_size, use_infile, workers,
+                   use_cache, filters, late_data, stats, root):
+    """
+    ファイルを計画・解析・書き込みする本体。解析は workers 個のプロセスで並列に行い、
+    書き込みはこのスレッドだけが投入順に行う。戻り値: (挿入/更新行数, 挿入のあったファイルの集合)
+    """
+    total_inserted = 0
+    imported_files = set()
+    jobs = _iter_jobs(filepaths, engine, last_timestamp, late_data=late_data, stats=stats, root=root)
+    for piece, future in _iter_parsed(_iter_pieces(jobs, chunk_bytes, use_cache), workers):
+        job = piece['job']
+        filepath = job['filepath']
+        if job['failed']:
+            # 失敗したチャンク以降はチェックポイントが連続しないため、次回の実行に回す
+            continue
+        if piece['first']:
+            logger.info(f"ファイルを処理中: {filepath}" + (f" ({job['offset']}byte 目から)" if job['offset'] else ""))
+            print(f"  ファイルを処理中: '{filepath}'...")
+        try:
+            with import_stats.timed(stats, 'parse_wait', filepath):
+                df = future.result()
+            inserted = _write_parsed(piece, df, engine, batch_size, use_infile, filters, stats)
             total_inserted += inserted
             if inserted > 0:
-                total_files += 1
-        
+                imported_files.add(filepath)
         except Exception as e:
+            job['failed'] = True
             logger.error(f"ファイル処理中にエラーが発生しました '{filepath}': {e}")
             print(f"  エラー: 処理に失敗しました: {e}")
+    return total_inserted, imported_files
+
+def _iter_queue(paths):
+    """キューから None が届くまでパスを取り出す"""
+    while True:
+        path = paths.get()
+        if path is None:
+            return
+        yield path
+
+def _import_by_device(filepaths, root, device_workers, run):
+    """
+    パスをデバイスごとのキューに振り分け、デバイスごとに1つの書き込みスレッド (run) で並行して取り込む。
+    各デバイスはそれぞれのウォーターマーク・チェックポイントで独立に進むため、
+    遅れているデバイスや失敗したデバイスが他のデバイスを待たせない。
+    """
+    queues = {}
+    futures = []
+    total_inserted = 0
+    imported_files = set()
+    with ThreadPoolExecutor(max_workers=device_workers, thread_name_prefix='device') as executor:
+        try:
+            for filepath in filepaths:
+                try:
+                    device = devices.device_for(filepath, root)
+                except ValueError as e:
+                    logger.error(f"ファイル '{filepath}' のデバイスを判定できません: {e}")
+                    continue
+                if device not in queues:
+                    queues[device] = queue.Queue()
+                    futures.append(executor.submit(run, _iter_queue(queues[device])))
+                queues[device].put(filepath)
+        finally:
+            for paths in queues.values():
+                paths.put(None)
+        for future in futures:
+            inserted, files = future.result()
+            total_inserted += inserted
+            imported_files |= files
+    return total_inserted, imported_files
+
+def process_files(filepaths, engine, last_timestamp, chunksize=None,
+                  batch_size=bulk_loader.DEFAULT_BATCH_SIZE, use_infile=True, workers=1,
+                  max_memory_mb=None, use_cache=False, late_data=False, stats=None,
+                  root=None, device_workers=1):
+    """
+    ファイル/ディレクトリ処理（複数/単一対応）。
+    解析は workers 個のプロセスで並列に行い、DBへの挿入はこのプロセスだけがファイル名 (時刻) 順に行う。
+    filepaths にイテレータ (ダウンロード完了順のパスなど) を渡した場合は、届いた順に処理する。
+    chunksize / max_memory_mb を指定するとストリーミングで処理する: ファイルを行境界で区切り、
+    各チャンクを解析・挿入・チェックポイント記録してから次のチャンクに進むため、
+    メモリ使用量はファイルサイズによらず一定になる。
+    use_cache を指定すると、ファイル全体を読み直す場合 (初回・書き換え時) に month_cache を使う。
+    late_data を指定すると last_timestamp (ウォーターマーク) で捨てず、読んだ行のうち
+    row_filter の月別フィルタで未登録・値が変わった行だけを挿入する
+    (後から復旧・到着した古い時刻のデータも、以前の実行で捨てられた行も取り込まれる)。
+    チェックポイントは late モード専用のものを使うため、各ファイルを先頭から読むのは
+    late モードでの初回と、取り込み済み範囲が書き換わった場合だけで、以後は追記分だけを読む。
+    stats (import_stats.new_stats()) を渡すと、段階別・ファイル別の時間と行数を記録する。
+
+    デバイス: 各ファイルのデバイスはヘッダーか root (ディレクトリを渡した場合はそのディレクトリ) 直下の
+    サブフォルダ名で決まる。last_timestamp には全デバイス共通の時刻か、get_last_timestamps() の
+    デバイス別の dict を渡す。device_workers > 1 ならデバイスごとに書き込みスレッドを分けて並行して取り込み、
+    解析プロセスは workers をデバイス数で分け合う。
+    """
+    if isinstance(filepaths, str) and os.path.isdir(filepaths):
+        root = root or filepaths
+        filepaths = devices.discover(filepaths)
+    
+    if isinstance(filepaths, str):
+        filepaths = [filepaths]
+    if isinstance(filepaths, list):
+        filepaths = sorted(filepaths, key=os.path.basename)
+    elif stats is not None:
+        # ダウンロード完了順のイテレータ: 次のファイルを待った時間をダウンロードの段階として記録する
+        filepaths = import_stats.timed_iter(stats, 'download', filepaths)
     
+    devices.ensure_schema(engine)
+    import_state.ensure_table(engine)
+    rollups.ensure_tables(engine)
+    filters = None
+    if late_data:
+        row_filter.ensure_table(engine)
+        filters = {}
+        last_timestamp = None
+
+    chunk_bytes = stream_chunk_bytes(chunksize, max_memory_mb, workers)
+    run = partial(_import_stream, engine=engine, last_timestamp=last_timestamp, chunk_bytes=chunk_bytes,
+                  batch_size=batch_size, use_infile=use_infile, use_cache=use_cache,
+                  filters=filters, late_data=late_data, stats=stats, root=root)
+    if device_workers > 1:
+        total_inserted, imported_files = _import_by_device(
+            filepaths, root, device_workers, partial(run, workers=max(1, workers // device_workers)))
+    else:
+        total_inserted, imported_files = run(filepaths, workers=workers)
+    
+    total_files = len(imported_files)
     logger.info(f"合計処理ファイル数: {total_files}、合計挿入/更新行数: {total_inserted}")
     print(f"\n合計処理ファイル数: {total_files}、合計挿入/更新行数: {total_inserted}")
     return total_inserted
 
+def _download_loop(remote, local_dir, workers, interval, stop):
+    """監視モード用: interval 秒ごとに差分ダウンロードする (取り込みはディレクトリの監視側が行う)"""
+    while True:
+        try:
+            counts = incremental_download.download_all(remote, local_dir, workers)
+            logger.debug(f"定期ダウンロード: {counts}")
+        except Exception as e:
+            logger.error(f"ダウンロード失敗: {e}")
+        if stop.wait(interval):
+            return
+
+def watch_directory(directory, engine, stop=None, poll_interval=file_watcher.DEFAULT_POLL_INTERVAL,
+                    use_inotify=True, **import_options):
+    """
+    監視モード: directory の月次ファイルの追加・追記を検知するたびに、追記されたバイトだけを取り込む
+    (どこまで取り込んだかは import_state のチェックポイントで判定する)。
+    同じ engine (コネクションプール) を使い続け、stop がセットされるか Ctrl+C で終了する。
+    import_options は process_files にそのまま渡す。戻り値は合計挿入/更新行数。
+    """
+    total = 0
+    retry = []
+    try:
+        for paths in file_watcher.iter_changes(directory, poll_interval=poll_interval,
+                                               use_inotify=use_inotify, stop=stop):
+            paths = sorted(set(paths) | set(retry), key=os.path.basename)
+            try:
+                total += process_files(paths, engine, get_last_timestamps(engine), root=directory, **import_options)
+                retry = []
+            except Exception as e:
+                # DB停止など: 次に変化を検知したとき、これらのファイルもチェックポイントから取り込み直す
+                logger.error(f"監視中の取り込みに失敗しました: {e}")
+                retry = paths
+    except KeyboardInterrupt:
+        logger.info("監視を終了します。")
+    return total
+
+def report_stats(stats, show=True, json_path=None):
+    """--stats / --stats-json: 段階別の統計を表示・追記する"""
+    if stats is None:
+        return
+    report = import_stats.finish(stats)
+    if show:
+        print("\n" + import_stats.format_report(report))
+    if json_path:
+        import_stats.append_json(report, os.path.expanduser(json_path))
+        logger.info(f"取り込み統計を '{json_path}' に追記しました。")
+
 def show_summary(engine):
-    """インポート後統計表示"""
+    """インポート後統計表示（日別の集計テーブルから求め、sensor_data の全件スキャンを避ける）"""
     try:
-        query = text("SELECT AVG(temperature) as avg_temp, AVG(humidity) as avg_humid, COUNT(*) as total_rows FROM sensor_data")
-        df_summary = pd.read_sql(query, engine)
-        if not df_summary.empty:
+        stats = rollups.summary(engine)
+        if stats is None:
+            query = text("SELECT AVG(temperature) as avg_temp, AVG(humidity) as avg_humid, COUNT(*) as total_rows FROM sensor_data")
+            df_summary = pd.read_sql(query, engine)
+            if df_summary.empty:
+                return
             stats = df_summary.iloc[0]
-            logger.info(f"全体統計: 総行数={stats['total_rows']:,}, 平均温度={stats['avg_temp']:.2f}℃, 平均湿度={stats['avg_humid']:.2f}%")
-            print(f"\n全体統計: 総行数={stats['total_rows']:,}, 平均温度={stats['avg_temp']:.2f}℃, 平均湿度={stats['avg_humid']:.2f}%")
+        logger.info(f"全体統計: 総行数={stats['total_rows']:,}, 平均温度={stats['avg_temp']:.2f}℃, 平均湿度={stats['avg_humid']:.2f}%")
+        print(f"\n全体統計: 総行数={stats['total_rows']:,}, 平均温度={stats['avg_temp']:.2f}℃, 平均湿度={stats['avg_humid']:.2f}%")
     except Exception as e:
         logger.warning(f"統計取得エラー: {e}")
 
+def _write_synthetic_months(directory, file_count, rows_per_file):
+    """ベンチマーク用: 2000年1月から file_count か月分の、1秒ごとの合成の月次ファイルを書く"""
+    os.makedirs(directory, exist_ok=True)
+    for i in range(file_count):
+        start = pd.Timestamp(2000 + i // 12, i % 12 + 1, 1)
+        times = pd.date_range(start, periods=rows_per_file, freq='s').strftime('%Y-%m-%d %H:%M:%S')
+        with open(os.path.join(directory, f"temp_humid_{start:%Y-%m}.txt"), 'w') as f:
+            f.write('\n'.join(times + ',tmp=25.3,hum=61.2') + '\n')
+    return sorted(glob.glob(os.path.join(directory, 'temp_humid_*.txt')))
+
+def run_parallel_benchmark(file_count, rows_per_file, workers_list):
+    """合成の月次ファイル file_count 個を、並列度ごとに解析のみ / SQLite への取り込みまで で計測する"""
+    import contextlib
+    import io
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filepaths = _write_synthetic_months(tmp, file_count, rows_per_file)
+        total_rows = file_count * rows_per_file
+        print(f"{file_count}ファイル x {rows_per_file:,}行 = {total_rows:,}行, CPU {os.cpu_count()}コア")
+
+        previous_level = logger.level
+        logger.setLevel(logging.WARNING)
+        try:
+            for workers in workers_list:
+                jobs = [{'filepath': path, 'offset': 0, 'end': os.path.getsize(path), 'stat': os.stat(path)}
+                        for path in filepaths]
+                t0 = time.perf_counter()
+                for _, future in _iter_parsed(_iter_pieces(jobs, None), workers):
+                    future.result()
+                parse_sec = time.perf_counter() - t0
+
+                db_path = os.path.join(tmp, f"bench_{workers}.db")
+                engine = storage.create_sqlite_engine(db_path)
+                t0 = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    process_files(filepaths, engine, None, workers=workers)
+                total_sec = time.perf_counter() - t0
+                engine.dispose()
+                print(f"workers={workers}: 解析のみ {parse_sec:.2f}秒 ({total_rows / parse_sec:,.0f}行/秒), "
+                      f"取り込みまで {total_sec:.2f}秒 ({total_rows / total_sec:,.0f}行/秒)")
+        finally:
+            logger.setLevel(previous_level)
+
+def run_pipeline_benchmark(file_count, rows_per_file, bwlimit, workers=DEFAULT_WORKERS,
+                           download_workers=incremental_download.DEFAULT_WORKERS):
+    """
+    転送速度を bwlimit (bytes/秒/ファイル) に絞ったローカルディレクトリをリモートの代わりにして、
+    「全ファイルのダウンロード完了を待ってから取り込む」場合と「届いたファイルから取り込む」場合の
+    合計時間を SQLite への取り込みで比較する。戻り値: {'download', 'import', 'sequential', 'pipelined'} (秒)
+    """
+    import contextlib
+    import io
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        remote = os.path.join(tmp, 'remote')
+        filepaths = _write_synthetic_months(remote, file_count, rows_per_file)
+        total_bytes = sum(os.path.getsize(path) for path in filepaths)
+        print(f"{file_count}ファイル x {rows_per_file:,}行 ({total_bytes / 2**20:.1f}MB), "
+              f"転送速度 {bwlimit / 2**20:.2f}MB/秒/ファイル x {download_workers}並列, 解析 {workers}プロセス")
+
+        timings = {}
+        previous_level = logger.level
+        logger.setLevel(logging.WARNING)
+        try:
+            for mode in ('sequential', 'pipelined'):
+                local_dir = os.path.join(tmp, mode)
+                engine = storage.create_sqlite_engine(os.path.join(tmp, f'{mode}.db'))
+                with contextlib.redirect_stdout(io.StringIO()):
+                    t0 = time.perf_counter()
+                    if mode == 'sequential':
+                        incremental_download.download_all(remote, local_dir, download_workers, bwlimit=bwlimit)
+                        timings['download'] = time.perf_counter() - t0
+                        process_files(local_dir, engine, None, workers=workers)
+                        timings['import'] = time.perf_counter() - t0 - timings['download']
+                    else:
+                        paths = _background_iter(_iter_downloaded(remote, local_dir, download_workers, bwlimit))
+                        process_files(paths, engine, None, workers=workers)
+                    timings[mode] = time.perf_counter() - t0
+                engine.dispose()
+        finally:
+            logger.setLevel(previous_level)
+
+    ideal = max(timings['download'], timings['import'])
+    print(f"ダウンロードのみ {timings['download']:.2f}秒, 取り込みのみ {timings['import']:.2f}秒")
+    print(f"完了を待ってから取り込み: {timings['sequential']:.2f}秒")
+    print(f"届いたファイルから取り込み: {timings['pipelined']:.2f}秒 "
+          f"({timings['sequential'] / timings['pipelined']:.2f}倍, 下限の目安 {ideal:.2f}秒)")
+    return timings
+
 def main():
     parser = argparse.ArgumentParser(description='温湿度データ統合インポーター（GDrive/ローカル対応）')
     parser.add_argument('--no-download', action='store_true', help='Google Driveダウンロードをスキップ')
     parser.add_argument('--source', type=str, help='処理対象: ファイルパス or ディレクトリパス（指定時はダウンロード無視）')
-    parser.add_argument('--chunksize', type=int, default=None, help='チャンクサイズ（大容量ファイル用、デフォルト: 全読み込み）')
+    parser.add_argument('--chunksize', type=int, default=None, help='チャンクサイズ（行数の目安。指定するとチャンクごとに挿入するストリーミング処理、デフォルト: 全読み込み）')
+    parser.add_argument('--max-memory-mb', type=int, default=None, help='ストリーミング処理の作業メモリ上限の目安（MB）')
+    parser.add_argument('--batch-size', type=int, default=bulk_loader.DEFAULT_BATCH_SIZE, help='DB挿入の1バッチ（1コミット）の行数')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help=f'解析の並列プロセス数（デフォルト: {DEFAULT_WORKERS}）')
+    parser.add_argument('--device-workers', type=int, default=1, help='デバイスごとに並行して取り込む書き込みスレッド数（デフォルト: 1）')
+    parser.add_argument('--download-workers', type=int, default=incremental_download.DEFAULT_WORKERS, help='同時ダウンロード数')
+    parser.add_argument('--sqlite', type=str, metavar='PATH', help='MySQL の代わりに組み込みの SQLite ファイルに取り込む (SENSOR_DB_BACKEND=sqlite と同じ)')
+    parser.add_argument('--no-infile', action='store_true', help='LOAD DATA LOCAL INFILE を使わず executemany で挿入')
+    parser.add_argument('--no-cache', action='store_true', help='解析済み月次データのキャッシュ (month_cache) を使わない')
+    parser.add_argument('--late-data', action='store_true', help='最新時刻より古い行も、未登録・値が変わったものは取り込む (月別フィルタで照合)')
+    parser.add_argument('--watch', action='store_true', help='ダウンロード先（または --source のディレクトリ）を監視し、追記された行を継続的に取り込む')
+    parser.add_argument('--poll-interval', type=float, default=file_watcher.DEFAULT_POLL_INTERVAL, help='監視モードで inotify が使えない場合の確認間隔（秒）')
+    parser.add_argument('--download-interval', type=float, default=60, help='監視モードでの差分ダウンロードの間隔（秒）')
+    parser.add_argument('--stats', action='store_true', help='段階別・ファイル別の処理時間と行数、ピークメモリを表示する')
+    parser.add_argument('--stats-json', type=str, metavar='PATH', help='段階別の統計を PATH に1行のJSONとして追記する (import_stats.py で比較)')
+    parser.add_argument('--rebuild-rollups', action='store_true', help='集計テーブルを sensor_data 全体から作り直す')
+    parser.add_argument('--benchmark', type=int, metavar='FILES', help='合成ファイルで並列度ごとの処理速度を計測（DB不要）')
+    parser.add_argument('--benchmark-rows', type=int, default=200000, help='ベンチマークの1ファイルあたりの行数')
+    parser.add_argument('--benchmark-bwlimit', type=float, metavar='BYTES_PER_SEC', help='--benchmark で、転送速度を絞ったローカルのリモートからのダウンロードと取り込みの重なりを計測')
     args = parser.parse_args()
+
+    if args.benchmark and args.benchmark_bwlimit:
+        run_pipeline_benchmark(args.benchmark, args.benchmark_rows, args.benchmark_bwlimit,
+                               workers=args.workers, download_workers=args.download_workers)
+        return
+    if args.benchmark:
+        workers_list = sorted({1, 2, 4, os.cpu_count() or 1, args.workers})
+        run_parallel_benchmark(args.benchmark, args.benchmark_rows, workers_list)
+        return
     
     config = get_config()
     logger.info(f"処理開始: {datetime.now()}")
     
     filepaths = None
-    if args.source:
+    if args.watch:
+        filepaths = args.source or config['local_download_dir']
+        if not args.source:
+            os.makedirs(filepaths, exist_ok=True)
+        if not os.path.isdir(filepaths):
+            logger.error(f"--watch では監視するディレクトリを指定してください: {filepaths}")
+            return
+    elif args.source:
         filepaths = args.source
         logger.info(f"ローカルソースを指定: {filepaths}")
     elif not args.no_download:
-        if download_from_gdrive(config):
-            filepaths = config['local_download_dir']
+        # 差分ダウンロード: 終わったファイルから順に取り込みへ渡す
+        filepaths = download_from_gdrive(config, workers=args.download_workers)
     else:  # --no-download が指定され、--source は指定されていない
         filepaths = config['local_download_dir']
         logger.info(f"ローカルディレクトリを処理対象とします: {filepaths}")
     
-    if not filepaths:
+    if filepaths is None:
         logger.warning("処理対象のファイルまたはディレクトリが見つかりませんでした。処理を終了します。")
         print("処理対象なし。終了。")
         return
     
-    db_config = config['db']
-    if not db_config.get('password'):
-        logger.error("データベースのパスワードが設定されていません。環境変数 'DB_PASSWORD' を設定してください。")
+    # SQLAlchemyエンジン作成 (--sqlite / SENSOR_DB_BACKEND=sqlite なら組み込みの SQLite、それ以外は MySQL)
+    backend = 'sqlite' if args.sqlite else storage.backend_from_env()
+    # 監視モードでは長時間同じプールを使うため、切断されたコネクション (wait_timeout 超過など) は使う前に検出する
+    options = {'pool_pre_ping': True}
+    if backend == 'mysql':
+        # LOAD DATA LOCAL INFILE (bulk_loader の高速パス) をドライバ側で許可する
+        options['connect_args'] = {'allow_local_infile': True}
+    try:
+        engine = storage.create_engine_for(backend, sqlite_path=args.sqlite, db_config=config['db'], **options)
+    except ValueError as e:
+        logger.error(str(e))
         return
+    logger.info(f"取り込み先: {engine.url.render_as_string(hide_password=True)}")
+
+    if args.rebuild_rollups:
+        rollups.rebuild(engine)
 
-    # SQLAlchemyエンジン作成
-    db_uri = f"mysql+mysqlconnector://{db_config['user']}:{db_config['password']}@{db_config['host']}/{db_config['database']}"
-    engine = create_engine(db_uri)
+    stats = import_stats.new_stats() if args.stats or args.stats_json else None
+    if args.watch:
+        stop = threading.Event()
+        if not args.source and not args.no_download and check_rclone_config(config['rclone_remote']):
+            remote = f"{config['rclone_remote']}:{config['gdrive_sensor_dir']}"
+            threading.Thread(target=_download_loop, daemon=True,
+                             args=(remote, filepaths, args.download_workers, args.download_interval, stop)).start()
+        print(f"\n'{filepaths}' を監視中... (Ctrl+C で終了)")
+        # 追記分は小さいため、プロセスプールは使わずこのプロセスで解析する
+        total_inserted = watch_directory(filepaths, engine, stop=stop, poll_interval=args.poll_interval,
+                                         chunksize=args.chunksize, batch_size=args.batch_size,
+                                         use_infile=not args.no_infile, max_memory_mb=args.max_memory_mb,
+                                         use_cache=not args.no_cache, late_data=args.late_data, stats=stats,
+                                         device_workers=args.device_workers)
+        stop.set()
+        logger.info(f"監視終了: 合計 {total_inserted} 行を挿入/更新しました。")
+        report_stats(stats, args.stats, args.stats_json)
+        return
 
-    last_timestamp = get_last_timestamp(engine)
-    total_inserted = process_files(filepaths, engine, last_timestamp, args.chunksize)
+    # ウォーターマークはデバイスごと: 遅れているデバイスの行が他のデバイスの最新時刻で捨てられないようにする
+    last_timestamps = get_last_timestamps(engine)
+    total_inserted = process_files(filepaths, engine, last_timestamps, args.chunksize,
+                                   batch_size=args.batch_size, use_infile=not args.no_infile,
+                                   workers=args.workers, max_memory_mb=args.max_memory_mb,
+                                   use_cache=not args.no_cache, late_data=args.late_data, stats=stats,
+                                   root=None if args.source else config['local_download_dir'],
+                                   device_workers=args.device_workers)
     
     if total_inserted > 0:
         show_summary(engine)
+    report_stats(stats, args.stats, args.stats_json)
     
     logger.info(f"処理完了: 合計 {total_inserted} 行を挿入/更新しました。")
     print("\nデータ同期と挿入処理が完了しました。")
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Uploader (fan-out): 複数のアップロード先へ、宛先ごとのキューで並行アップロードする。
+
+- 宛先ごとに永続キュー (JSON) を持ち、同じソースの未送信項目は1件にまとめる
+  (latestファイルは送信時点の内容を送れば良いため)
+- 失敗した項目は宛先ごとに指数バックオフで次回以降の起動時に再送する
+- 各宛先は独立したデーモンスレッドで送信し、1回の起動あたりの時間予算で打ち切る
+  → 遅い/落ちている宛先 (NASのハングを含む) が、他の宛先やセンサー読み取りの周期を遅らせない。
+  rclone はタイムアウトで終了させ、ローカルへのコピーも期限で中断する (書きかけの .tmp は消す)
+- cron の起動が重なっても壊れないよう、キューの読み書きはロックファイル (flock) で排他し、
+  送信は同時に1プロセスだけが行う (送信中に別の起動が来たら、その起動は送信しない)。
+  送信中に同じソースが追加された場合は、送信後もキューに残す
+- 宛先の種類: "rclone" (Google Drive 等) と "local" (LAN NAS のマウント先など)
+
+INC-001 の教訓に従い、どちらの種類も「コピーのみ・削除しない」。
+RPi (Python 3.7 / 標準ライブラリのみ) 対応。
+"""
+import contextlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Linux 以外 (開発機) ではロックしない
+    fcntl = None
+
+logger = logging.getLogger("SensorCopier.Uploader")
+
+# 1回の起動でアップロードに使ってよい時間 (秒)。cron間隔より十分短くする
+DEFAULT_TIME_BUDGET_SEC = 40
+
+# 再送バックオフ (秒)
+RETRY_BASE_SEC = 60
+RETRY_MAX_SEC = 60 * 60
+
+# ローカル宛先のコピー単位
+COPY_CHUNK_SIZE = 64 * 1024
+
+# キューの読み書きの排他用と、送信処理の実行権用のロックファイル (キューのディレクトリ内)
+QUEUE_LOCK_NAME = ".queue.lock"
+DRAIN_LOCK_NAME = ".drain.lock"
+
+# 期限を過ぎて打ち切られたスレッドの送信ロック (プロセス終了まで保持する)
+_held_drain_locks = []
+
+
+def parse_bwlimit(value):
+    """rclone の --bwlimit 形式 ("200k", "1M") を bytes/sec に変換する。None/"" は無制限"""
+    if not value:
+        return None
+    units = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+    value = str(value).strip().lower()
+    if value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def _queue_path(queue_dir, destination):
+    return os.path.join(queue_dir, f"{destination['name']}.json")
+
+
+def _item_key(item):
+    return item["source"], item["is_file"]
+
+
+@contextlib.contextmanager
+def _queue_lock(queue_dir):
+    """キューの読み書き (短時間) を、重なって起動した別プロセスと排他する"""
+    os.makedirs(queue_dir, exist_ok=True)
+    with open(os.path.join(queue_dir, QUEUE_LOCK_NAME), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        yield
+
+
+def _try_drain_lock(queue_dir):
+    """
+    送信処理の実行権を取る。別プロセスが送信中なら None。
+    戻り値のファイルを閉じるとロックが外れる
+    """
+    os.makedirs(queue_dir, exist_ok=True)
+    f = open(os.path.join(queue_dir, DRAIN_LOCK_NAME), "a")
+    if fcntl is not None:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return None
+    return f
+
+
+def load_queue(queue_dir, destination):
+    """宛先のキューを読む。壊れている場合は空として扱う"""
+    try:
+        with open(_queue_path(queue_dir, destination), "r") as f:
+            queue = json.load(f)
+        return queue if isinstance(queue, list) else []
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as e:
+        logger.warning(f"[{destination['name']}] キューの読み込みに失敗。空として扱います: {e}")
+        return []
+
+
+def save_queue(queue_dir, destination, queue):
+    """宛先のキューを .tmp 経由でアトミックに書き込む (_queue_lock の中で呼ぶ)"""
+    os.makedirs(queue_dir, exist_ok=True)
+    path = _queue_path(queue_dir, destination)
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(queue, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def enqueue(queue_dir, destinations, source, is_file=True, description=None):
+    """
+    全宛先のキューに項目を追加する。同じソースが未送信なら再送状態を保ったまま1件にまとめ、
+    追加時刻だけを更新する (送信中の項目なら、送信後もキューに残るように)
+    """
+    now = time.time()
+    with _queue_lock(queue_dir):
+        for destination in destinations:
+            queue = load_queue(queue_dir, destination)
+            existing = [item for item in queue if _item_key(item) == (source, is_file)]
+            if existing:
+                existing[0]["enqueued_at"] = now
+            else:
+                queue.append({
+                    "source": source,
+                    "is_file": is_file,
+                    "description": description or os.path.basename(source.rstrip("/")),
+                    "attempts": 0,
+                    "next_attempt_at": 0,
+                    "enqueued_at": now,
+                })
+            save_queue(queue_dir, destination, queue)
+
+
+# --- 宛先ごとの送信処理 ---
+
+def _throttled_copy(src, dst, rate, deadline=None):
+    """
+    rate (bytes/sec) を超えないように src を dst へコピーする (.tmp 経由でアトミック)。
+    deadline (monotonic) を過ぎたら TimeoutError で中断し、書きかけの .tmp を消す
+    """
+    temp_path = dst + ".tmp"
+    started = time.monotonic()
+    copied = 0
+    try:
+        with open(src, "rb") as fin, open(temp_path, "wb") as fout:
+            while True:
+                chunk = fin.read(COPY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                fout.write(chunk)
+                copied += len(chunk)
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError("時間予算を超えたためコピーを中断しました")
+                if rate:
+                    ahead = copied / rate - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+            fout.flush()
+            os.fsync(fout.fileno())
+        shutil.copystat(src, temp_path)
+        os.rename(temp_path, dst)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _needs_copy(src, dst):
+    """rclone copy と同様に、サイズか更新時刻が異なるファイルのみ送る"""
+    if not os.path.exists(dst):
+        return True
+    s, d = os.stat(src), os.stat(dst)
+    return s.st_size != d.st_size or int(s.st_mtime) != int(d.st_mtime)
+
+
+def _upload_local(destination, item, deadline=None):
+    """ローカル (NASマウント先) へのコピー。削除は一切行わない"""
+    target_dir = destination["target"]
+    os.makedirs(target_dir, exist_ok=True)
+    rate = parse_bwlimit(destination.get("bwlimit"))
+    source = item["source"]
+    if item["is_file"]:
+        pairs = [(source, os.path.join(target_dir, os.path.basename(source)))]
+    else:
+        pairs = [(os.path.join(source, name), os.path.join(target_dir, name))
+                 for name in sorted(os.listdir(source))
+                 if os.path.isfile(os.path.join(source, name))]
+    for src, dst in pairs:
+        if _needs_copy(src, dst):
+            _throttled_copy(src, dst, rate, deadline)
+
+
+def _upload_rclone(destination, item, timeout, build_cmd):
+    cmd = build_cmd(item["source"], destination["target"], is_file=item["is_file"],
+                    bwlimit=destination.get("bwlimit"))
+    subprocess.run(cmd, capture_output=True, text=True, check=True, timeout=timeout)
+
+
+def build_rclone_copy_cmd(source, dest, is_file=True, bwlimit=None):
+    """rclone コマンドを生成する (copy のみ。SensorCopier.build_rclone_cmd もこれを使う)"""
+    cmd = ["rclone", "copy", source, dest]
+    if is_file:
+        cmd.extend(["--checksum", "--no-traverse"])
+    if bwlimit:
+        cmd.extend(["--bwlimit", bwlimit])
+    return cmd
+
+
+def upload_item(destination, item, timeout, build_cmd=build_rclone_copy_cmd):
+    """1項目を1宛先へ送る。失敗時は例外を送出する"""
+    if destination.get("type", "rclone") == "local":
+        _upload_local(destination, item, deadline=time.monotonic() + timeout)
+    else:
+        _upload_rclone(destination, item, timeout, build_cmd)
+
+
+def _error_text(e):
+    if isinstance(e, subprocess.CalledProcessError) and e.stderr:
+        return e.stderr.strip()
+    return str(e)
+
+
+def drain_destination(queue_dir, destination, deadline, build_cmd=build_rclone_copy_cmd, clock=time.time):
+    """
+    1宛先のキューを、期限 (monotonic) まで順に送信する。
+    キューはロックを持たずに送信し、終わったら読み直して結果を反映する (送信中の追加を失わないため)。
+    戻り値: (送信成功数, 残り件数)
+    """
+    name = destination["name"]
+    with _queue_lock(queue_dir):
+        queue = load_queue(queue_dir, destination)
+    sent = 0
+    # {キー: (読んだ時点の追加時刻, 失敗後の項目 or 送信済みなら None)}
+    done = {}
+    for item in queue:
+        time_left = deadline - time.monotonic()
+        if item["next_attempt_at"] > clock() or time_left <= 1:
+            continue
+        enqueued_at = item.get("enqueued_at")
+        try:
+            upload_item(destination, item, timeout=time_left, build_cmd=build_cmd)
+            sent += 1
+            done[_item_key(item)] = (enqueued_at, None)
+            logger.info(f"[{name}] {item['description']} アップロード成功。")
+        except (TimeoutError, subprocess.TimeoutExpired):
+            # 時間予算による打ち切りは宛先の失敗ではないため、再送状態を変えずに次回続ける
+            logger.warning(f"[{name}] {item['description']} 時間予算内に終わらず中断しました。次回の起動で続行します。")
+            break
+        except Exception as e:
+            item["attempts"] += 1
+            backoff = min(RETRY_MAX_SEC, RETRY_BASE_SEC * 2 ** (item["attempts"] - 1))
+            item["next_attempt_at"] = clock() + backoff
+            item["last_error"] = _error_text(e)[:200]
+            done[_item_key(item)] = (enqueued_at, item)
+            logger.error(f"[{name}] {item['description']} アップロード失敗 ({item['attempts']}回目)。"
+                         f"{backoff}秒後以降に再送します: {item['last_error']}")
+
+    with _queue_lock(queue_dir):
+        remaining = []
+        for item in load_queue(queue_dir, destination):
+            result = done.get(_item_key(item))
+            if result is not None:
+                enqueued_at, failed = result
+                if failed is not None:
+                    item = dict(failed, enqueued_at=item.get("enqueued_at"))
+                elif item.get("enqueued_at") == enqueued_at:
+                    continue  # 送信済み (送信中に追加し直されていれば残す)
+            remaining.append(item)
+        save_queue(queue_dir, destination, remaining)
+    return sent, len(remaining)
+
+
+def drain_all(queue_dir, destinations, time_budget=DEFAULT_TIME_BUDGET_SEC, build_cmd=build_rclone_copy_cmd):
+    """
+    全宛先のキューを並行して送信する。宛先ごとに1スレッド。
+    時間予算を過ぎても終わらない宛先は待たずに戻る (デーモンスレッドのためプロセス終了で打ち切られ、
+    未送信項目はキューに残って次回再送される)。
+    別プロセス (前回の起動) が送信中なら何もせずに {} を返す。
+    戻り値: {宛先名: (送信成功数, 残り件数)}。打ち切った宛先は (0, None)
+    """
+    lock = _try_drain_lock(queue_dir)
+    if lock is None:
+        logger.info("前回の起動のアップロードがまだ実行中のため、今回は送信しません。")
+        return {}
+    deadline = time.monotonic() + time_budget
+    results = {}
+
+    def worker(destination):
+        try:
+            results[destination["name"]] = drain_destination(queue_dir, destination, deadline, build_cmd)
+        except Exception as e:
+            logger.error(f"[{destination['name']}] キュー処理中にエラー: {e}")
+
+    threads = []
+    for destination in destinations:
+        thread = threading.Thread(target=worker, args=(destination,),
+                                  name=f"upload-{destination['name']}", daemon=True)
+        thread.start()
+        threads.append((destination["name"], thread))
+
+    for name, thread in threads:
+        # 期限 + 猶予まで待つ (rclone 側のタイムアウトも期限に合わせてある)
+        thread.join(max(0, deadline - time.monotonic()) + 2)
+        if thread.is_alive():
+            logger.warning(f"[{name}] 時間予算内にアップロードが終わりませんでした。次回の起動で続行します。")
+        results.setdefault(name, (0, None))
+    if any(thread.is_alive() for _, thread in threads):
+        # 打ち切ったスレッドが送信を続けている間は、次の起動が同じ項目を送らないようロックを持ち続ける
+        _held_drain_locks.append(lock)
+    else:
+        lock.close()
+    return results
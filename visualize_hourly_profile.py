@@ -0,0 +1,63 @@
+import argparse
+
+import matplotlib.pyplot as plt
+
+import rollups
+import storage
+
+# 月×時刻の集計テーブル (sensor_rollup_month_hour) から時刻別プロファイルを描く。
+# 生データ (hourly_data_separate) を読まないため、期間が伸びても読み込むのは 月数×24 行だけ。
+# 散布図・密度プロットが必要な場合は visualize_final_analysis.py を使う。
+
+def plot_profile(ax, profile, metric, color, label):
+    """平均線と ±1標準偏差の帯、最小/最大の点線を1か月分描画する"""
+    hours = profile['hour_of_day']
+    mean = profile[f'{metric}_mean']
+    std = profile[f'{metric}_std']
+    ax.plot(hours, mean, color=color, linewidth=2.5, label=f'{label} Mean')
+    ax.fill_between(hours, mean - std, mean + std, color=color, alpha=0.2, label=f'{label} ±1σ')
+    ax.plot(hours, profile[f'{metric}_min'], color=color, linestyle=':', linewidth=1)
+    ax.plot(hours, profile[f'{metric}_max'], color=color, linestyle=':', linewidth=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='集計テーブルから時刻別の温湿度プロファイルを描画')
+    parser.add_argument('months', nargs='*', help='対象の月 (例: 2025-07 2025-08)。省略時は全期間')
+    parser.add_argument('--device', help='対象のデバイスID。省略時は全デバイスの合算')
+    args = parser.parse_args()
+
+    # DB接続 (SENSOR_DB_BACKEND で MySQL / SQLite を選ぶ。接続情報は環境変数から)
+    engine = storage.engine_for_reading()
+    rollups.ensure_tables(engine)
+    df = rollups.load_hourly_profile(engine, args.months or None, device=args.device)
+    if df.empty:
+        print("集計データがありません。unified_importer.py --rebuild-rollups を実行してください。")
+        return
+
+    colors = plt.cm.tab10.colors
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(14, 12), sharex=True)
+    for i, (month, profile) in enumerate(df.groupby('month')):
+        color = colors[i % len(colors)]
+        plot_profile(ax1, profile, 'temperature', color, month)
+        plot_profile(ax2, profile, 'humidity', color, month)
+
+    ax1.set_title('Temperature by Hour of Day (Mean ±1σ, Min/Max)')
+    ax1.set_ylabel('Temperature (°C)')
+    ax1.legend(loc='upper left', fontsize=9)
+    ax1.grid(True, linestyle='--', alpha=0.4)
+    ax2.set_title('Humidity by Hour of Day (Mean ±1σ, Min/Max)')
+    ax2.set_xlabel('Hour of Day (0:00 to 23:00)')
+    ax2.set_ylabel('Humidity (%)')
+    ax2.set_xticks(range(0, 24, 2))
+    ax2.legend(loc='upper left', fontsize=9)
+    ax2.grid(True, linestyle='--', alpha=0.4)
+
+    title = 'Hourly Temperature and Humidity Profile' + (f' ({args.device})' if args.device else '')
+    fig.suptitle(title, fontsize=18, weight='bold')
+    plt.tight_layout()
+    plt.subplots_adjust(top=0.94)
+    plt.show()
+
+
+if __name__ == '__main__':
+    main()